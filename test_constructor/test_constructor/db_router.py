@@ -0,0 +1,98 @@
+"""
+Чтение с реплик.
+
+Реплики перечисляются в DATABASE_REPLICA_URLS (алиасы replica_0, replica_1, ...
+в settings.REPLICA_DATABASES). По умолчанию все запросы идут в основную БД;
+на реплику уходят только чтения внутри view, помеченных @replica_read
+(обложка теста, вопросы, история попыток, аналитика), и только если:
+- запрос безопасный (GET/HEAD);
+- клиент недавно ничего не записывал: после POST/PUT/PATCH/DELETE
+  ReplicaRoutingMiddleware ставит куку REPLICA_STICKY_COOKIE, и пока она
+  жива, клиент читает с основной БД (реплика могла не догнать его запись);
+- чтение не внутри транзакции на основной БД.
+
+Сессии и пользователи всегда читаются с основной БД: отставшая реплика
+без свежей сессии разлогинила бы клиента (SessionMiddleware удаляет куку
+ненайденной сессии), а без свежего пользователя - пропустила бы смену пароля.
+
+Решение принимается на запрос и хранится в contextvar, поэтому работает
+и для async views (sync_to_async копирует контекст в поток).
+Тело StreamingHttpResponse отдаётся уже после middleware и читается
+с основной БД.
+"""
+import contextlib
+import contextvars
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_routing = contextvars.ContextVar('db_routing', default=None)
+
+
+class RequestRouting:
+    """ Куда читать в рамках одного запроса (None - основная БД) """
+    __slots__ = ('alias',)
+
+    def __init__(self):
+        self.alias = None
+
+
+def replica_read(view_func):
+    """ Пометить view: его чтения можно отдавать репликам """
+    view_func.replica_read = True
+    return view_func
+
+
+def begin_request():
+    return _routing.set(RequestRouting())
+
+
+def end_request(token):
+    _routing.reset(token)
+
+
+def use_replica():
+    """ Направить чтения текущего запроса на случайную реплику """
+    routing = _routing.get()
+    if routing is not None and settings.REPLICA_DATABASES:
+        routing.alias = random.choice(settings.REPLICA_DATABASES)
+
+
+@contextlib.contextmanager
+def use_primary():
+    """ Временно читать с основной БД (например, перед записью, зависящей от прочитанного) """
+    routing = _routing.get()
+    previous = routing.alias if routing is not None else None
+    if routing is not None:
+        routing.alias = None
+    try:
+        yield
+    finally:
+        if routing is not None:
+            routing.alias = previous
+
+
+def primary_only_models():
+    return {'sessions.session', settings.AUTH_USER_MODEL.lower()}
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if routing is None or routing.alias is None:
+            return DEFAULT_DB_ALIAS
+        if model._meta.label_lower in primary_only_models():
+            return DEFAULT_DB_ALIAS
+        # Внутри транзакции читаем там же, где пишем
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return routing.alias
+
+    def db_for_write(self, model, **hints):
+        # Явно: иначе Django сохранил бы объект, прочитанный с реплики, обратно в реплику
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии основной БД
+        return True
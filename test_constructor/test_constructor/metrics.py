@@ -0,0 +1,333 @@
+"""
+Метрики в текстовом формате Prometheus (эндпоинт /metrics).
+
+Небольшой собственный реестр вместо prometheus_client: счётчики и
+гистограммы с метками, значения живут в памяти процесса.
+
+Несколько воркеров (gunicorn): если задан METRICS_MULTIPROC_DIR, каждый
+процесс не чаще раза в METRICS_FLUSH_INTERVAL секунд (и при выходе)
+сохраняет свои значения в файл <dir>/metrics_<pid>_<токен>.json, а /metrics
+складывает файлы всех процессов. Токен случайный на каждый запуск процесса,
+поэтому воркер с переиспользованным PID не перезапишет чужие значения.
+
+Пока процесс жив, он держит flock на своём metrics_<pid>_<токен>.lock.
+При старте (первая запись) процесс переносит значения умерших воркеров
+(их lock-файл удаётся захватить) в metrics_archive.json и удаляет их
+файлы: накопительные значения не теряются и не уменьшаются, а число
+файлов не растёт с каждым перезапуском воркера. Перенос и чтение файлов
+в /metrics разделены блокировкой каталога (metrics.lock), поэтому
+переносимые значения не считаются дважды. Без fcntl (Windows) перенос
+не выполняется.
+"""
+import atexit
+import contextlib
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from django.conf import settings
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+GRADING_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005)
+
+_lock = threading.Lock()
+_metrics = {}  # имя -> метрика, в порядке объявления
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}  # значения меток (кортеж) -> число
+        _metrics[name] = self
+
+    def inc(self, amount=1, **labels):
+        key = _label_values(self, labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        _maybe_flush()
+
+    def merge(self, values, rows):
+        for key, value in rows:
+            key = tuple(key)
+            values[key] = values.get(key, 0) + value
+
+    def samples(self, values):
+        for key, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=HTTP_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}  # значения меток -> [счётчики по корзинам..., +Inf, сумма]
+        _metrics[name] = self
+
+    def observe(self, value, **labels):
+        key = _label_values(self, labels)
+        with _lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            else:
+                state[len(self.buckets)] += 1
+            state[-1] += value
+        _maybe_flush()
+
+    def merge(self, values, rows):
+        for key, state in rows:
+            key = tuple(key)
+            current = values.get(key)
+            if current is None:
+                values[key] = list(state)
+            else:
+                values[key] = [a + b for a, b in zip(current, state)]
+
+    def samples(self, values):
+        for key, state in sorted(values.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state):
+                cumulative += count
+                yield self.name + '_bucket', {**labels, 'le': _format_value(bound)}, cumulative
+            yield self.name + '_sum', labels, state[-1]
+            yield self.name + '_count', labels, cumulative
+
+
+def _label_values(metric, labels):
+    return tuple(str(labels.get(name, '')) for name in metric.labelnames)
+
+
+def _dump(values):
+    """ Значения метрики ({метки: число или состояние гистограммы}) в JSON-совместимые строки """
+    return [[list(key), value] for key, value in values.items()]
+
+
+# --- Метрики проекта ---
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Время обработки запроса по view', ['view', 'method'])
+HTTP_REQUESTS = Counter(
+    'http_requests_total', 'Запросы по view и коду ответа', ['view', 'method', 'status'])
+ATTEMPTS_STARTED = Counter('tests_attempts_started_total', 'Начатые попытки прохождения теста')
+ATTEMPTS_FINISHED = Counter('tests_attempts_finished_total', 'Завершённые попытки', ['passed'])
+ATTEMPTS_EXPIRED = Counter('tests_attempts_expired_total', 'Попытки, закрытые sweep_attempts по времени')
+ANSWERS_SUBMITTED = Counter('tests_answers_submitted_total', 'Принятые ответы на вопросы')
+GRADING_SECONDS = Histogram(
+    'tests_grading_seconds', 'Время проверки одного ответа', ['question_type'], buckets=GRADING_BUCKETS)
+LOGINS = Counter('users_logins_total', 'Попытки входа', ['result'])
+THROTTLED_REQUESTS = Counter('throttled_requests_total', 'Запросы, отклонённые с 429', ['scope'])
+
+
+# --- Несколько процессов ---
+
+ARCHIVE_FILE = 'metrics_archive.json'
+DIR_LOCK_FILE = 'metrics.lock'
+
+_last_flush = 0.0
+_process = None  # (pid, имя файлов процесса без расширения, открытый lock-файл)
+
+
+def multiproc_dir():
+    return getattr(settings, 'METRICS_MULTIPROC_DIR', None)
+
+
+def _maybe_flush():
+    if multiproc_dir() and time.monotonic() - _last_flush >= settings.METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+def _process_files(directory):
+    """ Имя файлов этого процесса; при первом вызове - захват lock-файла и перенос файлов умерших воркеров """
+    global _process
+    if _process is not None and _process[0] == os.getpid():
+        return _process[1]
+    pid = os.getpid()
+    base = os.path.join(directory, f'metrics_{pid}_{uuid.uuid4().hex[:12]}')
+    if fcntl is None:
+        _process = (pid, base, None)
+        return base
+    # Под блокировкой каталога: параллельный compact() не увидит lock-файл до того,
+    # как мы его захватили, и не примет живой процесс за умерший
+    with _dir_lock(directory, exclusive=True):
+        lock_file = open(base + '.lock', 'w')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        _process = (pid, base, lock_file)
+        _compact(directory, base)
+    return base
+
+
+def _after_fork():
+    # Значения и lock-файл родителя - не наши: ребёнок начинает с нуля и со своим файлом
+    global _process, _last_flush
+    if _process is not None and _process[2] is not None:
+        _process[2].close()
+    _process = None
+    _last_flush = 0.0
+    for metric in _metrics.values():
+        metric.values = {}
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+@contextlib.contextmanager
+def _dir_lock(directory, exclusive):
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(directory, DIR_LOCK_FILE), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+
+def _is_dead(lock_path):
+    """ Процесс, владеющий lock-файлом, завершился (блокировку удалось захватить) """
+    try:
+        with open(lock_path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    except OSError:
+        return False  # файл удалили параллельно
+    return True
+
+
+def _write_json(path, data):
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_files(paths):
+    """ {имя: значения} - сумма по файлам """
+    merged = {name: {} for name in _metrics}
+    for path in paths:
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue  # файл удалили между glob и open
+        for name, rows in data.items():
+            if name in _metrics:
+                _metrics[name].merge(merged[name], rows)
+    return merged
+
+
+def compact(directory):
+    """
+    Перенести значения умерших процессов в архив и удалить их файлы.
+    Файл без lock-файла тоже считается файлом умершего процесса
+    (lock создаётся раньше первой записи значений).
+    """
+    with _dir_lock(directory, exclusive=True):
+        return _compact(directory, _process[1] if _process is not None else None)
+
+
+def _compact(directory, own):
+    """ compact() под уже взятой блокировкой каталога; own - файлы этого процесса """
+    dead = []
+    for path in glob.glob(os.path.join(directory, 'metrics_*.json')):
+        base = path[:-len('.json')]
+        if base == own or os.path.basename(path) == ARCHIVE_FILE:
+            continue
+        if not os.path.exists(base + '.lock') or _is_dead(base + '.lock'):
+            dead.append(base)
+    for lock_path in glob.glob(os.path.join(directory, 'metrics_*.lock')):
+        base = lock_path[:-len('.lock')]
+        if base != own and base not in dead and not os.path.exists(base + '.json') and _is_dead(lock_path):
+            dead.append(base)  # процесс умер, не успев ничего записать
+    if not dead:
+        return 0
+
+    archive_path = os.path.join(directory, ARCHIVE_FILE)
+    merged = _read_files([archive_path] + [base + '.json' for base in dead])
+    _write_json(archive_path, {name: _dump(values) for name, values in merged.items()})
+    for base in dead:
+        for path in [base + '.json', base + '.lock'] + glob.glob(base + '.json.*.tmp'):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+    return len(dead)
+
+
+def flush():
+    """ Сохранить значения этого процесса в его файл (запись через временный файл и rename) """
+    global _last_flush
+    directory = multiproc_dir()
+    if not directory:
+        return
+    base = _process_files(directory)
+    with _lock:
+        _last_flush = time.monotonic()
+        data = {name: _dump(metric.values) for name, metric in _metrics.items()}
+    _write_json(base + '.json', data)
+
+
+atexit.register(flush)
+
+
+def collect():
+    """ {имя: значения} - этого процесса или, в режиме нескольких процессов, сумма по всем файлам """
+    directory = multiproc_dir()
+    if not directory:
+        with _lock:
+            return {name: dict(metric.values) for name, metric in _metrics.items()}
+
+    flush()
+    # Под разделяемой блокировкой каталога: перенос в архив не идёт, значения не задваиваются
+    with _dir_lock(directory, exclusive=False):
+        return _read_files(glob.glob(os.path.join(directory, 'metrics_*.json')))
+
+
+def render():
+    """ Текстовый формат Prometheus 0.0.4 """
+    values = collect()
+    lines = []
+    for name, metric in _metrics.items():
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        for sample_name, labels, value in metric.samples(values.get(name, {})):
+            lines.append(f'{sample_name}{_format_labels(labels)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
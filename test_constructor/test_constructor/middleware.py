@@ -0,0 +1,301 @@
+"""
+Middleware наблюдаемости (статистика SQL по эндпоинтам, метрики Prometheus)
+и выбора БД для чтения (реплики, см. db_router).
+
+Статистика SQL (без debug toolbar, можно включать в проде).
+
+Для выбранной доли запросов (QUERY_STATS_SAMPLE_RATE) считается число
+SQL-запросов, время в БД и повторяющиеся запросы (признак N+1). Результат
+отдаётся заголовком Server-Timing и копится в памяти процесса по имени view
+(см. эндпоинт /api/stats/queries/). При QUERY_STATS_SAMPLE_RATE = 0
+middleware отключается целиком.
+
+Учёт идёт через обёртку execute_wrapper, которая ставится на каждое
+соединение один раз и пишет в объект текущего запроса из contextvar, -
+поэтому она работает и для async views, где запросы к БД выполняются
+в отдельном потоке через sync_to_async.
+"""
+import contextvars
+import random
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import db_router, metrics
+
+# Границы столбцов гистограммы времени ответа, мс
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+# Управление транзакциями повторяется законно и на N+1 не указывает
+TRANSACTION_STATEMENTS = ('BEGIN', 'SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK')
+
+_current = contextvars.ContextVar('query_stats', default=None)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_seconds', 'statements')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements = Counter()
+
+    def duplicates(self):
+        """ Сколько запросов повторили уже выполненный (одинаковый SQL с точностью до параметров) """
+        return sum(n - 1 for n in self.statements.values() if n > 1)
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_seconds += time.perf_counter() - started
+        stats.queries += 1
+        if not sql.startswith(TRANSACTION_STATEMENTS):
+            stats.statements[sql] += 1
+
+
+def install_wrapper(sender, connection, **kwargs):
+    """ Сигнал connection_created приходит при каждом переподключении - обёртку ставим один раз """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class ViewStats:
+    __slots__ = ('count', 'latency_buckets', 'latency_sum', 'queries_sum', 'queries_max',
+                 'db_seconds_sum', 'duplicates_sum', 'requests_with_duplicates', 'worst_statement')
+
+    def __init__(self):
+        self.count = 0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.latency_sum = 0.0
+        self.queries_sum = 0
+        self.queries_max = 0
+        self.db_seconds_sum = 0.0
+        self.duplicates_sum = 0
+        self.requests_with_duplicates = 0
+        self.worst_statement = None  # (повторов, SQL) - самый «размноженный» запрос
+
+    def add(self, elapsed, stats):
+        self.count += 1
+        elapsed_ms = elapsed * 1000
+        self.latency_buckets[_bucket_index(elapsed_ms)] += 1
+        self.latency_sum += elapsed_ms
+        self.queries_sum += stats.queries
+        self.queries_max = max(self.queries_max, stats.queries)
+        self.db_seconds_sum += stats.db_seconds
+
+        duplicates = stats.duplicates()
+        if duplicates:
+            self.duplicates_sum += duplicates
+            self.requests_with_duplicates += 1
+            sql, repeats = stats.statements.most_common(1)[0]
+            if self.worst_statement is None or repeats > self.worst_statement[0]:
+                self.worst_statement = (repeats, sql[:500])
+
+    def as_dict(self):
+        count = self.count or 1
+        buckets = [f'<={bound}' for bound in LATENCY_BUCKETS_MS] + [f'>{LATENCY_BUCKETS_MS[-1]}']
+        return {
+            'count': self.count,
+            'latency_avg_ms': round(self.latency_sum / count, 2),
+            'latency_histogram_ms': dict(zip(buckets, self.latency_buckets)),
+            'queries_avg': round(self.queries_sum / count, 2),
+            'queries_max': self.queries_max,
+            'db_time_avg_ms': round(self.db_seconds_sum * 1000 / count, 2),
+            'duplicate_queries_avg': round(self.duplicates_sum / count, 2),
+            'requests_with_duplicates': self.requests_with_duplicates,
+            'worst_duplicate': (
+                {'repeats': self.worst_statement[0], 'sql': self.worst_statement[1]}
+                if self.worst_statement else None
+            ),
+        }
+
+
+def _bucket_index(elapsed_ms):
+    for i, bound in enumerate(LATENCY_BUCKETS_MS):
+        if elapsed_ms <= bound:
+            return i
+    return len(LATENCY_BUCKETS_MS)
+
+
+_views = {}
+_views_lock = threading.Lock()
+
+
+def record_request(view_name, elapsed, stats):
+    with _views_lock:
+        view_stats = _views.get(view_name)
+        if view_stats is None:
+            view_stats = _views[view_name] = ViewStats()
+        view_stats.add(elapsed, stats)
+
+
+def snapshot():
+    """ Накопленная статистика процесса по view, самые «тяжёлые» по БД - первыми """
+    with _views_lock:
+        data = {name: stats.as_dict() for name, stats in _views.items()}
+    return dict(sorted(data.items(), key=lambda item: -item[1]['db_time_avg_ms'] * item[1]['count']))
+
+
+def reset():
+    with _views_lock:
+        _views.clear()
+
+
+class QueryStatsMiddleware:
+    """ Считает SQL-запросы и время в БД для доли запросов QUERY_STATS_SAMPLE_RATE """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.sample_rate = getattr(settings, 'QUERY_STATS_SAMPLE_RATE', 0)
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        connection_created.connect(install_wrapper, dispatch_uid='query_stats')
+        for connection in connections.all(initialized_only=True):
+            install_wrapper(None, connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        if random.random() >= self.sample_rate:
+            return await self.get_response(request)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, time.perf_counter() - started)
+
+    def finish(self, request, response, stats, elapsed):
+        duplicates = stats.duplicates()
+        response['Server-Timing'] = (
+            f'app;dur={elapsed * 1000:.1f}, '
+            f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries", '
+            f'dup;desc="{duplicates} duplicate queries"'
+        )
+        record_request(view_label(request), elapsed, stats)
+        return response
+
+
+def view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else '<unresolved>'
+
+
+class MetricsMiddleware:
+    """ Гистограмма времени ответа и счётчик запросов по view для /metrics """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.observe(request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, response, time.perf_counter() - started)
+        return response
+
+    def observe(self, request, response, elapsed):
+        view = view_label(request)
+        metrics.HTTP_REQUEST_SECONDS.observe(elapsed, view=view, method=request.method)
+        metrics.HTTP_REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Чтения view с @replica_read - на реплику; после записи клиент какое-то время
+    читает с основной БД (кука REPLICA_STICKY_COOKIE). Без реплик отключается.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REPLICA_DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = db_router.begin_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            db_router.end_request(token)
+        return self.stick_to_primary(request, response)
+
+    async def __acall__(self, request):
+        token = db_router.begin_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            db_router.end_request(token)
+        return self.stick_to_primary(request, response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (getattr(view_func, 'replica_read', False) and request.method in SAFE_METHODS
+                and not self.is_sticky(request)):
+            db_router.use_replica()
+
+    def is_sticky(self, request):
+        try:
+            return float(request.COOKIES.get(settings.REPLICA_STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def stick_to_primary(self, request, response):
+        if request.method not in SAFE_METHODS:
+            seconds = settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(settings.REPLICA_STICKY_COOKIE, str(int(time.time() + seconds)),
+                                max_age=seconds, httponly=True, samesite='Lax')
+        return response
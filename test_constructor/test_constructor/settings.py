@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 import os
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -30,6 +31,9 @@ SECRET_KEY = os.getenv('SECRET_KEY')
 DEBUG = True
 
 DATABASE_URL = os.environ.get("DATABASE_URL")
+# Реплики только для чтения, через запятую. Локально реплику изображает второй файл SQLite:
+# DATABASE_REPLICA_URLS=sqlite:///replica.sqlite3 (копия db.sqlite3)
+DATABASE_REPLICA_URLS = [url.strip() for url in os.environ.get("DATABASE_REPLICA_URLS", '').split(',') if url.strip()]
 
 ALLOWED_HOSTS = [
     'localhost',
@@ -51,18 +55,32 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'test_constructor.middleware.MetricsMiddleware',
+    'test_constructor.middleware.QueryStatsMiddleware',
+    'test_constructor.middleware.ReplicaRoutingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.middleware.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'test_constructor.urls'
 
+# Доля запросов, для которых считаются SQL-запросы и время в БД (0 - выключено, 1 - все)
+QUERY_STATS_SAMPLE_RATE = float(os.environ.get("QUERY_STATS_SAMPLE_RATE", '0'))
+
+# Метрики Prometheus (/metrics). При нескольких воркерах - общий каталог для их файлов
+METRICS_MULTIPROC_DIR = os.environ.get("METRICS_MULTIPROC_DIR")
+METRICS_FLUSH_INTERVAL = 5
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", '')
+
+# Асинхронные версии эндпоинтов студента (start/questions/submit_answer/finish) - для запуска под ASGI
+TESTS_ASYNC_VIEWS = os.environ.get("TESTS_ASYNC_VIEWS") == '1'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -98,6 +116,95 @@ else:
         }
     }
 
+REPLICA_DATABASES = []
+for index, url in enumerate(DATABASE_REPLICA_URLS):
+    alias = f'replica_{index}'
+    # В тестах реплика - та же БД, что default
+    DATABASES[alias] = {**dj_database_url.parse(url), 'TEST': {'MIRROR': 'default'}}
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['test_constructor.db_router.ReplicaRouter']
+# Сколько секунд после записи (POST/PUT/PATCH/DELETE) клиент читает с основной БД - реплика могла не догнать
+REPLICA_STICKY_SECONDS = 10
+REPLICA_STICKY_COOKIE = 'primary_until'
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+REDIS_URL = os.environ.get("REDIS_URL")
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
+def is_shared_cache(alias):
+    """ LocMemCache у каждого воркера свой: выход или смена пароля в одном не видны остальным """
+    return alias in CACHES and not CACHES[alias]['BACKEND'].endswith('LocMemCache')
+
+
+# Сессии: cached_db (кэш + БД), cache (только кэш) или db. Первые два - только с общим кэшем (Redis),
+# поэтому без REDIS_URL по умолчанию db
+SESSION_CACHE_ALIAS = os.environ.get("SESSION_CACHE_ALIAS", 'default')
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", 'cached_db' if is_shared_cache(SESSION_CACHE_ALIAS) else 'db')
+if SESSION_BACKEND in ('cache', 'cached_db') and not is_shared_cache(SESSION_CACHE_ALIAS):
+    raise ImproperlyConfigured(f'SESSION_BACKEND={SESSION_BACKEND} требует общего кэша (REDIS_URL)')
+SESSION_ENGINE = f'django.contrib.sessions.backends.{SESSION_BACKEND}'
+
+# Кэш авторизованного пользователя (users/auth_cache.py). Пустая строка - не кэшировать;
+# по умолчанию включён только с общим кэшем
+USERS_AUTH_CACHE = os.environ.get("USERS_AUTH_CACHE", 'default' if is_shared_cache('default') else '')
+if USERS_AUTH_CACHE and not is_shared_cache(USERS_AUTH_CACHE):
+    raise ImproperlyConfigured('USERS_AUTH_CACHE требует общего кэша (REDIS_URL)')
+USERS_AUTH_CACHE_TIMEOUT = 60 * 5
+
+# Кэш готовых списков вопросов для студентов (алиас из CACHES)
+TESTS_PAYLOAD_CACHE = os.environ.get("TESTS_PAYLOAD_CACHE", 'default')
+TESTS_PAYLOAD_TIMEOUT = 60 * 60
+TESTS_PAYLOAD_LOCAL_SIZE = 256
+
+# Сколько секунд после крайнего срока попытки ещё принимаются ответы (задержки сети)
+TESTS_DEADLINE_GRACE = 10
+
+# Регрейд в pending/running без обновлений дольше этого считается брошенным (процесс умер),
+# и POST /regrade/ продолжает его
+REGRADE_STALE_SECONDS = int(os.environ.get("REGRADE_STALE_SECONDS", 600))
+
+# Максимум вопросов в одном импортируемом документе теста
+TESTS_IMPORT_MAX_QUESTIONS = 20000
+
+# Ограничение частоты запросов (test_constructor/throttling.py).
+# Лимиты по IP щедрые: целая группа студентов может выходить в сеть с одного адреса
+THROTTLE_ENABLED = os.environ.get("THROTTLE_ENABLED", '1') == '1'
+THROTTLE_BACKEND = os.environ.get("THROTTLE_BACKEND", 'local')  # 'local' или 'cache'
+THROTTLE_CACHE = os.environ.get("THROTTLE_CACHE", 'default')
+THROTTLE_TRUST_X_FORWARDED_FOR = os.environ.get("THROTTLE_TRUST_X_FORWARDED_FOR") == '1'
+THROTTLE_POLICIES = {
+    'login': [
+        {'key': 'ip', 'rate': '300/m', 'burst': 100},
+        {'key': 'email', 'rate': '10/m', 'burst': 5},
+    ],
+    'register': [
+        {'key': 'ip', 'rate': '100/m', 'burst': 50},
+    ],
+    'submit_answer': [
+        {'key': 'user', 'rate': '120/m', 'burst': 60},
+    ],
+    'submit_answers': [
+        {'key': 'user', 'rate': '30/m', 'burst': 10},
+    ],
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -143,4 +250,5 @@ AUTH_USER_MODEL = 'users.CustomUser'
 
 # ВРЕМЕННО ДЛЯ ДЕМОНСТРАЦИИ
 CORS_ALLOW_ALL_ORIGINS = True
-CORS_ALLOW_CREDENTIALS = True
\ No newline at end of file
+CORS_ALLOW_CREDENTIALS = True
+CORS_EXPOSE_HEADERS = ['X-Next-Cursor', 'Server-Timing']
\ No newline at end of file
@@ -0,0 +1,165 @@
+"""
+Ограничение частоты запросов (token bucket).
+
+Политики задаются в settings.THROTTLE_POLICIES: для каждого эндпоинта
+(scope) - список правил {'key': 'ip' | 'email' | 'user', 'rate': '10/m',
+'burst': N}. Ведро ёмкостью burst пополняется со скоростью rate; запрос
+забирает по жетону из ведра каждого правила. Если жетона нет, view не
+вызывается вовсе (ни хэширования пароля, ни запросов к БД) - сразу 429
+с заголовком Retry-After.
+
+Хранилище (THROTTLE_BACKEND):
+- 'local' - память процесса: быстро, но у каждого воркера свои вёдра;
+- 'cache' - общий кэш (THROTTLE_CACHE, например Redis): вёдра общие для
+  всех воркеров; чтение-запись не атомарны, поэтому при гонке лимит
+  может быть превышен на несколько запросов.
+"""
+import functools
+import hashlib
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+
+from . import metrics
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+# Сколько вёдер держит локальное хранилище (самые давние вытесняются)
+LOCAL_MAX_BUCKETS = 100000
+
+
+def parse_rate(rate):
+    """ '20/m' -> жетонов в секунду """
+    count, period = rate.split('/')
+    return int(count) / PERIODS[period[0]]
+
+
+class LocalBuckets:
+    def __init__(self):
+        self.buckets = OrderedDict()  # ключ -> (жетонов, время последнего пополнения)
+        self.lock = threading.Lock()
+
+    def take(self, key, capacity, rate, now):
+        """ Забрать жетон. Возвращает 0, если можно, иначе через сколько секунд появится жетон """
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (capacity, now))
+            tokens, wait = _take(tokens, updated, capacity, rate, now)
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > LOCAL_MAX_BUCKETS:
+                self.buckets.popitem(last=False)
+        return wait
+
+
+class CacheBuckets:
+    def __init__(self, alias):
+        self.alias = alias
+
+    def take(self, key, capacity, rate, now):
+        cache = caches[self.alias]
+        tokens, updated = cache.get(key) or (capacity, now)
+        tokens, wait = _take(tokens, updated, capacity, rate, now)
+        # Полное ведро хранить незачем - ключ истекает, когда ведро успело бы наполниться
+        cache.set(key, (tokens, now), math.ceil((capacity - tokens) / rate) + 1)
+        return wait
+
+
+def _take(tokens, updated, capacity, rate, now):
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) / rate
+
+
+_local = LocalBuckets()
+
+
+def get_backend():
+    if settings.THROTTLE_BACKEND == 'cache':
+        return CacheBuckets(settings.THROTTLE_CACHE)
+    return _local
+
+
+# --- Ключи ---
+
+def client_ip(request):
+    if settings.THROTTLE_TRUST_X_FORWARDED_FOR:
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def request_email(request):
+    try:
+        email = json.loads(request.body).get('email')
+    except (ValueError, AttributeError):
+        return None
+    if not isinstance(email, str) or not email:
+        return None
+    return hashlib.sha1(email.strip().lower().encode()).hexdigest()
+
+
+def request_user(request):
+    user = request.user
+    return str(user.pk) if user.is_authenticated else None
+
+
+KEY_FUNCTIONS = {
+    'ip': client_ip,
+    'email': request_email,
+    'user': request_user,
+}
+
+
+def check(request, scope):
+    """ Пройти правила scope. Возвращает None или число секунд до следующей попытки """
+    if not settings.THROTTLE_ENABLED:
+        return None
+    backend = get_backend()
+    now = time.time()
+    wait = 0
+    for rule in settings.THROTTLE_POLICIES.get(scope, []):
+        value = KEY_FUNCTIONS[rule['key']](request)
+        if value is None:
+            continue  # правило не применимо (нет email в запросе, аноним)
+        rate = parse_rate(rule['rate'])
+        capacity = rule.get('burst') or int(rule['rate'].split('/')[0])
+        wait = max(wait, backend.take(f"throttle:{scope}:{rule['key']}:{value}", capacity, rate, now))
+    return wait or None
+
+
+def throttled_response(scope, wait):
+    metrics.THROTTLED_REQUESTS.inc(scope=scope)
+    response = JsonResponse({'error': 'Слишком много запросов, попробуйте позже'}, status=429)
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+def throttle(scope):
+    """ Декоратор view (sync или async): ограничение по политике settings.THROTTLE_POLICIES[scope] """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @functools.wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                # Правило 'user' трогает ленивый request.user (сессия, кэш) - это синхронный код
+                wait = await sync_to_async(check)(request, scope)
+                if wait:
+                    return throttled_response(scope, wait)
+                return await view_func(request, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            wait = check(request, scope)
+            if wait:
+                return throttled_response(scope, wait)
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -17,8 +17,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from .views import metrics_view, query_stats_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/stats/queries/', query_stats_view),  # Статистика SQL по эндпоинтам (staff)
+    path('metrics', metrics_view),  # Prometheus
     path('api/', include('users.urls')),
     path('api/tests/', include('tests.urls'))
 ]
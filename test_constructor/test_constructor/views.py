@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from . import metrics, middleware
+
+
+@csrf_exempt
+def query_stats_view(request):
+    """ Статистика SQL по view из памяти этого процесса (только для staff) """
+    if not request.user.is_authenticated: return JsonResponse({'error': 'Auth required'}, status=401)
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Нет прав'}, status=403)
+
+    if request.method == 'GET':
+        return JsonResponse({
+            'sample_rate': getattr(settings, 'QUERY_STATS_SAMPLE_RATE', 0),
+            'views': middleware.snapshot(),
+        })
+    elif request.method == 'DELETE':
+        middleware.reset()
+        return JsonResponse({'message': 'Статистика сброшена'})
+    return JsonResponse({'error': 'Только GET или DELETE'}, status=405)
+
+
+def metrics_view(request):
+    """ Метрики в формате Prometheus (при METRICS_TOKEN нужен заголовок Authorization: Bearer <token>) """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponse(status=401)
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
@@ -1,15 +1,139 @@
 import json
 from django.contrib import admin
-from django.utils.safestring import mark_safe
+from django.contrib.admin.views.main import PAGE_VAR
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from django.utils.html import format_html
 from django.urls import reverse
-from .models import Test, Question, TestAttempt, UserAnswer
+from .models import Test, Question, QuestionPool, TestAttempt, UserAnswer
+
+# Сколько строк инлайна рендерить на странице объекта; больше - только ссылка на список
+INLINE_MAX_ROWS = 50
+# Длина JSON-превью в списках и инлайнах
+JSON_PREVIEW_CHARS = 200
+# Ниже этого числа строк оценке статистики не доверяем и считаем честным COUNT(*)
+ESTIMATED_COUNT_MIN = 10000
+
+
+def json_preview(value, limit=JSON_PREVIEW_CHARS):
+    """ Компактный JSON, обрезанный до limit символов (без отступов - на больших ключах это килобайты) """
+    if not value:
+        return "-"
+    json_str = json.dumps(value, ensure_ascii=False)
+    if len(json_str) > limit:
+        json_str = json_str[:limit] + '…'
+    return format_html('<code>{}</code>', json_str)
+
+
+def changelist_link(model_name, query, text):
+    url = reverse(f'admin:tests_{model_name}_changelist')
+    return format_html('<a href="{}?{}">{}</a>', url, query, text)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор для больших таблиц: для списка без фильтров на PostgreSQL берёт оценку
+    числа строк из статистики (pg_class.reltuples) вместо COUNT(*) по всей таблице.
+    С фильтрами и на других БД считает как обычно.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        query = getattr(queryset, 'query', None)
+        if query is not None and not query.where and connections[queryset.db].vendor == 'postgresql':
+            with connections[queryset.db].cursor() as cursor:
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                               [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] >= ESTIMATED_COUNT_MIN:
+                return row[0]
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """ Настройки списков для больших таблиц: оценка количества и без второго COUNT(*) по всей таблице """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+# --- ФИЛЬТРЫ ---
+class InputFilter(admin.SimpleListFilter):
+    """
+    Фильтр с полем ввода вместо списка всех значений: обычный list_filter по FK
+    выводит в сайдбар каждого пользователя/тест, что на больших таблицах - тысячи строк.
+    """
+    template = 'admin/input_filter.html'
+    lookup = None  # поле для filter()
+    cast = str
+    placeholder = ''
+
+    def lookups(self, request, model_admin):
+        # Фильтр выводится, только если lookups не пустой
+        return ((),)
+
+    def choices(self, changelist):
+        # Остальные параметры списка (фильтры, поиск, сортировка) уходят скрытыми полями формы
+        yield {
+            'query_parts': [
+                (name, value) for name, value in changelist.params.items()
+                if name not in (self.parameter_name, PAGE_VAR)
+            ],
+        }
+
+    def queryset(self, request, queryset):
+        value = (self.value() or '').strip()
+        if not value:
+            return queryset
+        try:
+            value = self.cast(value)
+        except ValueError:
+            return queryset.none()
+        return queryset.filter(**{self.lookup: value})
+
+
+class TestIdFilter(InputFilter):
+    title = 'ID теста'
+    parameter_name = 'test_id'
+    lookup = 'test_id'
+    cast = int
+
+
+class UserEmailFilter(InputFilter):
+    title = 'email пользователя'
+    parameter_name = 'user_email'
+    lookup = 'user__email'
+    placeholder = 'student@example.com'
+
+
+class AuthorEmailFilter(InputFilter):
+    title = 'email автора'
+    parameter_name = 'author_email'
+    lookup = 'author__email'
+
+
+class AttemptIdFilter(InputFilter):
+    title = 'ID попытки'
+    parameter_name = 'attempt_id'
+    lookup = 'attempt_id'
+    cast = int
+
+
+class QuestionIdFilter(InputFilter):
+    title = 'ID вопроса'
+    parameter_name = 'question_id'
+    lookup = 'question_id'
+    cast = int
 
 
 class QuestionInline(admin.TabularInline):
     model = Question
     extra = 0
-    fields = ('display_id', 'order_num', 'text', 'question_type', 'points', 'json_preview', 'edit_link')
+    fields = ('display_id', 'order_num', 'text', 'question_type', 'points', 'pool', 'json_preview', 'edit_link')
     readonly_fields = ('display_id', 'json_preview', 'edit_link')
+    raw_id_fields = ('pool',)
 
     # Функция, которая просто показывает ID
     def display_id(self, obj):
@@ -18,10 +142,7 @@ class QuestionInline(admin.TabularInline):
     display_id.short_description = "ID"
 
     def json_preview(self, obj):
-        if not obj.answer_data:
-            return "-"
-        json_str = json.dumps(obj.answer_data, indent=2, ensure_ascii=False)
-        return mark_safe(f'<pre style="max-height: 200px; overflow: auto;">{json_str}</pre>')
+        return json_preview(obj.answer_data)
 
     json_preview.short_description = "Структура JSON"
 
@@ -29,7 +150,7 @@ class QuestionInline(admin.TabularInline):
         if not obj.pk:
             return "-"
         url = reverse('admin:tests_question_change', args=[obj.pk])
-        return mark_safe(f'<a href="{url}" class="button" style="padding:5px 10px;">Редактировать</a>')
+        return format_html('<a href="{}" class="button" style="padding:5px 10px;">Редактировать</a>', url)
 
     edit_link.short_description = "Действие"
 
@@ -37,26 +158,58 @@ class QuestionInline(admin.TabularInline):
 # --- ADMIN ДЛЯ ТЕСТОВ ---
 class TestAdmin(admin.ModelAdmin):
     # Тут ID у нас уже был
-    list_display = ('id', 'title', 'author', 'status', 'created_at')
+    list_display = ('id', 'title', 'author', 'status', 'question_count', 'created_at')
     list_display_links = ('id', 'title')
-    list_filter = ('status', 'author', 'evaluation_method')
-    inlines = [QuestionInline]
+    list_filter = ('status', 'evaluation_method', AuthorEmailFilter)
+    list_select_related = ('author',)
+    search_fields = ('title',)  # нужен для autocomplete_fields в других админках
+    autocomplete_fields = ('author',)
+    readonly_fields = ('questions_link',)
+
+    def get_inlines(self, request, obj):
+        # Тест с банком в тысячи вопросов открывается без инлайна - вопросы смотрим списком
+        if obj is not None and obj.question_count > INLINE_MAX_ROWS:
+            return []
+        return [QuestionInline]
+
+    def questions_link(self, obj):
+        if not obj.pk:
+            return "-"
+        return changelist_link('question', f'test_id={obj.pk}', f'Вопросов: {obj.question_count} - открыть список')
+
+    questions_link.short_description = "Вопросы"
 
 
 # --- ADMIN ДЛЯ ВОПРОСОВ ---
-class QuestionAdmin(admin.ModelAdmin):
-    list_display = ('id', 'test', 'text', 'question_type', 'json_preview')
-    list_filter = ('test', 'question_type')
+class QuestionAdmin(LargeTableAdmin):
+    list_display = ('id', 'test', 'text', 'question_type', 'pool', 'json_preview')
+    list_filter = ('question_type', TestIdFilter)
+    list_select_related = ('test', 'pool')
     ordering = ('test', 'order_num')
-    readonly_fields = ('json_preview',)
+    search_fields = ('text',)
+    autocomplete_fields = ('test',)
+    raw_id_fields = ('pool',)
+    readonly_fields = ('json_full',)
 
     def json_preview(self, obj):
+        return json_preview(obj.answer_data)
+
+    json_preview.short_description = "Состав вопроса (JSON)"
+
+    def json_full(self, obj):
+        # На странице одного вопроса JSON показываем целиком
         if not obj.answer_data:
             return "-"
-        json_str = json.dumps(obj.answer_data, indent=2, ensure_ascii=False)
-        return mark_safe(f'<pre>{json_str}</pre>')
+        return format_html('<pre>{}</pre>', json.dumps(obj.answer_data, indent=2, ensure_ascii=False))
 
-    json_preview.short_description = "Состав вопроса (JSON)"
+    json_full.short_description = "Состав вопроса (JSON)"
+
+
+class QuestionPoolAdmin(admin.ModelAdmin):
+    list_display = ('id', 'title', 'test', 'draw_count', 'shuffle')
+    list_filter = (TestIdFilter,)
+    list_select_related = ('test',)
+    autocomplete_fields = ('test',)
 
 
 class UserAnswerInline(admin.TabularInline):
@@ -66,20 +219,56 @@ class UserAnswerInline(admin.TabularInline):
     readonly_fields = ('question', 'get_user_answer', 'is_correct', 'points_awarded')
     can_delete = False
 
+    def get_queryset(self, request):
+        # Колонка question выводит __str__ вопроса - без select_related это запрос на строку
+        return super().get_queryset(request).select_related('question')
+
     def get_user_answer(self, obj):
-        return mark_safe(f'<pre>{json.dumps(obj.selected_answer, ensure_ascii=False)}</pre>')
+        return json_preview(obj.selected_answer)
     get_user_answer.short_description = "Ответ студента"
 
 
-class TestAttemptAdmin(admin.ModelAdmin):
+class TestAttemptAdmin(LargeTableAdmin):
     list_display = ('id', 'user', 'test', 'status', 'total_score', 'started_at', 'finished_at')
-    list_filter = ('status', 'test', 'user')
+    list_filter = ('status', TestIdFilter, UserEmailFilter)
+    list_select_related = ('user', 'test')
     search_fields = ('user__email', 'test__title')
-    inlines = [UserAnswerInline]
-    readonly_fields = ('started_at', 'finished_at')
+    autocomplete_fields = ('user', 'test')
+    exclude = ('question_ids',)
+    readonly_fields = ('started_at', 'finished_at', 'deadline_at', 'seed', 'question_ids_preview', 'answers_link')
+
+    def get_inlines(self, request, obj):
+        if obj is not None and obj.answered_count > INLINE_MAX_ROWS:
+            return []
+        return [UserAnswerInline]
+
+    def question_ids_preview(self, obj):
+        return json_preview(obj.question_ids)
+
+    question_ids_preview.short_description = "Вопросы попытки"
+
+    def answers_link(self, obj):
+        if not obj.pk:
+            return "-"
+        return changelist_link('useranswer', f'attempt_id={obj.pk}', f'Ответов: {obj.answered_count} - открыть список')
+
+    answers_link.short_description = "Ответы"
+
+
+class UserAnswerAdmin(LargeTableAdmin):
+    # Только id связей: __str__ попытки и вопроса потянул бы пользователя, тест и текст вопроса на каждую строку
+    list_display = ('id', 'attempt_id', 'question_id', 'is_correct', 'points_awarded', 'answer_preview')
+    list_filter = ('is_correct', AttemptIdFilter, QuestionIdFilter)
+    raw_id_fields = ('attempt', 'question')
+
+    def answer_preview(self, obj):
+        return json_preview(obj.selected_answer)
+
+    answer_preview.short_description = "Ответ студента"
 
 
 admin.site.register(TestAttempt, TestAttemptAdmin)
-admin.site.register(UserAnswer)
+admin.site.register(UserAnswer, UserAnswerAdmin)
 admin.site.register(Test, TestAdmin)
 admin.site.register(Question, QuestionAdmin)
+admin.site.register(QuestionPool, QuestionPoolAdmin)
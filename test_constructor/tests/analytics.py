@@ -0,0 +1,173 @@
+"""
+Аналитика результатов теста.
+
+Сводные таблицы (TestResultSummary, ScoreBucketSummary, QuestionResultSummary)
+собираются групповой агрегацией в БД и затем дополняются при каждом
+завершении попытки, поэтому чтение аналитики стоит O(вопросов), а не O(ответов).
+"""
+from django.db import transaction
+from django.db.models import Case, Count, ExpressionWrapper, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, Least
+
+from test_constructor.db_router import use_primary
+
+from .models import (
+    Question, QuestionResultSummary, ScoreBucketSummary, TestAttempt, TestResultSummary, UserAnswer,
+)
+
+BUCKETS = 10
+
+
+def bucket_for(total_score, max_score):
+    """ Номер столбца гистограммы: процент от максимума с шагом 10 (0..10) """
+    if max_score <= 0:
+        return 0
+    return min(BUCKETS, total_score * BUCKETS // max_score)
+
+
+def rebuild_summary(test):
+    """ Пересобрать сводку теста агрегирующими запросами """
+    with transaction.atomic():
+        # Сначала блокируем строку сводки, потом агрегируем: завершение попытки
+        # (record_finished_attempt) ждёт этой блокировки, поэтому попытка либо уже
+        # видна агрегатам, либо добавится в сводку после пересборки - но не дважды и не мимо
+        summary, _ = TestResultSummary.objects.select_for_update().get_or_create(test=test)
+
+        # У попыток с вопросами из пулов свой максимум, у остальных - максимум теста
+        finished = TestAttempt.objects.filter(test=test, status='finished').order_by().alias(
+            attempt_max=Coalesce(F('max_score'), Value(test.max_score)))
+
+        totals = finished.aggregate(finished_count=Count('id'), score_sum=Coalesce(Sum('total_score'), 0))
+        if test.evaluation_method == 'percent':
+            # То же условие, что в Test.pass_threshold: total * 100 >= passing * max
+            passed_count = finished.alias(
+                score_percent=ExpressionWrapper(F('total_score') * 100, output_field=IntegerField()),
+            ).filter(attempt_max__gt=0, score_percent__gte=F('attempt_max') * test.passing_score).count()
+        else:
+            passed_count = finished.filter(total_score__gte=test.passing_score).count()
+
+        bucket = Case(
+            When(attempt_max__gt=0, then=Least(
+                ExpressionWrapper(F('total_score') * BUCKETS / F('attempt_max'), output_field=IntegerField()),
+                Value(BUCKETS),
+            )),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        buckets = finished.annotate(bucket=bucket).values('bucket').annotate(n=Count('id'))
+
+        per_question = UserAnswer.objects.filter(attempt__test=test, attempt__status='finished').order_by().values(
+            'question').annotate(answered=Count('id'), correct=Count('id', filter=Q(is_correct=True)))
+        per_question = {row['question']: row for row in per_question}
+
+        summary.test_version = test.content_version
+        summary.is_stale = False
+        summary.finished_count = totals['finished_count']
+        summary.passed_count = passed_count
+        summary.score_sum = totals['score_sum']
+        summary.save()
+
+        ScoreBucketSummary.objects.filter(test=test).delete()
+        ScoreBucketSummary.objects.bulk_create([
+            ScoreBucketSummary(test=test, bucket=row['bucket'], attempts_count=row['n']) for row in buckets
+        ])
+
+        QuestionResultSummary.objects.filter(test=test).delete()
+        QuestionResultSummary.objects.bulk_create([
+            QuestionResultSummary(
+                question_id=q_id, test=test,
+                answered_count=per_question.get(q_id, {}).get('answered', 0),
+                correct_count=per_question.get(q_id, {}).get('correct', 0),
+            )
+            for q_id in Question.objects.filter(test=test).values_list('id', flat=True)
+        ])
+    return summary
+
+
+def record_finished_attempt(attempt, test, passed):
+    """
+    Добавить завершённую попытку в сводку (вызывается внутри транзакции завершения).
+    Если сводка устарела, ничего не делаем - она пересоберётся при чтении.
+    """
+    # Блокировка строки сводки (а не UPDATE с условием is_stale=False): если сводку сейчас
+    # пересобирают, ждём конца пересборки и добавляем попытку уже в свежую сводку
+    summary = TestResultSummary.objects.select_for_update().filter(test_id=test.id).only(
+        'test_version', 'is_stale').first()
+    if summary is None:
+        # Пустая устаревшая строка: пересборка, начавшаяся параллельно, дождётся нашей транзакции
+        TestResultSummary.objects.get_or_create(test_id=test.id, defaults={'is_stale': True})
+        return
+    if summary.is_stale or summary.test_version != test.content_version:
+        return
+
+    TestResultSummary.objects.filter(test_id=test.id).update(
+        finished_count=F('finished_count') + 1,
+        passed_count=F('passed_count') + (1 if passed else 0),
+        score_sum=F('score_sum') + attempt.total_score,
+    )
+
+    # Строка сводки заблокирована выше, поэтому create здесь не гоняется с другими
+    bucket = bucket_for(attempt.total_score, test.max_score if attempt.max_score is None else attempt.max_score)
+    if not ScoreBucketSummary.objects.filter(test_id=test.id, bucket=bucket).update(
+            attempts_count=F('attempts_count') + 1):
+        ScoreBucketSummary.objects.create(test_id=test.id, bucket=bucket, attempts_count=1)
+
+    answers = UserAnswer.objects.filter(attempt_id=attempt.id)
+    QuestionResultSummary.objects.filter(question_id__in=answers.values('question_id')).update(
+        answered_count=F('answered_count') + 1,
+        correct_count=F('correct_count') + Case(
+            When(question_id__in=answers.filter(is_correct=True).values('question_id'), then=Value(1)),
+            default=Value(0),
+        ),
+    )
+
+
+def mark_stale(test_ids):
+    """ Баллы попыток изменились в обход record_finished_attempt (регрейд, автозавершение) """
+    TestResultSummary.objects.filter(test_id__in=test_ids).update(is_stale=True)
+
+
+def summary_rows(test):
+    """ Столбцы гистограммы {bucket: попыток} и вопросы со счётчиками ответов """
+    buckets = dict(ScoreBucketSummary.objects.filter(test=test).values_list('bucket', 'attempts_count'))
+    questions = list(Question.objects.filter(test=test).order_by('order_num').values(
+        'id', 'text', 'result_summary__answered_count', 'result_summary__correct_count'))
+    return buckets, questions
+
+
+def get_analytics(test):
+    summary = TestResultSummary.objects.filter(test=test).first()
+    if summary is None or summary.is_stale or summary.test_version != test.content_version:
+        # Сводка собирается из попыток и сразу записывается - читаем их с основной БД, не с реплики.
+        # Столбцы и вопросы тоже: на реплике их свежей версии ещё нет
+        with use_primary():
+            summary = rebuild_summary(test)
+            buckets, questions = summary_rows(test)
+    else:
+        buckets, questions = summary_rows(test)
+
+    finished = summary.finished_count
+    return {
+        'finished_count': finished,
+        'passed_count': summary.passed_count,
+        'pass_rate': round(summary.passed_count / finished, 4) if finished else None,
+        'average_score': round(summary.score_sum / finished, 2) if finished else None,
+        'max_score': test.max_score,
+        'histogram': [
+            {'from_percent': b * 10, 'to_percent': min(b * 10 + 9, 100), 'count': buckets.get(b, 0)}
+            for b in range(BUCKETS + 1)
+        ],
+        'questions': [
+            {
+                'question_id': q['id'],
+                'text': q['text'],
+                'answered': q['result_summary__answered_count'] or 0,
+                'correct': q['result_summary__correct_count'] or 0,
+                'correct_rate': (
+                    round(q['result_summary__correct_count'] / q['result_summary__answered_count'], 4)
+                    if q['result_summary__answered_count'] else None
+                ),
+            }
+            for q in questions
+        ],
+    }
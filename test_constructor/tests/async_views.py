@@ -0,0 +1,148 @@
+"""
+Асинхронные версии горячих эндпоинтов студента (для запуска под ASGI).
+
+Включаются настройкой TESTS_ASYNC_VIEWS (см. tests/urls.py). Простые запросы
+идут через async ORM (aget/acreate/aexists), а блоки с транзакциями
+(save_answers, finish_attempt) переиспользуются из views через sync_to_async.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils import timezone
+
+from test_constructor import metrics
+from test_constructor.db_router import replica_read
+from test_constructor.throttling import throttle
+
+from . import pools
+from .cache import get_payload, local_payloads, student_questions_key
+from .models import Question, Test, TestAttempt
+from .views import (
+    AttemptClosed, AttemptExpired, build_attempt_questions_payload, build_student_questions_payload,
+    check_user_answer, finish_attempt, finish_result, not_modified_response, save_answers, set_cache_validators,
+    student_questions_kind,
+)
+
+
+def async_csrf_exempt(view_func):
+    """ csrf_exempt в Django 4.2 оборачивает view синхронной функцией, поэтому ставим флаг напрямую """
+    view_func.csrf_exempt = True
+    return view_func
+
+
+async def get_user(request):
+    """ request.user ленивый: первое обращение читает сессию и пользователя из БД """
+    def resolve():
+        return request.user if request.user.is_authenticated else None
+    return await sync_to_async(resolve)()
+
+
+async def aget_object_or_404(queryset, **kwargs):
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404(f'{queryset.model._meta.object_name} не найден')
+
+
+@async_csrf_exempt
+async def start_test_view(request, test_uuid):
+    """ Начать тест по ссылке """
+    user = await get_user(request)
+    if user is None: return JsonResponse({'error': 'Auth required'}, status=401)
+    if request.method == 'POST':
+        test_obj = await aget_object_or_404(Test.objects.all(), public_uuid=test_uuid)
+
+        attempt = await TestAttempt.objects.acreate(
+            user=user,
+            test=test_obj,
+            status='in_progress',
+            deadline_at=TestAttempt.deadline_for(test_obj, timezone.now()),
+            **await sync_to_async(pools.attempt_fields)(test_obj)
+        )
+        metrics.ATTEMPTS_STARTED.inc()
+        return JsonResponse({'message': 'Тест начат', 'attempt_id': attempt.id, 'deadline_at': attempt.deadline_at},
+                            status=201)
+    return JsonResponse({'error': 'Только POST'}, status=405)
+
+
+@async_csrf_exempt
+@replica_read
+async def question_list_student_view(request, test_uuid):
+    """ Получить вопросы по ссылке (Без ответов!) """
+    user = await get_user(request)
+    if user is None: return JsonResponse({'error': 'Auth required'}, status=401)
+
+    test_obj = await aget_object_or_404(Test.objects.all(), public_uuid=test_uuid)
+
+    if request.method == 'GET':
+        attempt = await TestAttempt.objects.filter(user=user, test=test_obj, status='in_progress').only(
+            'id', 'question_ids').order_by('-started_at').afirst()
+        if attempt is None:
+            return JsonResponse({'error': 'Нет активной попытки'}, status=403)
+
+        kind = student_questions_kind(attempt)
+        not_modified = not_modified_response(request, test_obj, kind)
+        if not_modified is not None:
+            return not_modified
+
+        if attempt.question_ids is None:
+            key = student_questions_key(test_obj)
+            payload = local_payloads.get(key)
+            if payload is None:
+                payload = await sync_to_async(get_payload)(key, lambda: build_student_questions_payload(test_obj))
+        else:
+            payload = await sync_to_async(build_attempt_questions_payload)(attempt.question_ids)
+        response = HttpResponse(payload, content_type='application/json')
+        return set_cache_validators(response, test_obj, kind)
+    return JsonResponse({'error': 'Только GET'}, status=405)
+
+
+@async_csrf_exempt
+@throttle('submit_answer')
+async def submit_answer_view(request, attempt_id):
+    """ Сохранить ответ """
+    user = await get_user(request)
+    if user is None: return JsonResponse({'error': 'Auth required'}, status=401)
+    if request.method == 'POST':
+        try:
+            body = json.loads(request.body)
+            question_id = body.get('question_id')
+            selected_answer = body.get('selected_answer')
+
+            attempt = await aget_object_or_404(TestAttempt.objects.all(), id=attempt_id, user=user)
+            if attempt.status != 'in_progress':
+                return JsonResponse({'error': 'Тест завершен'}, status=400)
+            if attempt.is_expired():
+                return JsonResponse({'error': 'Время на тест истекло'}, status=400)
+
+            question = await aget_object_or_404(Question.objects.all(), id=question_id)
+            if not attempt.includes_question(question):
+                return JsonResponse({'error': 'Чужой вопрос'}, status=400)
+
+            is_correct, points = check_user_answer(question, selected_answer)
+
+            total_score, answered_count = await sync_to_async(save_answers)(attempt.id, {
+                question.id: (selected_answer, is_correct, points)
+            })
+            return JsonResponse({'message': 'Принято', 'total_score': total_score, 'answered_count': answered_count})
+        except AttemptExpired:
+            return JsonResponse({'error': 'Время на тест истекло'}, status=400)
+        except AttemptClosed:
+            return JsonResponse({'error': 'Тест завершен'}, status=400)
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'error': 'Только POST'}, status=405)
+
+
+@async_csrf_exempt
+async def finish_test_view(request, attempt_id):
+    """ Завершить тест """
+    user = await get_user(request)
+    if user is None: return JsonResponse({'error': 'Auth required'}, status=401)
+    if request.method == 'POST':
+        finished = await sync_to_async(finish_attempt)(attempt_id, user)
+        if finished is None:
+            return JsonResponse({'error': 'Уже завершен'}, status=400)
+        return JsonResponse(finish_result(*finished))
+    return JsonResponse({'error': 'Только POST'}, status=405)
@@ -0,0 +1,115 @@
+"""
+Общие части команд нагрузочного тестирования (loadtest, benchmark_async):
+временная БД, тестовый экзамен, ответы студента и сводка задержек.
+"""
+import math
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from .models import Question, Test
+from users.models import CustomUser
+
+
+@contextmanager
+def temporary_database(stderr=None):
+    """
+    Временная тестовая БД на время прогона (рабочая база не трогается).
+    Для SQLite - файл, а не память: к нему ходят из нескольких потоков.
+    """
+    setup_test_environment(debug=False)
+    temp_dir = None
+    if connection.vendor == 'sqlite':
+        # Файл в собственном временном каталоге: имя не занять заранее (в отличие от mktemp),
+        # а самого файла ещё нет - create_test_db не спросит, удалять ли существующую БД
+        temp_dir = tempfile.mkdtemp(prefix='bench-')
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(temp_dir, 'bench.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0)
+    # Реплики (TEST MIRROR) на время прогона смотрят в ту же временную БД
+    for alias in settings.REPLICA_DATABASES:
+        connections[alias].creation.set_as_test_mirror(connection.settings_dict)
+    try:
+        yield
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def create_exam(questions_count, email='bench-author@example.com'):
+    """ Опубликованный тест из вопросов трёх типов (single / multi / input) по очереди """
+    author = CustomUser.objects.create_user(email=email, password=None, role='employer')
+    test = Test.objects.create(author=author, title='Benchmark')
+    for i in range(questions_count):
+        kind = ('single', 'multi', 'input')[i % 3]
+        if kind == 'input':
+            answer_data = {'correct_answers': ['да']}
+        else:
+            answer_data = {'options': [{'id': 1, 'text': 'Да', 'is_correct': True},
+                                       {'id': 2, 'text': 'Нет', 'is_correct': kind == 'multi'},
+                                       {'id': 3, 'text': 'Не знаю'}]}
+        Question.objects.create(test=test, text=f'Вопрос {i + 1}', question_type=kind,
+                                order_num=i + 1, answer_data=answer_data)
+    return test
+
+
+def sample_answer(question):
+    """ Правдоподобный ответ на вопрос из выдачи студенту (без правильных ответов) """
+    answers = question.get('answers') or {}
+    options = answers.get('options') or [{'id': None}]
+    kind = question.get('type')
+    if kind == 'single':
+        return options[0]['id']
+    if kind == 'multi':
+        return [opt['id'] for opt in options[:2]]
+    if kind == 'input':
+        return 'да'
+    if kind == 'sequence':
+        return [item.get('id') for item in answers.get('items', [])]
+    if kind == 'match':
+        return {}
+    return None
+
+
+def percentile(sorted_values, p):
+    """ Перцентиль p (0..100) по отсортированному списку, метод nearest-rank """
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(samples, seconds):
+    """
+    samples - {эндпоинт: [(секунды, статус, запросов_к_БД или None), ...]}.
+    Возвращает общую пропускную способность и перцентили по каждому эндпоинту.
+    """
+    endpoints = {}
+    for endpoint, rows in samples.items():
+        latencies = sorted(row[0] for row in rows)
+        queries = [row[2] for row in rows if row[2] is not None]
+        endpoints[endpoint] = {
+            'count': len(rows),
+            'errors': sum(1 for row in rows if row[1] >= 400),
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'queries_avg': round(sum(queries) / len(queries), 2) if queries else None,
+            'queries_max': max(queries) if queries else None,
+        }
+    requests = sum(e['count'] for e in endpoints.values())
+    return {
+        'requests': requests,
+        'errors': sum(e['errors'] for e in endpoints.values()),
+        'seconds': round(seconds, 3),
+        'rps': round(requests / seconds, 1) if seconds else None,
+        'endpoints': endpoints,
+    }
@@ -0,0 +1,65 @@
+"""
+Кэш готовых (уже сериализованных в JSON) ответов API.
+
+Два уровня: LRU в памяти процесса и общий кэш Django (алиас из
+settings.TESTS_PAYLOAD_CACHE). Ключи содержат Test.content_version,
+поэтому старые записи не удаляются явно - они просто перестают запрашиваться.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class LocalLRU:
+    """ Небольшой потокобезопасный LRU-кэш в памяти процесса """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local_payloads = LocalLRU(getattr(settings, 'TESTS_PAYLOAD_LOCAL_SIZE', 256))
+
+
+def student_questions_key(test_obj):
+    return f'tests:student_questions:{test_obj.id}:{test_obj.content_version}'
+
+
+def get_payload(key, build):
+    """
+    Вернуть байты ответа по ключу.
+    build() вызывается только если ответа нет ни в памяти процесса, ни в общем кэше.
+    """
+    payload = local_payloads.get(key)
+    if payload is not None:
+        return payload
+
+    shared = caches[getattr(settings, 'TESTS_PAYLOAD_CACHE', 'default')]
+    payload = shared.get(key)
+    if payload is None:
+        payload = build()
+        shared.set(key, payload, getattr(settings, 'TESTS_PAYLOAD_TIMEOUT', 60 * 60))
+
+    local_payloads.set(key, payload)
+    return payload
@@ -0,0 +1,385 @@
+"""
+Импорт и экспорт теста целиком одним JSON-документом.
+
+Формат:
+    {
+        "format": "test-constructor/1",
+        "test": {"title": "...", "description": "...", "time_limit": 0, "passing_score": 0,
+                 "evaluation_method": "points", "success_message": "...", "failure_message": "...",
+                 "status": "published"},
+        "pools": [{"title": "...", "draw_count": 5, "shuffle": true}, ...],
+        "questions": [
+            {"text": "...", "type": "single", "points": 1, "answer_data": {...}, "pool": 0},
+            ...
+        ]
+    }
+
+"pools" и "pool" (номер пула в списке pools) необязательны.
+Документ читается потоком: ключ "test" должен идти раньше "pools" и "questions",
+а вопросы декодируются по одному (json.JSONDecoder.raw_decode по буферу,
+который пополняется кусками), так что в памяти одновременно только
+буфер и пачка вопросов для bulk_create. Тест и вопросы создаются в одной
+транзакции; order_num назначается по порядку в документе, счётчики теста
+выставляются одним UPDATE в конце.
+"""
+import codecs
+import json
+import re
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .grading import compile_answer_key
+from .models import Question, QuestionPool, Test
+
+FORMAT = 'test-constructor/1'
+READ_CHUNK_SIZE = 64 * 1024
+CREATE_BATCH_SIZE = 500
+EXPORT_CHUNK_SIZE = 500
+# Предел PositiveIntegerField на всех поддерживаемых БД
+MAX_INT = 2147483647
+
+TEST_FIELDS = ('title', 'description', 'time_limit', 'passing_score', 'evaluation_method',
+               'success_message', 'failure_message', 'status')
+
+
+class DocumentError(ValueError):
+    """ Документ не разобрался или не прошёл проверку """
+
+
+# ==========================================
+# ПОТОКОВОЕ ЧТЕНИЕ
+# ==========================================
+
+class StreamReader:
+    """ Читает JSON из файлоподобного объекта (bytes или str) кусками """
+    WHITESPACE = ' \t\n\r'
+    # Хвост буфера, которым число ещё может продолжиться
+    NUMBER_TAIL = re.compile(r'[0-9+\-.eE]*\Z')
+
+    def __init__(self, stream, chunk_size=READ_CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """ Дочитать кусок; False, если поток кончился """
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        try:
+            if not chunk:
+                self.eof = True
+                self.buf = self.buf[self.pos:] + self.decoder.decode(b'', final=True)
+                self.pos = 0
+                return False
+            if isinstance(chunk, bytes):
+                chunk = self.decoder.decode(chunk)
+        except UnicodeDecodeError:
+            raise DocumentError('Документ должен быть в кодировке UTF-8')
+        # Прочитанное начало буфера больше не нужно
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """ Следующий непробельный символ ('' в конце потока) """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in self.WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise DocumentError(f'Ожидался символ {char!r}')
+        self.pos += 1
+
+    def value(self):
+        """ Декодировать следующее JSON-значение целиком """
+        self.peek()
+        while True:
+            try:
+                value, end = self.json.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                if self.fill():
+                    continue
+                raise DocumentError(f'Некорректный JSON: {e.msg}')
+            # Число на краю буфера могло оборваться и разобраться как более короткое:
+            # «12» из «1234», «1» из «1e5» или «1.5». Пока после него в буфере нет
+            # ничего, кроме символов числа, дочитываем и разбираем заново
+            if self.is_number(value) and self.NUMBER_TAIL.match(self.buf, end) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    @staticmethod
+    def is_number(value):
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    def object_items(self):
+        """ Итерировать ключи объекта; значение читает вызывающий (value() или array_items()) """
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise DocumentError('Ключ объекта должен быть строкой')
+            self.expect(':')
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == '}':
+                return
+            if char != ',':
+                raise DocumentError('Ожидалась запятая или }')
+
+    def array_items(self):
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            char = self.peek()
+            self.pos += 1
+            if char == ']':
+                return
+            if char != ',':
+                raise DocumentError('Ожидалась запятая или ]')
+
+
+# ==========================================
+# ПРОВЕРКА
+# ==========================================
+
+def _non_negative_int(data, field, default, where):
+    value = data.get(field, default)
+    if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+        raise DocumentError(f'{where}: {field} должно быть целым числом >= 0')
+    if value > MAX_INT:
+        raise DocumentError(f'{where}: {field} должно быть не больше {MAX_INT}')
+    return value
+
+
+def _string(data, field, default, where, required=False):
+    value = data.get(field, default)
+    if not isinstance(value, str) or (required and not value.strip()):
+        raise DocumentError(f'{where}: поле {field} обязательно' if required else f'{where}: {field} должно быть строкой')
+    return value
+
+
+def clean_test_meta(data):
+    """ Поля теста из документа (недостающие - значения по умолчанию модели) """
+    if not isinstance(data, dict):
+        raise DocumentError('"test" должен быть объектом')
+    where = 'test'
+    meta = {
+        'title': _string(data, 'title', '', where, required=True),
+        'description': _string(data, 'description', '', where),
+        'time_limit': _non_negative_int(data, 'time_limit', 0, where),
+        'passing_score': _non_negative_int(data, 'passing_score', 0, where),
+        'evaluation_method': data.get('evaluation_method', 'points'),
+        'status': data.get('status', 'published'),
+    }
+    if len(meta['title']) > Test._meta.get_field('title').max_length:
+        raise DocumentError('test: слишком длинное название')
+    if not isinstance(meta['evaluation_method'], str) or meta['evaluation_method'] not in dict(Test.EVALUATION_CHOICES):
+        raise DocumentError('test: неизвестный evaluation_method')
+    if not isinstance(meta['status'], str) or meta['status'] not in dict(Test.STATUS_CHOICES):
+        raise DocumentError('test: неизвестный status')
+    for field in ('success_message', 'failure_message'):
+        if field in data:
+            meta[field] = _string(data, field, '', where)
+    return meta
+
+
+def clean_pool(data, index):
+    """ Проверить пул документа и вернуть поля для QuestionPool """
+    where = f'pools[{index}]'
+    if not isinstance(data, dict):
+        raise DocumentError(f'{where}: пул должен быть объектом')
+    pool = {
+        'title': _string(data, 'title', '', where),
+        'draw_count': _non_negative_int(data, 'draw_count', 0, where),
+        'shuffle': data.get('shuffle', False),
+    }
+    if len(pool['title']) > QuestionPool._meta.get_field('title').max_length:
+        raise DocumentError(f'{where}: слишком длинное название')
+    if not isinstance(pool['shuffle'], bool):
+        raise DocumentError(f'{where}: shuffle должен быть true или false')
+    return pool
+
+
+def clean_question(data, index, pool_ids=()):
+    """ Проверить вопрос документа и вернуть поля для Question (pool_ids - id созданных пулов по порядку) """
+    where = f'questions[{index}]'
+    if not isinstance(data, dict):
+        raise DocumentError(f'{where}: вопрос должен быть объектом')
+    pool = data.get('pool')
+    if pool is not None and (type(pool) is not int or not 0 <= pool < len(pool_ids)):
+        raise DocumentError(f'{where}: pool должен быть номером пула из "pools"')
+    question_type = data.get('type', 'single')
+    if not isinstance(question_type, str) or question_type not in dict(Question.TYPE_CHOICES):
+        raise DocumentError(f'{where}: неизвестный тип вопроса')
+    answer_data = data.get('answer_data', {})
+    if not isinstance(answer_data, dict):
+        raise DocumentError(f'{where}: answer_data должен быть объектом')
+    try:
+        # Ключ проверки собирается так же, как при ответах студентов
+        compile_answer_key(question_type, answer_data)
+    except (KeyError, TypeError, AttributeError, ValueError):
+        raise DocumentError(f'{where}: answer_data не подходит для типа {question_type}')
+    return {
+        'text': _string(data, 'text', '', where, required=True),
+        'question_type': question_type,
+        'points': _non_negative_int(data, 'points', 1, where),
+        'answer_data': answer_data,
+        'pool_id': None if pool is None else pool_ids[pool],
+    }
+
+
+# ==========================================
+# ИМПОРТ / ЭКСПОРТ
+# ==========================================
+
+def import_document(stream, author):
+    """ Создать тест из документа. Возвращает созданный Test (с актуальными счётчиками) """
+    reader = StreamReader(stream)
+    max_questions = settings.TESTS_IMPORT_MAX_QUESTIONS
+    test = None
+    pool_ids = None
+    question_count = max_score = 0
+    seen_questions = False
+
+    with transaction.atomic():
+        for key in reader.object_items():
+            if key == 'format':
+                if reader.value() != FORMAT:
+                    raise DocumentError(f'Поддерживается только формат {FORMAT}')
+            elif key == 'test':
+                if test is not None:
+                    raise DocumentError('Ключ "test" встречается дважды')
+                test = Test.objects.create(author=author, **clean_test_meta(reader.value()))
+            elif key == 'pools':
+                if test is None or seen_questions:
+                    raise DocumentError('Ключ "pools" должен идти после "test" и раньше "questions"')
+                if pool_ids is not None:
+                    raise DocumentError('Ключ "pools" встречается дважды')
+                pools = reader.value()
+                if not isinstance(pools, list):
+                    raise DocumentError('"pools" должен быть списком')
+                # Пулов единицы - создаём по одному, чтобы получить id на любой БД
+                pool_ids = [QuestionPool.objects.create(test=test, **clean_pool(data, index)).id
+                            for index, data in enumerate(pools)]
+            elif key == 'questions':
+                if test is None:
+                    raise DocumentError('Ключ "test" должен идти раньше "questions"')
+                if seen_questions:
+                    raise DocumentError('Ключ "questions" встречается дважды')
+                seen_questions = True
+                batch = []
+                for index, data in enumerate(reader.array_items()):
+                    if index >= max_questions:
+                        raise DocumentError(f'Слишком много вопросов (максимум {max_questions})')
+                    fields = clean_question(data, index, pool_ids or ())
+                    batch.append(Question(test=test, order_num=index + 1, **fields))
+                    question_count += 1
+                    max_score += fields['points']
+                    if len(batch) >= CREATE_BATCH_SIZE:
+                        Question.objects.bulk_create(batch)
+                        batch = []
+                if batch:
+                    Question.objects.bulk_create(batch)
+            else:
+                reader.value()  # неизвестные ключи пропускаем
+        if reader.peek() != '':
+            raise DocumentError('Лишние данные после документа')
+        if test is None:
+            raise DocumentError('В документе нет ключа "test"')
+
+        # bulk_create обходит Question.save, поэтому счётчики выставляем сами
+        Test.objects.filter(pk=test.pk).update(
+            question_count=question_count,
+            max_score=max_score,
+            content_version=F('content_version') + 1,
+            updated_at=timezone.now(),
+        )
+    test.refresh_from_db()
+    return test
+
+
+def clone_test(test, author, title=None):
+    """ Копия теста со всеми пулами и вопросами (вопросы - одним bulk_create) """
+    with transaction.atomic():
+        questions = list(Question.objects.filter(test=test).order_by('order_num', 'id').only(
+            'text', 'question_type', 'points', 'answer_data', 'order_num', 'pool_id'))
+        meta = test_meta(test)
+        if title:
+            meta['title'] = title
+        clone = Test.objects.create(
+            author=author,
+            question_count=len(questions),
+            max_score=sum(q.points for q in questions),
+            **meta,
+        )
+        pool_ids = {
+            pool.id: QuestionPool.objects.create(test=clone, title=pool.title, draw_count=pool.draw_count,
+                                                 shuffle=pool.shuffle).id
+            for pool in QuestionPool.objects.filter(test=test).order_by('id')
+        }
+        Question.objects.bulk_create([
+            Question(test=clone, text=q.text, question_type=q.question_type, points=q.points,
+                     answer_data=q.answer_data, order_num=q.order_num, pool_id=pool_ids.get(q.pool_id))
+            for q in questions
+        ], batch_size=CREATE_BATCH_SIZE)
+    return clone
+
+
+def test_meta(test):
+    return {field: getattr(test, field) for field in TEST_FIELDS}
+
+
+def pool_data(pool):
+    return {'title': pool.title, 'draw_count': pool.draw_count, 'shuffle': pool.shuffle}
+
+
+def question_data(question, pool_index=None):
+    data = {
+        'text': question.text,
+        'type': question.question_type,
+        'points': question.points,
+        'answer_data': question.answer_data,
+    }
+    if pool_index is not None:
+        data['pool'] = pool_index
+    return data
+
+
+def iter_document(test):
+    """ Документ теста кусками строк (вопросы читаются из БД пачками) """
+    def dumps(value):
+        return json.dumps(value, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+    pools = list(QuestionPool.objects.filter(test=test).order_by('id'))
+    pool_index = {pool.id: index for index, pool in enumerate(pools)}
+    yield (f'{{"format": {dumps(FORMAT)},\n"test": {dumps(test_meta(test))},\n'
+           f'"pools": {dumps([pool_data(pool) for pool in pools])},\n"questions": [')
+    questions = Question.objects.filter(test=test).order_by('order_num', 'id').only(
+        'text', 'question_type', 'points', 'answer_data', 'pool_id').iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    separator = '\n'
+    for question in questions:
+        yield separator + dumps(question_data(question, pool_index.get(question.pool_id)))
+        separator = ',\n'
+    yield '\n]}\n'
@@ -0,0 +1,112 @@
+"""
+Потоковая выгрузка результатов теста (CSV / NDJSON).
+
+Попытки читаются через .iterator(chunk_size=...) вместе с пользователем
+(JOIN) и ответами (prefetch по каждой пачке), поэтому память не зависит
+от количества попыток.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+
+from .models import TestAttempt, UserAnswer
+
+EXPORT_CHUNK_SIZE = 500
+FORMATS = ('csv', 'ndjson')
+
+CSV_HEADER = [
+    'attempt_id', 'email', 'last_name', 'first_name', 'second_name',
+    'started_at', 'finished_at', 'total_score',
+    'question_id', 'selected_answer', 'is_correct', 'points_awarded',
+]
+
+
+def finished_attempts(test):
+    answers = UserAnswer.objects.only(
+        'attempt_id', 'question_id', 'selected_answer', 'is_correct', 'points_awarded').order_by('question_id')
+    return (
+        TestAttempt.objects.filter(test=test, status='finished')
+        .select_related('user')
+        .only('id', 'started_at', 'finished_at', 'total_score',
+              'user__email', 'user__first_name', 'user__last_name', 'user__second_name')
+        .prefetch_related(Prefetch('answers', queryset=answers))
+        .order_by('id')
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+
+
+def _attempt_fields(attempt):
+    user = attempt.user
+    return [
+        attempt.id, user.email, user.last_name, user.first_name, user.second_name or '',
+        attempt.started_at.isoformat(), attempt.finished_at.isoformat() if attempt.finished_at else '',
+        attempt.total_score,
+    ]
+
+
+def iter_csv_rows(test):
+    """ Одна строка на ответ; попытка без ответов - одна строка с пустыми полями ответа """
+    yield CSV_HEADER
+    for attempt in finished_attempts(test):
+        base = _attempt_fields(attempt)
+        answers = attempt.answers.all()
+        if not answers:
+            yield base + ['', '', '', '']
+        for answer in answers:
+            yield base + [
+                answer.question_id,
+                json.dumps(answer.selected_answer, ensure_ascii=False),
+                int(answer.is_correct),
+                answer.points_awarded,
+            ]
+
+
+def iter_ndjson_records(test):
+    """ Один JSON-объект на попытку, ответы вложены списком """
+    for attempt in finished_attempts(test):
+        user = attempt.user
+        yield {
+            'attempt_id': attempt.id,
+            'user': {
+                'email': user.email,
+                'last_name': user.last_name,
+                'first_name': user.first_name,
+                'second_name': user.second_name,
+            },
+            'started_at': attempt.started_at,
+            'finished_at': attempt.finished_at,
+            'total_score': attempt.total_score,
+            'answers': [
+                {
+                    'question_id': answer.question_id,
+                    'selected_answer': answer.selected_answer,
+                    'is_correct': answer.is_correct,
+                    'points_awarded': answer.points_awarded,
+                }
+                for answer in attempt.answers.all()
+            ],
+        }
+
+
+class _Echo:
+    """ csv.writer пишет строку и сразу возвращает её, ничего не накапливая """
+
+    def write(self, value):
+        return value
+
+
+def stream_results(test, fmt):
+    """ Генератор строк выгрузки в формате fmt ('csv' или 'ndjson') """
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        return (writer.writerow(row) for row in iter_csv_rows(test))
+    return (json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+            for record in iter_ndjson_records(test))
+
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
@@ -0,0 +1,181 @@
+"""
+Скомпилированные ключи ответов.
+
+Question.answer_data один раз превращается в неизменяемый объект-проверяльщик
+(frozenset, заранее приведённые к нижнему регистру строки, кортежи порядка).
+Объекты кэшируются в памяти процесса по ключу (id вопроса, версия вопроса),
+поэтому при отправке ответа не нужно заново разбирать JSON.
+"""
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+
+# Сколько скомпилированных ключей держим в памяти одного процесса
+MAX_CACHED_KEYS = 10000
+
+
+class AnswerKey:
+    """ Базовый ключ: ни один ответ не считается правильным """
+    __slots__ = ()
+
+    def matches(self, user_answer_json):
+        return False
+
+
+class SingleKey(AnswerKey):
+    __slots__ = ('correct_ids',)
+
+    def __init__(self, answer_data):
+        self.correct_ids = _correct_option_ids(answer_data)
+
+    def matches(self, user_answer_json):
+        try:
+            return user_answer_json in self.correct_ids
+        except TypeError:  # список/объект вместо id варианта
+            return False
+
+
+class MultiKey(AnswerKey):
+    __slots__ = ('correct_ids',)
+
+    def __init__(self, answer_data):
+        self.correct_ids = _correct_option_ids(answer_data)
+
+    def matches(self, user_answer_json):
+        if not isinstance(user_answer_json, list): return False
+        try:
+            return set(user_answer_json) == self.correct_ids
+        except TypeError:  # вложенные списки/объекты вместо id вариантов
+            return False
+
+
+class InputKey(AnswerKey):
+    __slots__ = ('case_sensitive', 'answers')
+
+    def __init__(self, answer_data):
+        correct_list = [c for c in answer_data.get('correct_answers', []) if isinstance(c, str)]
+        self.case_sensitive = bool(answer_data.get('case_sensitive', False))
+        if self.case_sensitive:
+            self.answers = frozenset(correct_list)
+        else:
+            self.answers = frozenset(c.lower() for c in correct_list)
+
+    def matches(self, user_answer_json):
+        user_text = str(user_answer_json).strip()
+        if not self.case_sensitive:
+            user_text = user_text.lower()
+        return user_text in self.answers
+
+
+class MatchKey(AnswerKey):
+    __slots__ = ('correct_matches',)
+
+    def __init__(self, answer_data):
+        self.correct_matches = MappingProxyType(dict(answer_data.get('correct_matches', {})))
+
+    def matches(self, user_answer_json):
+        return isinstance(user_answer_json, dict) and user_answer_json == self.correct_matches
+
+
+class SequenceKey(AnswerKey):
+    __slots__ = ('correct_order',)
+
+    def __init__(self, answer_data):
+        items = sorted(answer_data.get('items', []), key=lambda x: x['correct_order'])
+        self.correct_order = tuple(i['id'] for i in items)
+
+    def matches(self, user_answer_json):
+        return isinstance(user_answer_json, list) and tuple(user_answer_json) == self.correct_order
+
+
+KEY_CLASSES = {
+    'single': SingleKey,
+    'multi': MultiKey,
+    'input': InputKey,
+    'match': MatchKey,
+    'sequence': SequenceKey,
+}
+
+
+def _correct_option_ids(answer_data):
+    """ id правильных вариантов (нехэшируемые id из JSON совпасть с ответом всё равно не могут) """
+    ids = set()
+    for opt in answer_data.get('options', []):
+        if opt.get('is_correct'):
+            try:
+                ids.add(opt['id'])
+            except TypeError:
+                continue
+    return frozenset(ids)
+
+
+def compile_answer_key(question_type, answer_data):
+    """ Превращает answer_data вопроса в неизменяемый ключ """
+    key_class = KEY_CLASSES.get(question_type, AnswerKey)
+    return key_class(answer_data or {})
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_answer_key(question):
+    """ Ключ вопроса из кэша процесса (компилируется при первом обращении) """
+    cache_key = (question.id, question.version)
+    with _cache_lock:
+        answer_key = _cache.get(cache_key)
+        if answer_key is not None:
+            _cache.move_to_end(cache_key)
+            return answer_key
+
+    answer_key = compile_answer_key(question.question_type, question.answer_data)
+
+    with _cache_lock:
+        _cache[cache_key] = answer_key
+        if len(_cache) > MAX_CACHED_KEYS:
+            _cache.popitem(last=False)
+    return answer_key
+
+
+def invalidate_answer_key(question_id):
+    """ Выбрасывает из кэша все версии ключа вопроса """
+    with _cache_lock:
+        for cache_key in [k for k in _cache if k[0] == question_id]:
+            del _cache[cache_key]
+
+
+# --- Проверка пачек ответов в пуле процессов (регрейд) ---
+# Модуль не импортирует Django, поэтому функции ниже можно отдавать в ProcessPoolExecutor.
+
+_worker_keys = {}
+
+
+def compile_keys(questions):
+    """ questions: {question_id: (question_type, answer_data, points)} -> {question_id: (ключ, points)} """
+    return {
+        question_id: (compile_answer_key(question_type, answer_data), points)
+        for question_id, (question_type, answer_data, points) in questions.items()
+    }
+
+
+def init_worker(questions):
+    """ Инициализатор процесса пула: компилирует ключи один раз на процесс """
+    _worker_keys.clear()
+    _worker_keys.update(compile_keys(questions))
+
+
+def grade_rows(rows, keys=None):
+    """
+    rows: [(answer_id, question_id, selected_answer)].
+    Возвращает [(answer_id, is_correct, points_awarded)].
+    """
+    keys = _worker_keys if keys is None else keys
+    graded = []
+    for answer_id, question_id, selected_answer in rows:
+        answer_key, points = keys[question_id]
+        try:
+            is_correct = answer_key.matches(selected_answer)
+        except TypeError:  # мусор в старом ответе не должен ронять весь регрейд
+            is_correct = False
+        graded.append((answer_id, is_correct, points if is_correct else 0))
+    return graded
@@ -0,0 +1,47 @@
+"""
+Служебные операции над большими таблицами.
+
+Функции принимают классы моделей аргументами. Миграции их не импортируют
+(код приложения меняется, а миграция должна работать так же, как в момент
+написания) - нужные операции в миграциях повторены на исторических моделях.
+"""
+from django.db import transaction
+from django.db.models import Exists, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def delete_duplicate_answers(answer_model, attempt_model, chunk_size=1000, dry_run=False):
+    """
+    Удаляет повторные ответы на один и тот же вопрос в рамках попытки,
+    оставляя самый поздний (с максимальным id). Баллы затронутых
+    завершённых попыток пересчитываются. Возвращает число удалённых строк.
+    """
+    newer = answer_model.objects.filter(
+        attempt=OuterRef('attempt'), question=OuterRef('question'), id__gt=OuterRef('id'))
+    duplicates = answer_model.objects.filter(Exists(newer)).order_by('id')
+
+    if dry_run:
+        return duplicates.count()
+
+    deleted = 0
+    while True:
+        chunk = list(duplicates.values_list('id', 'attempt_id')[:chunk_size])
+        if not chunk:
+            break
+        ids = [answer_id for answer_id, _ in chunk]
+        attempt_ids = {attempt_id for _, attempt_id in chunk}
+        with transaction.atomic():
+            answer_model.objects.filter(id__in=ids).delete()
+            recount_attempt_scores(answer_model, attempt_model, attempt_ids, status='finished')
+        deleted += len(ids)
+    return deleted
+
+
+def recount_attempt_scores(answer_model, attempt_model, attempt_ids, status=None):
+    """ Пересчитать total_score попыток по их ответам одним UPDATE """
+    points_sum = answer_model.objects.filter(attempt=OuterRef('pk')).order_by().values('attempt').annotate(
+        s=Sum('points_awarded')).values('s')
+    attempts = attempt_model.objects.filter(id__in=attempt_ids)
+    if status:
+        attempts = attempts.filter(status=status)
+    return attempts.update(total_score=Coalesce(Subquery(points_sum, output_field=IntegerField()), Value(0)))
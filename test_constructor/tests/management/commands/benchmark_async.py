@@ -0,0 +1,136 @@
+import asyncio
+import json
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from types import ModuleType
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import include, path
+
+from tests import async_views, urls as tests_urls, views
+from tests.benchmarking import create_exam, sample_answer, summarize, temporary_database
+from users.models import CustomUser
+
+
+def build_urlconf(hot_views):
+    """ URLconf проекта, в котором горячий путь студента обслуживают hot_views """
+    hot_patterns = tests_urls.hot_student_patterns(hot_views)
+    hot_routes = {str(p.pattern) for p in hot_patterns}
+    other_patterns = [p for p in tests_urls.urlpatterns if str(p.pattern) not in hot_routes]
+
+    urlconf = ModuleType(f'benchmark_urls_{hot_views.__name__}')
+    urlconf.urlpatterns = [
+        path('api/', include('users.urls')),
+        path('api/tests/', include(hot_patterns + other_patterns)),
+    ]
+    return urlconf
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пропускную способность синхронных (WSGI) и асинхронных (ASGI) эндпоинтов студента '
+            'на одинаковой нагрузке. Работает во временной тестовой БД.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=50)
+        parser.add_argument('--questions', type=int, default=20)
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--output', help='Записать результаты в JSON-файл')
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        if connection.vendor == 'sqlite':
+            # Писатель у SQLite один, а транзакции с чтением перед записью падают
+            # с "database is locked", поэтому синхронные запросы выполняются по одному
+            self.stderr.write('SQLite: синхронный режим выполняется в один поток')
+
+        results = {}
+        with temporary_database(), override_settings(THROTTLE_ENABLED=False):
+            test = create_exam(options['questions'])
+            questions = json.loads(views.build_student_questions_payload(test))
+            answers = [(q['id'], sample_answer(q)) for q in questions]
+            for mode in ('sync', 'async'):
+                users = self.create_students(mode, options['students'])
+                urlconf = build_urlconf(views if mode == 'sync' else async_views)
+                with override_settings(ROOT_URLCONF=urlconf):
+                    if mode == 'sync':
+                        threads = 1 if connection.vendor == 'sqlite' else concurrency
+                        results[mode] = self.run_sync(users, test.public_uuid, answers, threads)
+                    else:
+                        results[mode] = asyncio.run(
+                            self.run_async(users, test.public_uuid, answers, concurrency))
+
+        for mode, result in results.items():
+            self.stdout.write(f"{mode:>5}: {result['requests']} запросов за {result['seconds']} с, "
+                              f"{result['rps']} запросов/с, ошибок {result['errors']}")
+            for endpoint, stats in result['endpoints'].items():
+                self.stdout.write(f"       {endpoint:<14} p50 {stats['p50_ms']} мс, p95 {stats['p95_ms']} мс")
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+
+    def create_students(self, mode, count):
+        CustomUser.objects.bulk_create([
+            CustomUser(email=f'bench-{mode}-{i}@example.com', role='student') for i in range(count)
+        ])
+        return list(CustomUser.objects.filter(email__startswith=f'bench-{mode}-'))
+
+    # --- Сценарий одного студента ---
+
+    def run_sync(self, users, uuid, answers, concurrency):
+        samples = defaultdict(list)
+
+        def timed(endpoint, call):
+            started = time.perf_counter()
+            response = call()
+            samples[endpoint].append((time.perf_counter() - started, response.status_code, None))
+            return response
+
+        def student(user):
+            client = Client()
+            client.force_login(user)
+            attempt_id = timed('start', lambda: client.post(f'/api/tests/{uuid}/start/')).json()['attempt_id']
+            timed('questions', lambda: client.get(f'/api/tests/{uuid}/questions/'))
+            for q_id, answer in answers:
+                timed('submit_answer', lambda: client.post(
+                    f'/api/tests/attempts/{attempt_id}/submit_answer/',
+                    {'question_id': q_id, 'selected_answer': answer}, content_type='application/json'))
+            timed('finish', lambda: client.post(f'/api/tests/attempts/{attempt_id}/finish/'))
+            connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(student, users))
+        return summarize(samples, time.perf_counter() - started)
+
+    async def run_async(self, users, uuid, answers, concurrency):
+        samples = defaultdict(list)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed(endpoint, call):
+            started = time.perf_counter()
+            response = await call
+            samples[endpoint].append((time.perf_counter() - started, response.status_code, None))
+            return response
+
+        async def student(user):
+            async with semaphore:
+                client = AsyncClient()
+                await sync_to_async(client.force_login)(user)
+                response = await timed('start', client.post(f'/api/tests/{uuid}/start/'))
+                attempt_id = response.json()['attempt_id']
+                await timed('questions', client.get(f'/api/tests/{uuid}/questions/'))
+                for q_id, answer in answers:
+                    await timed('submit_answer', client.post(
+                        f'/api/tests/attempts/{attempt_id}/submit_answer/',
+                        {'question_id': q_id, 'selected_answer': answer}, content_type='application/json'))
+                await timed('finish', client.post(f'/api/tests/attempts/{attempt_id}/finish/'))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(student(user) for user in users))
+        return summarize(samples, time.perf_counter() - started)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from tests.maintenance import delete_duplicate_answers
+from tests.models import TestAttempt, UserAnswer
+
+
+class Command(BaseCommand):
+    help = ('Удаляет повторные ответы на один вопрос в рамках попытки '
+            '(нужно перед миграцией с уникальным ограничением на UserAnswer)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Сколько строк удалять за раз')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать дубликаты')
+
+    def handle(self, *args, **options):
+        result = delete_duplicate_answers(
+            UserAnswer, TestAttempt, chunk_size=options['chunk_size'], dry_run=options['dry_run'])
+        if options['dry_run']:
+            self.stdout.write(f'Найдено дубликатов: {result}')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Удалено дубликатов: {result}'))
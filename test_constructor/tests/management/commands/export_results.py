@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tests.export import FORMATS, stream_results
+from tests.models import Test
+
+
+class Command(BaseCommand):
+    help = 'Выгружает результаты завершённых попыток теста в CSV или NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('test_id', type=int)
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--output', help='Файл для записи (по умолчанию - stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            test = Test.objects.get(id=options['test_id'])
+        except Test.DoesNotExist:
+            raise CommandError('Тест не найден')
+
+        chunks = stream_results(test, options['format'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                f.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tests.documents import iter_document
+from tests.models import Test
+
+
+class Command(BaseCommand):
+    help = 'Выгружает тест с вопросами JSON-документом (формат import_test)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('test_id', type=int)
+        parser.add_argument('--output', help='Файл для записи (по умолчанию - stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            test = Test.objects.get(id=options['test_id'])
+        except Test.DoesNotExist:
+            raise CommandError('Тест не найден')
+
+        chunks = iter_document(test)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,32 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tests.documents import DocumentError, import_document
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = 'Создаёт тест из JSON-документа (формат export_test); файл читается потоком'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="Путь к документу ('-' - stdin)")
+        parser.add_argument('--author', required=True, help='Email автора теста')
+
+    def handle(self, *args, **options):
+        try:
+            author = CustomUser.objects.get(email=options['author'])
+        except CustomUser.DoesNotExist:
+            raise CommandError('Автор не найден')
+
+        try:
+            if options['file'] == '-':
+                test = import_document(sys.stdin.buffer, author)
+            else:
+                with open(options['file'], 'rb') as f:
+                    test = import_document(f, author)
+        except DocumentError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Создан тест {test.id}: вопросов {test.question_count}, максимальный балл {test.max_score}'))
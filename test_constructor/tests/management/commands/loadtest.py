@@ -0,0 +1,169 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from tests.benchmarking import create_exam, sample_answer, summarize, temporary_database
+
+QUERY_COUNT_HEADER = 'X-Query-Count'
+
+
+class QueryCountingHandler(WSGIHandler):
+    """ WSGI-приложение проекта, которое отдаёт число SQL-запросов в заголовке ответа """
+
+    def __init__(self, serialize=False):
+        super().__init__()
+        # SQLite не переносит параллельных писателей - запросы к нему выполняем по одному
+        self.lock = threading.Lock() if serialize else None
+
+    def get_response(self, request):
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        if self.lock:
+            self.lock.acquire()
+        try:
+            with connection.execute_wrapper(count):
+                response = super().get_response(request)
+        finally:
+            if self.lock:
+                self.lock.release()
+        response[QUERY_COUNT_HEADER] = str(queries)
+        return response
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест: много студентов одновременно проходят тест через HTTP '
+            '(регистрация, вход, старт, вопросы, ответы, завершение). По умолчанию поднимает '
+            'локальный сервер на временной БД; с --base-url нагружает уже запущенный сервер.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=50, help='Сколько студентов проходят тест')
+        parser.add_argument('--concurrency', type=int, default=10, help='Сколько студентов работают одновременно')
+        parser.add_argument('--questions', type=int, default=20, help='Вопросов в тесте (локальный режим)')
+        parser.add_argument('--answers', type=int, help='Сколько ответов отправляет студент (по умолчанию - на все)')
+        parser.add_argument('--base-url', help='Адрес запущенного сервера, например http://127.0.0.1:8000')
+        parser.add_argument('--test-uuid', help='Ссылка (public_uuid) теста на сервере из --base-url')
+        parser.add_argument('--output', help='Записать результаты в JSON-файл')
+
+    def handle(self, *args, **options):
+        if options['base_url']:
+            if not options['test_uuid']:
+                raise CommandError('С --base-url нужно указать --test-uuid')
+            result = self.run(options['base_url'].rstrip('/'), options['test_uuid'], options)
+        else:
+            # Все студенты приходят с одного адреса - лимиты запросов здесь только мешают
+            with temporary_database(), override_settings(THROTTLE_ENABLED=False):
+                test = create_exam(options['questions'])
+                server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler)
+                server.set_app(QueryCountingHandler(serialize=connection.vendor == 'sqlite'))
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+                try:
+                    base_url = 'http://127.0.0.1:%d' % server.server_address[1]
+                    result = self.run(base_url, str(test.public_uuid), options)
+                finally:
+                    server.shutdown()
+                    server.server_close()
+
+        self.report(result)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Результаты записаны в {options['output']}")
+
+    def run(self, base_url, test_uuid, options):
+        samples = defaultdict(list)
+        run_id = timezone.now().strftime('%Y%m%d%H%M%S')
+
+        def student(number):
+            session = StudentSession(base_url, samples)
+            email = f'load-{run_id}-{number}@example.com'
+            password = 'load-test-password'
+            session.request('register', 'POST', '/api/register/', {'email': email, 'password': password})
+            session.request('login', 'POST', '/api/login/', {'email': email, 'password': password})
+            started = session.request('start', 'POST', f'/api/tests/{test_uuid}/start/')
+            if not started or 'attempt_id' not in started:
+                return
+            attempt_id = started['attempt_id']
+            questions = session.request('questions', 'GET', f'/api/tests/{test_uuid}/questions/') or []
+            for question in questions[:options['answers']]:
+                session.request('submit_answer', 'POST', f'/api/tests/attempts/{attempt_id}/submit_answer/',
+                                {'question_id': question['id'], 'selected_answer': sample_answer(question)})
+            session.request('finish', 'POST', f'/api/tests/attempts/{attempt_id}/finish/')
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            list(pool.map(student, range(options['students'])))
+        result = summarize(samples, time.perf_counter() - started)
+
+        return {
+            'started_at': timezone.now().isoformat(),
+            'base_url': base_url if options['base_url'] else 'local',
+            'database': connection.vendor,
+            'students': options['students'],
+            'concurrency': options['concurrency'],
+            'answers_per_student': options['answers'],
+            **result,
+        }
+
+    def report(self, result):
+        self.stdout.write(f"{result['requests']} запросов за {result['seconds']} с: "
+                          f"{result['rps']} запросов/с, ошибок {result['errors']}")
+        self.stdout.write(f"{'эндпоинт':<14} {'кол-во':>7} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} {'SQL':>6}")
+        for endpoint, stats in result['endpoints'].items():
+            queries = '-' if stats['queries_avg'] is None else stats['queries_avg']
+            self.stdout.write(f"{endpoint:<14} {stats['count']:>7} {stats['p50_ms']:>9} "
+                              f"{stats['p95_ms']:>9} {stats['p99_ms']:>9} {queries:>6}")
+
+
+class StudentSession:
+    """ HTTP-клиент одного студента со своими куками (сессия) """
+
+    def __init__(self, base_url, samples):
+        self.base_url = base_url
+        self.samples = samples
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+
+    def request(self, endpoint, method, path, data=None):
+        """ Выполнить запрос, записать задержку/статус/число SQL и вернуть разобранный JSON (или None) """
+        body = json.dumps(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method,
+                                     headers={'Content-Type': 'application/json'})
+        started = time.perf_counter()
+        try:
+            with self.opener.open(req) as response:
+                status, headers, content = response.status, response.headers, response.read()
+        except urllib.error.HTTPError as e:
+            status, headers, content = e.code, e.headers, e.read()
+        except OSError:
+            status, headers, content = 599, {}, b''
+        elapsed = time.perf_counter() - started
+
+        queries = headers.get(QUERY_COUNT_HEADER)
+        self.samples[endpoint].append((elapsed, status, int(queries) if queries else None))
+        if status >= 400:
+            return None
+        try:
+            return json.loads(content)
+        except ValueError:
+            return None
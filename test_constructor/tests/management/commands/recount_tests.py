@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from tests.models import Test
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает Test.question_count и Test.max_score по таблице вопросов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('test_ids', nargs='*', type=int, help='ID тестов (по умолчанию - все тесты)')
+
+    def handle(self, *args, **options):
+        test_ids = options['test_ids'] or None
+        updated = Test.recount_questions(test_ids)
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано тестов: {updated}'))
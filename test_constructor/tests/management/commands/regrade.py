@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tests.models import RegradeJob, Test
+from tests.regrade import DEFAULT_CHUNK_SIZE, create_job, run_job
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает баллы ответов на тест по текущим ключам (с возможностью продолжить прерванный пересчёт)'
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--test', type=int, help='ID теста: создать новый регрейд')
+        target.add_argument('--job', type=int, help='ID регрейда: продолжить с сохранённой позиции')
+        parser.add_argument('--questions', type=int, nargs='*', help='Только эти вопросы (по умолчанию все)')
+        parser.add_argument('--workers', type=int, default=1, help='Количество процессов для проверки')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options['job']:
+            try:
+                job = RegradeJob.objects.get(id=options['job'])
+            except RegradeJob.DoesNotExist:
+                raise CommandError('Регрейд не найден')
+            if job.status == 'done':
+                raise CommandError('Регрейд уже завершён')
+        else:
+            try:
+                test = Test.objects.get(id=options['test'])
+            except Test.DoesNotExist:
+                raise CommandError('Тест не найден')
+            job = create_job(test, options['questions'])
+
+        self.stdout.write(f'Регрейд #{job.id}: ответов к проверке {job.total}')
+
+        def progress(job):
+            self.stdout.write(f'  проверено {job.processed}/{job.total}, изменено {job.changed}, '
+                              f'последний id {job.last_answer_id}')
+
+        run_job(job, chunk_size=options['chunk_size'], workers=options['workers'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f'Готово: проверено {job.processed}, изменено {job.changed}'))
@@ -0,0 +1,38 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from tests.sweeper import DEFAULT_CHUNK_SIZE, sweep
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = ('Завершает попытки, у которых истёк лимит времени (finished_at = крайний срок). '
+            'Без --loop проходит один раз (для cron), с --loop работает постоянно.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Сколько попыток закрывать одним UPDATE')
+        parser.add_argument('--loop', action='store_true', help='Повторять проход каждые --interval секунд')
+        parser.add_argument('--interval', type=float, default=30, help='Пауза между проходами в режиме --loop')
+
+    def handle(self, *args, **options):
+        if not options['loop']:
+            finished = sweep(chunk_size=options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(f'Завершено попыток: {finished}'))
+            return
+
+        while True:
+            # Долгоживущий процесс: не держим соединение, которое БД могла закрыть
+            close_old_connections()
+            try:
+                finished = sweep(chunk_size=options['chunk_size'])
+            except Exception:
+                logger.exception('Ошибка при завершении просроченных попыток')
+            else:
+                if finished:
+                    self.stdout.write(f'Завершено попыток: {finished}')
+            time.sleep(options['interval'])
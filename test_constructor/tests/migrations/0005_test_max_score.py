@@ -0,0 +1,30 @@
+# Generated by Django 4.2.26 on 2026-10-18 06:21
+
+from django.db import migrations, models
+from django.db.models import IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_max_score(apps, schema_editor):
+    Test = apps.get_model('tests', 'Test')
+    Question = apps.get_model('tests', 'Question')
+
+    points_sum = Question.objects.filter(test=OuterRef('pk')).order_by().values('test').annotate(
+        s=Sum('points')).values('s')
+    Test.objects.update(max_score=Coalesce(Subquery(points_sum, output_field=IntegerField()), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0004_test_content_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='test',
+            name='max_score',
+            field=models.PositiveIntegerField(default=0, verbose_name='Максимальный балл'),
+        ),
+        migrations.RunPython(fill_max_score, migrations.RunPython.noop),
+    ]
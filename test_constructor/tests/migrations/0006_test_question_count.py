@@ -0,0 +1,30 @@
+# Generated by Django 4.2.26 on 2026-10-18 06:21
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_question_count(apps, schema_editor):
+    Test = apps.get_model('tests', 'Test')
+    Question = apps.get_model('tests', 'Question')
+
+    questions_count = Question.objects.filter(test=OuterRef('pk')).order_by().values('test').annotate(
+        c=Count('id')).values('c')
+    Test.objects.update(question_count=Coalesce(Subquery(questions_count, output_field=IntegerField()), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0005_test_max_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='test',
+            name='question_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество вопросов'),
+        ),
+        migrations.RunPython(fill_question_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,108 @@
+# Generated by Django 4.2.26 on 2026-10-18 06:21
+
+from django.db import migrations, models, transaction
+from django.db.models import Exists, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+DEDUPE_CHUNK_SIZE = 1000
+
+
+def dedupe_answers(apps, schema_editor):
+    """
+    Удалить повторные ответы на вопрос в рамках попытки (оставляем самый поздний),
+    иначе уникальный индекс не построится. Баллы затронутых завершённых попыток пересчитываются.
+    На больших базах лучше заранее запустить: python manage.py dedupe_answers
+    """
+    UserAnswer = apps.get_model('tests', 'UserAnswer')
+    TestAttempt = apps.get_model('tests', 'TestAttempt')
+    db = schema_editor.connection.alias
+
+    newer = UserAnswer.objects.using(db).filter(
+        attempt=OuterRef('attempt'), question=OuterRef('question'), id__gt=OuterRef('id'))
+    duplicates = UserAnswer.objects.using(db).filter(Exists(newer)).order_by('id')
+    points_sum = UserAnswer.objects.using(db).filter(attempt=OuterRef('pk')).order_by().values('attempt').annotate(
+        s=Sum('points_awarded')).values('s')
+
+    while True:
+        chunk = list(duplicates.values_list('id', 'attempt_id')[:DEDUPE_CHUNK_SIZE])
+        if not chunk:
+            break
+        with transaction.atomic(using=db):
+            UserAnswer.objects.using(db).filter(id__in=[answer_id for answer_id, _ in chunk]).delete()
+            TestAttempt.objects.using(db).filter(
+                id__in={attempt_id for _, attempt_id in chunk}, status='finished',
+            ).update(total_score=Coalesce(Subquery(points_sum, output_field=IntegerField()), Value(0)))
+
+
+class AddIndexConcurrently(migrations.AddIndex):
+    """
+    AddIndex, который на PostgreSQL строит индекс через CREATE INDEX CONCURRENTLY
+    (без блокировки записи в таблицу на время построения). На других БД - обычный AddIndex.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            # Прерванное построение оставляет невалидный индекс - при повторном запуске убираем его
+            schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS %s' % schema_editor.quote_name(self.index.name))
+            schema_editor.add_index(model, self.index, concurrently=True)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_index(model, self.index, concurrently=True)
+
+
+class AddUniqueConstraintConcurrently(migrations.AddConstraint):
+    """
+    AddConstraint для UniqueConstraint по полям: на PostgreSQL сначала строит уникальный индекс
+    CONCURRENTLY, затем превращает его в ограничение (ADD CONSTRAINT ... USING INDEX - без
+    повторного сканирования таблицы). На других БД - обычный AddConstraint.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        quote = schema_editor.quote_name
+        table = quote(model._meta.db_table)
+        name = quote(self.constraint.name)
+        columns = ', '.join(quote(model._meta.get_field(field).column) for field in self.constraint.fields)
+        schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS %s' % name)
+        schema_editor.execute('CREATE UNIQUE INDEX CONCURRENTLY %s ON %s (%s)' % (name, table, columns))
+        schema_editor.execute('ALTER TABLE %s ADD CONSTRAINT %s UNIQUE USING INDEX %s' % (table, name, name))
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('tests', '0006_test_question_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_answers, migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name='testattempt',
+            index=models.Index(fields=['user', 'test', 'status'], name='attempt_user_test_status_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='testattempt',
+            index=models.Index(fields=['user', '-started_at', '-id'], name='attempt_user_started_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='testattempt',
+            index=models.Index(condition=models.Q(('status', 'in_progress')), fields=['user', 'test'], name='attempt_in_progress_idx'),
+        ),
+        AddUniqueConstraintConcurrently(
+            model_name='useranswer',
+            constraint=models.UniqueConstraint(fields=('attempt', 'question'), name='unique_answer_per_question'),
+        ),
+    ]
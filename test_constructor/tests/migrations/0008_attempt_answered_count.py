@@ -0,0 +1,33 @@
+# Generated by Django 4.2.26 on 2026-10-18 06:22
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_running_score(apps, schema_editor):
+    TestAttempt = apps.get_model('tests', 'TestAttempt')
+    UserAnswer = apps.get_model('tests', 'UserAnswer')
+
+    answers = UserAnswer.objects.filter(attempt=OuterRef('pk')).order_by().values('attempt')
+    TestAttempt.objects.update(answered_count=Coalesce(
+        Subquery(answers.annotate(c=Count('id')).values('c'), output_field=IntegerField()), Value(0)))
+    # У завершённых попыток total_score уже посчитан при завершении
+    TestAttempt.objects.filter(status='in_progress').update(total_score=Coalesce(
+        Subquery(answers.annotate(s=Sum('points_awarded')).values('s'), output_field=IntegerField()), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0007_attempt_indexes_answer_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testattempt',
+            name='answered_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Отвечено вопросов'),
+        ),
+        migrations.RunPython(fill_running_score, migrations.RunPython.noop),
+    ]
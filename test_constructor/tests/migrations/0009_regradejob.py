@@ -0,0 +1,31 @@
+# Generated by Django 4.2.26 on 2026-10-18 06:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0008_attempt_answered_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegradeJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question_ids', models.JSONField(blank=True, default=list)),
+                ('status', models.CharField(choices=[('pending', 'Ожидает'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=20)),
+                ('last_answer_id', models.BigIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Ответов к проверке')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Проверено')),
+                ('changed', models.PositiveIntegerField(default=0, verbose_name='Изменено')),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='regrade_jobs', to='tests.test')),
+            ],
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.26 on 2026-10-18 06:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0009_regradejob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TestResultSummary',
+            fields=[
+                ('test', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='result_summary', serialize=False, to='tests.test')),
+                ('test_version', models.PositiveIntegerField(default=0)),
+                ('is_stale', models.BooleanField(default=False)),
+                ('finished_count', models.PositiveIntegerField(default=0)),
+                ('passed_count', models.PositiveIntegerField(default=0)),
+                ('score_sum', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ScoreBucketSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.PositiveSmallIntegerField()),
+                ('attempts_count', models.PositiveIntegerField(default=0)),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='score_buckets', to='tests.test')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QuestionResultSummary',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='result_summary', serialize=False, to='tests.question')),
+                ('answered_count', models.PositiveIntegerField(default=0)),
+                ('correct_count', models.PositiveIntegerField(default=0)),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='question_summaries', to='tests.test')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='scorebucketsummary',
+            constraint=models.UniqueConstraint(fields=('test', 'bucket'), name='unique_score_bucket'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.26 on 2026-10-18 06:40
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_deadlines(apps, schema_editor):
+    Test = apps.get_model('tests', 'Test')
+    TestAttempt = apps.get_model('tests', 'TestAttempt')
+
+    # Крайний срок нужен только незавершённым попыткам тестов с ограничением времени
+    limits = (Test.objects.filter(time_limit__gt=0, attempts__status='in_progress')
+              .order_by().values_list('time_limit', flat=True).distinct())
+    for time_limit in limits:
+        TestAttempt.objects.filter(status='in_progress', test__time_limit=time_limit).update(
+            deadline_at=F('started_at') + timedelta(seconds=time_limit))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0010_result_summaries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testattempt',
+            name='deadline_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Крайний срок'),
+        ),
+        migrations.RunPython(fill_deadlines, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='testattempt',
+            index=models.Index(condition=models.Q(('deadline_at__isnull', False), ('status', 'in_progress')), fields=['deadline_at'], name='attempt_deadline_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.26 on 2026-10-18 06:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0011_attempt_deadline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testattempt',
+            name='max_score',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Максимальный балл попытки'),
+        ),
+        migrations.AddField(
+            model_name='testattempt',
+            name='question_ids',
+            field=models.JSONField(blank=True, null=True, verbose_name='Вопросы попытки'),
+        ),
+        migrations.AddField(
+            model_name='testattempt',
+            name='seed',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='QuestionPool',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(blank=True, max_length=255, verbose_name='Название')),
+                ('draw_count', models.PositiveIntegerField(default=0, help_text='Сколько вопросов вытягивать (0 = все)')),
+                ('shuffle', models.BooleanField(default=False, verbose_name='Перемешивать вопросы пула')),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pools', to='tests.test')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='pool',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='questions', to='tests.questionpool'),
+        ),
+    ]
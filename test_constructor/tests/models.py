@@ -1,7 +1,15 @@
-from django.db import models
+import json
+
+from django.db import models, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.conf import settings
+from django.utils import timezone
+from datetime import timedelta
 import uuid
 
+from .grading import invalidate_answer_key
+
 
 class Test(models.Model):
     """
@@ -52,10 +60,104 @@ class Test(models.Model):
 
     public_uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, verbose_name="Публичная ссылка")
 
+    # Растёт при любом изменении теста или его вопросов (ключ кэша выдачи вопросов)
+    content_version = models.PositiveIntegerField(default=1)
+
+    # Денормализованные счётчики: поддерживаются при изменении вопросов (Question.save/delete),
+    # пересчитываются командой recount_tests
+    question_count = models.PositiveIntegerField(default=0, verbose_name="Количество вопросов")
+    max_score = models.PositiveIntegerField(default=0, verbose_name="Максимальный балл")
+
+    # Сдвигаются UPDATE ... F() (bump_content_version), поэтому полное сохранение их не пишет
+    COUNTER_FIELDS = ('content_version', 'question_count', 'max_score')
+
+    def save(self, *args, **kwargs):
+        if self._state.adding or kwargs.get('update_fields') is not None:
+            super().save(*args, **kwargs)
+            return
+        # Иначе устаревший объект перетёр бы счётчики, сдвинутые после его загрузки
+        kwargs['update_fields'] = [
+            f.name for f in self._meta.concrete_fields
+            if not f.primary_key and f.name not in self.COUNTER_FIELDS and f.name not in self.get_deferred_fields()
+        ]
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            Test.bump_content_version(self.pk)
+        self.refresh_from_db(fields=self.COUNTER_FIELDS + ('updated_at',))
+
+    @classmethod
+    def bump_content_version(cls, test_id, questions_delta=0, score_delta=0):
+        """ Отметить изменение вопросов теста и сдвинуть счётчики одним UPDATE """
+        cls.objects.filter(pk=test_id).update(
+            content_version=F('content_version') + 1,
+            updated_at=timezone.now(),
+            question_count=F('question_count') + questions_delta,
+            max_score=F('max_score') + score_delta,
+        )
+
+    @classmethod
+    def recount_questions(cls, test_ids=None):
+        """ Пересчитать question_count и max_score по таблице вопросов (один UPDATE) """
+        questions = Question.objects.filter(test=OuterRef('pk')).order_by().values('test')
+        tests = cls.objects.all() if test_ids is None else cls.objects.filter(pk__in=test_ids)
+        return tests.update(
+            question_count=Coalesce(Subquery(questions.annotate(c=Count('id')).values('c'),
+                                             output_field=IntegerField()), Value(0)),
+            max_score=Coalesce(Subquery(questions.annotate(s=Sum('points')).values('s'),
+                                        output_field=IntegerField()), Value(0)),
+        )
+
+    def pass_threshold(self, max_score=None):
+        """
+        Минимальный total_score для зачёта (None - тест сдать нельзя).
+        max_score - максимум конкретной попытки, если вопросы вытягивались из пулов.
+        """
+        if max_score is None:
+            max_score = self.max_score
+        if self.evaluation_method == 'percent':
+            if max_score <= 0:
+                return None
+            # total / max * 100 >= passing  <=>  total * 100 >= passing * max
+            return -(-self.passing_score * max_score // 100)
+        return self.passing_score
+
     def __str__(self):
         return self.title
 
 
+class QuestionPool(models.Model):
+    """
+    Пул вопросов теста: в попытку попадают draw_count случайных вопросов пула
+    (0 - все). Выбор делается при старте попытки по её seed (см. tests/pools.py).
+    """
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='pools')
+    title = models.CharField(max_length=255, blank=True, verbose_name="Название")
+    draw_count = models.PositiveIntegerField(default=0, help_text="Сколько вопросов вытягивать (0 = все)")
+    shuffle = models.BooleanField(default=False, verbose_name="Перемешивать вопросы пула")
+
+    def __str__(self):
+        return self.title or f"Пул {self.pk}"
+
+
+def answer_data_snapshot(answer_data):
+    return json.dumps(answer_data, sort_keys=True)
+
+
+class QuestionQuerySet(models.QuerySet):
+    def delete(self):
+        """ Удаление пачкой (в т.ч. действие админки): пересчитать счётчики затронутых тестов и поднять их версию """
+        with transaction.atomic(using=self.db):
+            test_ids = set(self.order_by().values_list('test_id', flat=True).distinct())
+            result = super().delete()
+            Test.recount_questions(test_ids)
+            for test_id in test_ids:
+                Test.bump_content_version(test_id)
+        return result
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
 class Question(models.Model):
     TYPE_CHOICES = (
         ('single', 'Один правильный ответ'),
@@ -70,6 +172,14 @@ class Question(models.Model):
         on_delete=models.CASCADE,
         related_name='questions'
     )
+    # Без пула вопрос входит в каждую попытку
+    pool = models.ForeignKey(
+        QuestionPool,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='questions'
+    )
 
     text = models.TextField(verbose_name="Текст вопроса")
     question_type = models.CharField(max_length=20, choices=TYPE_CHOICES, default='single')
@@ -80,9 +190,86 @@ class Question(models.Model):
 
     answer_data = models.JSONField(default=dict, blank=True)
 
+    # Увеличивается при каждом изменении answer_data (ключ кэша проверки ответов)
+    version = models.PositiveIntegerField(default=1)
+
+    objects = QuestionQuerySet.as_manager()
+
     class Meta:
         ordering = ['order_num']
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Значения из БД нужны, чтобы сдвинуть счётчики теста на разницу, а не пересчитывать их
+        instance._loaded_values = dict(zip(field_names, values))
+        if 'answer_data' in instance._loaded_values:
+            # Снимок, а не сам dict: правку answer_data на месте тоже надо заметить
+            instance._loaded_values['answer_data'] = answer_data_snapshot(instance.answer_data)
+        return instance
+
+    # Поля, из которых компилируется ключ проверки (tests/grading.py)
+    ANSWER_KEY_FIELDS = ('question_type', 'answer_data')
+
+    def answer_key_changed(self, update_fields=None):
+        """ Сохранение поменяет ключ проверки (значения из БД неизвестны - считаем, что поменяет) """
+        if self._state.adding:
+            return False
+        loaded = getattr(self, '_loaded_values', {})
+        deferred = self.get_deferred_fields()
+        fields = [f for f in self.ANSWER_KEY_FIELDS if f not in deferred]
+        if update_fields is not None:
+            fields = [f for f in fields if f in update_fields]
+        current = {'question_type': self.question_type, 'answer_data': answer_data_snapshot(self.answer_data)}
+        missing = object()
+        return any(loaded.get(f, missing) != current[f] for f in fields)
+
+    def save(self, *args, **kwargs):
+        # Баллы из JSON могут прийти строкой ("5"): приводим заранее - ниже по ним считается разница
+        self.points = self._meta.get_field('points').to_python(self.points)
+        adding = self._state.adding
+        loaded = getattr(self, '_loaded_values', {})
+        key_changed = self.answer_key_changed(kwargs.get('update_fields'))
+        if not adding:
+            # version пишет только UPDATE ... F() ниже: иначе две правки, загрузившие одну версию,
+            # сначала записали бы её обратно и получили бы одинаковый номер после +1
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                update_fields = [f.name for f in self._meta.concrete_fields
+                                 if not f.primary_key and f.name not in self.get_deferred_fields()]
+            kwargs['update_fields'] = [f for f in update_fields if f != 'version']
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            if key_changed:
+                # Новая версия - новый ключ кэша проверки во всех процессах. Через F(), чтобы
+                # параллельные правки одного вопроса не получили одинаковый номер
+                questions = Question.objects.filter(pk=self.pk)
+                questions.update(version=F('version') + 1)
+                self.version = questions.values_list('version', flat=True).get()
+                question_id = self.pk
+                transaction.on_commit(lambda: invalidate_answer_key(question_id))
+            if adding:
+                Test.bump_content_version(self.test_id, questions_delta=1, score_delta=self.points)
+            elif loaded.get('test_id') == self.test_id and isinstance(loaded.get('points'), int):
+                Test.bump_content_version(self.test_id, score_delta=self.points - loaded['points'])
+            else:
+                # Вопрос перенесли в другой тест (или старые значения неизвестны)
+                test_ids = {self.test_id, loaded.get('test_id', self.test_id)}
+                Test.recount_questions(test_ids)
+                for test_id in test_ids:
+                    Test.bump_content_version(test_id)
+        self._loaded_values = {
+            'test_id': self.test_id, 'points': self.points,
+            'question_type': self.question_type, 'answer_data': answer_data_snapshot(self.answer_data),
+        }
+
+    def delete(self, *args, **kwargs):
+        points = getattr(self, '_loaded_values', {}).get('points', self.points)
+        with transaction.atomic(using=kwargs.get('using')):
+            result = super().delete(*args, **kwargs)
+            Test.bump_content_version(self.test_id, questions_delta=-1, score_delta=-points)
+        return result
+
     def __str__(self):
         return f"{self.text[:50]}..."
 
@@ -109,10 +296,48 @@ class TestAttempt(models.Model):
     )
 
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='in_progress')
+    # Текущий счёт: сдвигается при каждом ответе (см. save_answers в views)
     total_score = models.PositiveIntegerField(default=0, verbose_name="Набранный балл")
+    answered_count = models.PositiveIntegerField(default=0, verbose_name="Отвечено вопросов")
 
     started_at = models.DateTimeField(auto_now_add=True)
     finished_at = models.DateTimeField(null=True, blank=True)
+    # Крайний срок: начало + time_limit теста (None - без ограничения). По нему попытку закрывает sweep_attempts
+    deadline_at = models.DateTimeField(null=True, blank=True, verbose_name="Крайний срок")
+
+    # Вопросы, вытянутые из пулов при старте (по порядку), и их сумма баллов.
+    # None - у теста нет пулов, попытка состоит из всех его вопросов
+    seed = models.PositiveIntegerField(null=True, blank=True)
+    question_ids = models.JSONField(null=True, blank=True, verbose_name="Вопросы попытки")
+    max_score = models.PositiveIntegerField(null=True, blank=True, verbose_name="Максимальный балл попытки")
+
+    class Meta:
+        indexes = [
+            # Поиск активной попытки студента по тесту
+            models.Index(fields=['user', 'test', 'status'], name='attempt_user_test_status_idx'),
+            # История попыток (keyset-пагинация по started_at, id)
+            models.Index(fields=['user', '-started_at', '-id'], name='attempt_user_started_idx'),
+            # Незавершённых попыток немного, поэтому частичный индекс маленький
+            models.Index(fields=['user', 'test'], condition=Q(status='in_progress'),
+                         name='attempt_in_progress_idx'),
+            # Просроченные попытки для sweep_attempts: только незавершённые с ограничением по времени
+            models.Index(fields=['deadline_at'], condition=Q(status='in_progress', deadline_at__isnull=False),
+                         name='attempt_deadline_idx'),
+        ]
+
+    @staticmethod
+    def deadline_for(test, started_at):
+        return started_at + timedelta(seconds=test.time_limit) if test.time_limit else None
+
+    def is_expired(self, now=None):
+        """ Время вышло (с запасом TESTS_DEADLINE_GRACE секунд на задержки сети) """
+        if self.deadline_at is None:
+            return False
+        return (now or timezone.now()) > self.deadline_at + timedelta(seconds=settings.TESTS_DEADLINE_GRACE)
+
+    def includes_question(self, question):
+        """ Вопрос входит в эту попытку (из её теста и, если были пулы, вытянут при старте) """
+        return question.test_id == self.test_id and (self.question_ids is None or question.id in self.question_ids)
 
     def __str__(self):
         return f"{self.user} - {self.test} ({self.status})"
@@ -134,5 +359,84 @@ class UserAnswer(models.Model):
     is_correct = models.BooleanField(default=False)
     points_awarded = models.PositiveIntegerField(default=0)
 
+    class Meta:
+        constraints = [
+            # Один ответ на вопрос в рамках попытки (перед миграцией см. команду dedupe_answers)
+            models.UniqueConstraint(fields=['attempt', 'question'], name='unique_answer_per_question'),
+        ]
+
+    def __str__(self):
+        return f"Ответ на {self.question_id}"
+
+
+class RegradeJob(models.Model):
+    """
+    Пересчёт баллов ответов на тест после исправления ключей.
+    Хранит позицию (last_answer_id), поэтому прерванный пересчёт можно продолжить.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Ожидает'),
+        ('running', 'Выполняется'),
+        ('done', 'Готово'),
+        ('failed', 'Ошибка'),
+    )
+
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='regrade_jobs')
+    # Пустой список - все вопросы теста
+    question_ids = models.JSONField(default=list, blank=True)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    last_answer_id = models.BigIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0, verbose_name="Ответов к проверке")
+    processed = models.PositiveIntegerField(default=0, verbose_name="Проверено")
+    changed = models.PositiveIntegerField(default=0, verbose_name="Изменено")
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
     def __str__(self):
-        return f"Ответ на {self.question_id}"
\ No newline at end of file
+        return f"Регрейд {self.test} ({self.status})"
+
+
+class TestResultSummary(models.Model):
+    """
+    Сводка результатов теста для аналитики.
+    Собирается агрегацией (tests.analytics.rebuild_summary) и дополняется при завершении попыток.
+    Если test_version отстаёт от Test.content_version или is_stale - сводка пересобирается.
+    """
+    test = models.OneToOneField(Test, on_delete=models.CASCADE, primary_key=True, related_name='result_summary')
+    test_version = models.PositiveIntegerField(default=0)
+    is_stale = models.BooleanField(default=False)
+
+    finished_count = models.PositiveIntegerField(default=0)
+    passed_count = models.PositiveIntegerField(default=0)
+    score_sum = models.PositiveBigIntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Сводка: {self.test}"
+
+
+class ScoreBucketSummary(models.Model):
+    """ Столбец гистограммы баллов: bucket = процент от max_score с шагом 10 (0..10) """
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='score_buckets')
+    bucket = models.PositiveSmallIntegerField()
+    attempts_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['test', 'bucket'], name='unique_score_bucket'),
+        ]
+
+
+class QuestionResultSummary(models.Model):
+    """ Сколько раз на вопрос ответили и сколько из них правильно (по завершённым попыткам) """
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, primary_key=True,
+                                    related_name='result_summary')
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='question_summaries')
+    answered_count = models.PositiveIntegerField(default=0)
+    correct_count = models.PositiveIntegerField(default=0)
+
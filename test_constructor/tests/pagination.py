@@ -0,0 +1,60 @@
+"""
+Keyset (cursor) пагинация по паре (поле даты, id) в порядке убывания.
+
+Курсор - это base64 от "<дата в ISO>|<id>" последней записи страницы.
+В отличие от OFFSET, следующая страница ищется по индексу и не "плывёт",
+если в начало списка добавились новые записи.
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class CursorError(ValueError):
+    pass
+
+
+def encode_cursor(value, pk):
+    raw = f'{value.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        value, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(value), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise CursorError('Неверный курсор')
+
+
+def get_page_size(request):
+    try:
+        size = int(request.GET.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise CursorError('Неверный limit')
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def keyset_queryset(queryset, field, cursor=None):
+    """ Упорядочить по (field, id) по убыванию и отрезать всё до курсора включительно """
+    queryset = queryset.order_by(f'-{field}', '-id')
+    if cursor:
+        value, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': pk}))
+    return queryset
+
+
+def keyset_page(queryset, request, field):
+    """ Одна страница: (список объектов, курсор следующей страницы или None) """
+    size = get_page_size(request)
+    rows = list(keyset_queryset(queryset, field, request.GET.get('cursor'))[:size + 1])
+    if len(rows) > size:
+        last = rows[size - 1]
+        return rows[:size], encode_cursor(getattr(last, field), last.id)
+    return rows, None
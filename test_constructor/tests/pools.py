@@ -0,0 +1,90 @@
+"""
+Пулы вопросов: какие вопросы попадают в попытку.
+
+При старте попытки генерируется seed, и по нему из каждого пула
+вытягивается draw_count вопросов (random.Random(seed) - выбор
+детерминирован: тот же seed и тот же банк вопросов дают тот же набор).
+Вопросы без пула входят всегда. Порядок - по order_num; в пулах с
+shuffle вытянутые вопросы перемешиваются между занятыми ими местами.
+
+Для выбора читаются только (id, pool_id, points) вопросов, поэтому даже
+на банке в тысячи вопросов старт попытки дешёвый. Результат сохраняется
+в TestAttempt.question_ids, и дальше выдача вопросов и проверка ответов
+работают только с этими id.
+"""
+import random
+import secrets
+from collections import defaultdict
+
+from django.db.models import Count
+
+from .models import Question, QuestionPool
+
+SEED_BITS = 31  # TestAttempt.seed - PositiveIntegerField
+
+
+def new_seed():
+    return secrets.randbits(SEED_BITS)
+
+
+def select_questions(questions, pools, seed):
+    """
+    questions - [(id, pool_id, points)] в порядке order_num,
+    pools - {pool_id: (draw_count, shuffle)}.
+    Возвращает (id вопросов попытки по порядку, сумма их баллов).
+    """
+    rng = random.Random(seed)
+    members = defaultdict(list)
+    for question in questions:
+        if question[1] is not None:
+            members[question[1]].append(question)
+
+    drawn = set()
+    shuffled = []
+    for pool_id in sorted(pools):
+        draw_count, shuffle = pools[pool_id]
+        candidates = members.get(pool_id, [])
+        if draw_count and draw_count < len(candidates):
+            candidates = rng.sample(candidates, draw_count)
+        ids = {question[0] for question in candidates}
+        drawn |= ids
+        if shuffle and len(ids) > 1:
+            shuffled.append(ids)
+
+    selected = [q for q in questions if q[1] is None or q[0] in drawn]
+    for ids in shuffled:
+        positions = [i for i, question in enumerate(selected) if question[0] in ids]
+        order = [selected[i] for i in positions]
+        rng.shuffle(order)
+        for i, question in zip(positions, order):
+            selected[i] = question
+    return [question[0] for question in selected], sum(question[2] for question in selected)
+
+
+def draw_questions(test, seed):
+    """ Вопросы попытки теста по seed: (question_ids, max_score) или (None, None), если у теста нет пулов """
+    pools = {pool_id: (draw_count, shuffle) for pool_id, draw_count, shuffle in
+             QuestionPool.objects.filter(test=test).values_list('id', 'draw_count', 'shuffle')}
+    if not pools:
+        return None, None
+    questions = list(Question.objects.filter(test=test).order_by('order_num', 'id').values_list(
+        'id', 'pool_id', 'points'))
+    return select_questions(questions, pools, seed)
+
+
+def attempt_question_count(test):
+    """ Сколько вопросов получит попытка: вопросы без пула плюс draw_count из каждого пула (не больше его размера) """
+    pools = list(QuestionPool.objects.filter(test=test).annotate(n=Count('questions')).values_list('draw_count', 'n'))
+    if not pools:
+        return test.question_count
+    drawn = sum(min(draw_count, n) if draw_count else n for draw_count, n in pools)
+    return Question.objects.filter(test=test, pool__isnull=True).count() + drawn
+
+
+def attempt_fields(test):
+    """ Поля новой TestAttempt, связанные с пулами """
+    seed = new_seed()
+    question_ids, max_score = draw_questions(test, seed)
+    if question_ids is None:
+        return {}
+    return {'seed': seed, 'question_ids': question_ids, 'max_score': max_score}
@@ -0,0 +1,229 @@
+"""
+Массовый пересчёт баллов (регрейд) после исправления ключей ответов.
+
+Ответы читаются пачками по возрастанию id, проверяются (при workers > 1 -
+в пуле процессов), изменившиеся строки записываются через bulk_update.
+После каждой пачки в RegradeJob сохраняется last_answer_id, поэтому
+прерванный регрейд продолжается с того же места.
+
+Проверка идёт без блокировок, а запись пачки - в транзакции под блокировкой
+попыток этой пачки (тот же порядок, что в save_answers: сначала попытка,
+потом её ответы). Под блокировкой ответы перечитываются: строки, чей
+selected_answer успел измениться, пропускаются - их уже проверил
+save_answers по новым ключам. Там же пересчитывается total_score
+затронутых попыток, поэтому счёт незавершённой попытки не расходится
+с её ответами.
+
+Регрейд из эндпоинта выполняется в потоке процесса; если процесс умер,
+задача остаётся в pending/running без обновлений. Живой регрейд обновляет
+updated_at на каждой пачке (до и после проверки), а задача без обновлений
+дольше REGRADE_STALE_SECONDS считается брошенной, и повторный POST
+продолжает её с сохранённой позиции. Если прежний исполнитель всё же жив,
+он это заметит при записи пачки (last_answer_id в БД ушёл вперёд) и
+остановится, не записав пачку второй раз.
+"""
+from datetime import timedelta
+
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import analytics, grading
+from .maintenance import recount_attempt_scores
+from .models import Question, RegradeJob, Test, TestAttempt, UserAnswer
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+class JobTakenOver(Exception):
+    """ Задачу, признанную брошенной, продолжает другой исполнитель """
+
+
+def create_job(test, question_ids=None):
+    job = RegradeJob(test=test, question_ids=sorted(question_ids or []))
+    job.total = answers_queryset(job).count()
+    job.save()
+    return job
+
+
+def answers_queryset(job):
+    answers = UserAnswer.objects.filter(question__test_id=job.test_id)
+    if job.question_ids:
+        answers = answers.filter(question_id__in=job.question_ids)
+    return answers
+
+
+def run_job(job, chunk_size=DEFAULT_CHUNK_SIZE, workers=1, progress=None):
+    """
+    Выполнить (или продолжить) регрейд.
+    progress(job) вызывается после каждой записанной пачки.
+    """
+    questions = Question.objects.filter(test_id=job.test_id)
+    if job.question_ids:
+        questions = questions.filter(id__in=job.question_ids)
+    keys = {q.id: (q.question_type, q.answer_data, q.points) for q in questions}
+
+    job.status = 'running'
+    job.error = ''
+    job.save(update_fields=['status', 'error', 'updated_at'])
+
+    executor, compiled = None, None
+    if workers > 1:
+        executor = ProcessPoolExecutor(workers, initializer=grading.init_worker, initargs=(keys,))
+    else:
+        compiled = grading.compile_keys(keys)
+
+    try:
+        answers = UserAnswer.objects.filter(question_id__in=list(keys)).order_by('id')
+        while True:
+            rows = list(answers.filter(id__gt=job.last_answer_id).values_list(
+                'id', 'attempt_id', 'question_id', 'selected_answer', 'is_correct', 'points_awarded')[:chunk_size])
+            if not rows:
+                break
+
+            heartbeat(job)
+            batch = [(answer_id, question_id, selected) for answer_id, _, question_id, selected, _, _ in rows]
+            graded = _grade(batch, executor, workers, compiled, job)
+            with transaction.atomic():
+                stored = RegradeJob.objects.select_for_update().only('last_answer_id').get(id=job.id)
+                if stored.last_answer_id != job.last_answer_id:
+                    raise JobTakenOver()
+                changed = _write_chunk(rows, graded)
+                job.last_answer_id = rows[-1][0]
+                job.processed += len(rows)
+                job.changed += changed
+                job.save(update_fields=['last_answer_id', 'processed', 'changed', 'updated_at'])
+
+            if progress:
+                progress(job)
+
+        analytics.mark_stale([job.test_id])
+    except JobTakenOver:
+        # Статус и ошибку теперь ведёт новый исполнитель
+        job.refresh_from_db()
+        return job
+    except Exception as e:
+        job.status = 'failed'
+        job.error = str(e)
+        job.save(update_fields=['status', 'error', 'updated_at'])
+        raise
+    finally:
+        if executor:
+            executor.shutdown()
+
+    job.status = 'done'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'finished_at', 'updated_at'])
+    return job
+
+
+def _write_chunk(rows, graded):
+    """
+    Записать результаты проверки пачки. Возвращает, сколько ответов изменено.
+    rows - строки, которые проверялись, graded - [(id, is_correct, points)].
+    """
+    read = {answer_id: (selected, (is_correct, points))
+            for answer_id, _, _, selected, is_correct, points in rows}
+    attempt_ids = sorted({attempt_id for _, attempt_id, _, _, _, _ in rows})
+
+    with transaction.atomic():
+        # Пока попытки заблокированы, их ответы и счёт не меняются
+        list(TestAttempt.objects.select_for_update().filter(id__in=attempt_ids).order_by('id').values_list('id'))
+        current = dict(UserAnswer.objects.filter(id__in=list(read)).values_list('id', 'selected_answer'))
+
+        changed = []
+        for answer_id, is_correct, points in graded:
+            selected, result = read[answer_id]
+            if answer_id not in current or current[answer_id] != selected:
+                continue  # ответ удалён или перезаписан и уже проверен по новым ключам
+            if result != (is_correct, points):
+                changed.append(UserAnswer(id=answer_id, is_correct=is_correct, points_awarded=points))
+
+        if changed:
+            UserAnswer.objects.bulk_update(changed, ['is_correct', 'points_awarded'], batch_size=500)
+            changed_ids = {answer.id for answer in changed}
+            touched = {attempt_id for answer_id, attempt_id, _, _, _, _ in rows if answer_id in changed_ids}
+            recount_attempt_scores(UserAnswer, TestAttempt, touched)
+    return len(changed)
+
+
+def heartbeat(job):
+    """ Отметить, что регрейд жив (иначе после REGRADE_STALE_SECONDS его сочтут брошенным) """
+    RegradeJob.objects.filter(id=job.id).update(updated_at=timezone.now())
+
+
+def start_job(test, question_ids=None):
+    """
+    Создать регрейд теста или продолжить брошенный и запустить его в фоне после коммита.
+    Возвращает (задача, запущена ли). Не запущена - значит, регрейд теста уже выполняется.
+    Строка теста блокируется, поэтому два одновременных запроса не создадут две задачи.
+    """
+    with transaction.atomic():
+        Test.objects.select_for_update().only('id').get(pk=test.pk)
+        job = test.regrade_jobs.filter(status__in=['pending', 'running']).first()
+        if job is not None and not (is_stale(job) and claim_stale(job)):
+            return job, False
+        if job is None:
+            job = create_job(test, question_ids)
+        else:
+            job.refresh_from_db()
+        job_id = job.id
+        transaction.on_commit(lambda: run_in_background(job_id))
+    return job, True
+
+
+def is_stale(job, now=None):
+    """ Задача в pending/running, которую давно никто не обновлял (выполнявший её процесс умер) """
+    cutoff = (now or timezone.now()) - timedelta(seconds=settings.REGRADE_STALE_SECONDS)
+    return job.status in ('pending', 'running') and job.updated_at < cutoff
+
+
+def claim_stale(job):
+    """
+    Забрать брошенную задачу на продолжение. Условный UPDATE по updated_at:
+    из нескольких одновременных запросов задачу получит только один.
+    """
+    claimed = RegradeJob.objects.filter(id=job.id, updated_at=job.updated_at).update(
+        status='pending', updated_at=timezone.now())
+    return claimed == 1
+
+
+def run_in_background(job_id):
+    """ Запустить регрейд в отдельном потоке (для эндпоинта; упавший можно продолжить командой regrade --job) """
+    def target():
+        try:
+            run_job(RegradeJob.objects.get(id=job_id))
+        except Exception:
+            pass  # ошибка уже сохранена в job.error
+        finally:
+            connection.close()
+
+    threading.Thread(target=target, daemon=True).start()
+
+
+def job_data(job):
+    return {
+        'job_id': job.id,
+        'status': job.status,
+        'total': job.total,
+        'processed': job.processed,
+        'changed': job.changed,
+        'error': job.error,
+        'created_at': job.created_at.strftime('%Y-%m-%d %H:%M'),
+        'finished_at': job.finished_at.strftime('%Y-%m-%d %H:%M') if job.finished_at else None,
+    }
+
+
+def _grade(batch, executor, workers, compiled, job):
+    if executor is None:
+        return grading.grade_rows(batch, compiled)
+    size = -(-len(batch) // workers)
+    parts = [batch[i:i + size] for i in range(0, len(batch), size)]
+    graded = []
+    for part in executor.map(grading.grade_rows, parts):
+        graded.extend(part)
+        heartbeat(job)
+    return graded
@@ -0,0 +1,57 @@
+"""
+Автозавершение просроченных попыток (команда sweep_attempts).
+
+Просроченные попытки ищутся по частичному индексу attempt_deadline_idx
+(status='in_progress' и deadline_at задан) и закрываются пачками: один
+UPDATE на пачку выставляет статус и finished_at = deadline_at. Баллы
+пересчитывать не нужно - total_score / answered_count незавершённой
+попытки и так ведутся на каждом ответе (save_answers).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from test_constructor import metrics
+
+from . import analytics
+from .models import TestAttempt
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+def expired_attempts(now=None):
+    """ Незавершённые попытки, у которых крайний срок (с запасом на задержки) уже прошёл """
+    cutoff = (now or timezone.now()) - timedelta(seconds=settings.TESTS_DEADLINE_GRACE)
+    return TestAttempt.objects.filter(status='in_progress', deadline_at__lt=cutoff)
+
+
+def finish_expired_chunk(now=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """ Закрыть одну пачку просроченных попыток. Возвращает, сколько закрыто """
+    ids = list(expired_attempts(now).order_by('deadline_at').values_list('id', flat=True)[:chunk_size])
+    if not ids:
+        return 0
+
+    with transaction.atomic():
+        # status='in_progress' ещё раз: попытку могли завершить, пока мы выбирали id
+        finished = TestAttempt.objects.filter(id__in=ids, status='in_progress').update(
+            status='finished', finished_at=F('deadline_at'))
+        test_ids = set(TestAttempt.objects.filter(id__in=ids).values_list('test_id', flat=True))
+        analytics.mark_stale(test_ids)
+
+    metrics.ATTEMPTS_EXPIRED.inc(finished)
+    return finished
+
+
+def sweep(now=None, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """ Закрыть все просроченные попытки пачками. progress(закрыто_всего) - после каждой пачки """
+    total = 0
+    while True:
+        finished = finish_expired_chunk(now, chunk_size)
+        if not finished:
+            return total
+        total += finished
+        if progress:
+            progress(total)
@@ -1,3 +1,690 @@
-from django.test import TestCase
+import io
+import json
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import connections
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from test_constructor import db_router, throttling
+from test_constructor.middleware import ReplicaRoutingMiddleware
+from users.models import CustomUser
+
+from . import grading, pools, sweeper
+from .documents import DocumentError, StreamReader
+from .models import Question, QuestionPool, Test, TestAttempt, UserAnswer
+from .pagination import decode_cursor, encode_cursor
+from .views import AttemptExpired, check_user_answer, save_answers
+
+
+class SplitStream:
+    """ Поток, который отдаёт заранее заданные куски (независимо от запрошенного размера) """
+
+    def __init__(self, *parts):
+        self.parts = [part for part in parts if part]  # пустой кусок - это конец потока
+
+    def read(self, size=-1):
+        return self.parts.pop(0) if self.parts else b''
+
+
+def read_object(stream, chunk_size=1):
+    reader = StreamReader(stream, chunk_size=chunk_size)
+    return {key: reader.value() for key in reader.object_items()}
+
+
+class StreamReaderTests(SimpleTestCase):
+    DOCUMENTS = [
+        {'a': 1e5},
+        {'a': 12345, 'b': -0.5, 'c': 1.25e-10, 'd': 6e+30, 'e': -7},
+        {'a': 'строка с «кавычками» и ✓', 'b': '"экранирование"\n', 'c': '😀'},
+        {'a': [1, 2.5, 3e2, True, False, None], 'b': {'c': 10}},
+    ]
+
+    def assertReads(self, data, expected):
+        for offset in range(len(data) + 1):
+            with self.subTest(data=data, offset=offset):
+                self.assertEqual(read_object(SplitStream(data[:offset], data[offset:])), expected)
+        for chunk_size in (1, 2, 3):
+            with self.subTest(data=data, chunk_size=chunk_size):
+                self.assertEqual(read_object(io.BytesIO(data), chunk_size), expected)
+
+    def test_split_at_every_offset(self):
+        for document in self.DOCUMENTS:
+            for text in (json.dumps(document, ensure_ascii=False), json.dumps(document, separators=(',', ':'))):
+                self.assertReads(text.encode('utf-8'), document)
+
+    def test_number_split_inside_exponent(self):
+        # «1e5», разрезанное после «1e», раньше разбиралось как 1 и падало на «e»
+        self.assertEqual(read_object(SplitStream(b'{"a": 1e', b'5}')), {'a': 1e5})
+        self.assertEqual(read_object(SplitStream(b'{"a": 1.', b'5}')), {'a': 1.5})
+        self.assertEqual(read_object(io.BytesIO(b'{"a": 1e5}'), chunk_size=2), {'a': 1e5})
+
+    def test_number_at_end_of_stream(self):
+        reader = StreamReader(SplitStream(b'12', b'34'), chunk_size=1)
+        self.assertEqual(reader.value(), 1234)
+
+    def test_str_stream(self):
+        self.assertEqual(read_object(io.StringIO('{"a": "ё", "b": 1e5}')), {'a': 'ё', 'b': 1e5})
+
+    def test_invalid_json(self):
+        for data in (b'{"a": 1e}', b'{"a": 1 2}', '{"a": "ё"}'.encode('cp1251')):
+            with self.subTest(data=data):
+                with self.assertRaises(DocumentError):
+                    read_object(io.BytesIO(data))
+
+
+def create_exam(email='author@example.com', **test_fields):
+    """ Тест из трёх вопросов (2, 3 и 5 баллов) и его автор """
+    author = CustomUser.objects.create_user(email=email, password='x', role='employer')
+    test = Test.objects.create(title='Экзамен', author=author, **test_fields)
+    questions = [
+        Question.objects.create(test=test, text='single', question_type='single', points=2, order_num=1,
+                                answer_data={'options': [{'id': 1, 'is_correct': True}, {'id': 2}]}),
+        Question.objects.create(test=test, text='multi', question_type='multi', points=3, order_num=2,
+                                answer_data={'options': [{'id': 1, 'is_correct': True}, {'id': 2, 'is_correct': True}]}),
+        Question.objects.create(test=test, text='input', question_type='input', points=5, order_num=3,
+                                answer_data={'correct_answers': ['Ответ']}),
+    ]
+    return author, Test.objects.get(pk=test.pk), questions
+
+
+def post_json(client, url, data=None):
+    response = client.post(url, json.dumps(data or {}), content_type='application/json')
+    return response, response.json()
+
+
+def legacy_check_user_answer(question, user_answer_json):
+    """ Проверка ответа до кэша скомпилированных ключей - эталон для сравнения """
+    q_type = question.question_type
+    db_data = question.answer_data
+
+    if q_type == 'single':
+        for opt in db_data.get('options', []):
+            if opt['id'] == user_answer_json and opt.get('is_correct'):
+                return True, question.points
+    elif q_type == 'multi':
+        if not isinstance(user_answer_json, list): return False, 0
+        user_ids = set(user_answer_json)
+        correct_ids = {opt['id'] for opt in db_data.get('options', []) if opt.get('is_correct')}
+        if user_ids == correct_ids: return True, question.points
+    elif q_type == 'input':
+        user_text = str(user_answer_json).strip()
+        correct_list = db_data.get('correct_answers', [])
+        is_strict = db_data.get('case_sensitive', False)
+        if is_strict:
+            if user_text in correct_list: return True, question.points
+        else:
+            if user_text.lower() in [c.lower() for c in correct_list]: return True, question.points
+    elif q_type == 'match':
+        if user_answer_json == db_data.get('correct_matches', {}):
+            return True, question.points
+    elif q_type == 'sequence':
+        correct_order_ids = [i['id'] for i in sorted(db_data.get('items', []), key=lambda x: x['correct_order'])]
+        if user_answer_json == correct_order_ids:
+            return True, question.points
+
+    return False, 0
+
+
+class AnswerKeyParityTests(SimpleTestCase):
+    """ Скомпилированные ключи проверяют так же, как прежний check_user_answer """
+    QUESTIONS = [
+        ('single', {'options': [{'id': 1, 'is_correct': True}, {'id': 2}]}),
+        ('single', {'options': [{'id': 1}, {'id': 2}]}),
+        ('single', {'options': [{'id': 'a', 'is_correct': True}, {'id': 'b', 'is_correct': True}]}),
+        ('multi', {'options': [{'id': 1, 'is_correct': True}, {'id': 2, 'is_correct': True}, {'id': 3}]}),
+        ('multi', {'options': [{'id': 1}]}),
+        ('input', {'correct_answers': ['Ответ', 'Answer'], 'case_sensitive': False}),
+        ('input', {'correct_answers': ['Ответ'], 'case_sensitive': True}),
+        ('input', {}),
+        ('match', {'correct_matches': {'ru': 'mos', 'de': 'ber'}}),
+        ('sequence', {'items': [{'id': 1, 'correct_order': 2}, {'id': 2, 'correct_order': 1}]}),
+    ]
+    ANSWERS = [
+        None, 0, 1, 2, 3, True, 1.0, 'a', 'b', ' ответ ', 'Ответ', 'ОТВЕТ', 'answer', '',
+        [], [1], [2, 1], [1, 2], [1, 2, 3], [1, 1, 2], ['a'], ['a', 'b'],
+        {}, {'ru': 'mos'}, {'ru': 'mos', 'de': 'ber'}, {'de': 'ber', 'ru': 'mos'},
+    ]
+
+    def setUp(self):
+        grading._cache.clear()
+
+    def test_same_result_as_legacy_check(self):
+        for index, (question_type, answer_data) in enumerate(self.QUESTIONS):
+            question = Question(id=index + 1, version=1, question_type=question_type,
+                                answer_data=answer_data, points=3)
+            for answer in self.ANSWERS:
+                with self.subTest(question_type=question_type, answer_data=answer_data, answer=answer):
+                    self.assertEqual(check_user_answer(question, answer),
+                                     legacy_check_user_answer(question, answer))
+
+    def test_unhashable_answer_is_wrong_not_error(self):
+        # Прежняя проверка падала на set() от вложенных списков; теперь такой ответ просто неверный
+        question = Question(id=1, version=1, question_type='multi',
+                            answer_data={'options': [{'id': 1, 'is_correct': True}]}, points=1)
+        self.assertEqual(check_user_answer(question, [[1]]), (False, 0))
+        question = Question(id=2, version=1, question_type='single',
+                            answer_data={'options': [{'id': 1, 'is_correct': True}]}, points=1)
+        self.assertEqual(check_user_answer(question, [1]), (False, 0))
+
+
+class AnswerKeyCacheTests(TestCase):
+    def setUp(self):
+        grading._cache.clear()
+        author = CustomUser.objects.create_user(email='author@example.com', password='x', role='employer')
+        self.test = Test.objects.create(title='Тест', author=author)
+        self.question = Question.objects.create(
+            test=self.test, text='?', question_type='single', points=2,
+            answer_data={'options': [{'id': 1, 'is_correct': True}, {'id': 2}]})
+
+    def edit(self, answer_data):
+        question = Question.objects.get(pk=self.question.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            question.answer_data = answer_data
+            question.save()
+        return Question.objects.get(pk=self.question.pk)
+
+    def test_edit_bumps_version_and_invalidates_key(self):
+        self.assertEqual(check_user_answer(self.question, 1), (True, 2))
+        old_key = (self.question.id, self.question.version)
+        self.assertIn(old_key, grading._cache)
+
+        question = self.edit({'options': [{'id': 1}, {'id': 2, 'is_correct': True}]})
+        self.assertEqual(question.version, self.question.version + 1)
+        self.assertNotIn(old_key, grading._cache)
+        self.assertEqual(check_user_answer(question, 1), (False, 0))
+        self.assertEqual(check_user_answer(question, 2), (True, 2))
+
+    def test_in_place_change_is_detected(self):
+        question = Question.objects.get(pk=self.question.pk)
+        question.answer_data['options'][1]['is_correct'] = True
+        question.save()
+        self.assertEqual(Question.objects.get(pk=self.question.pk).version, self.question.version + 1)
+
+    def test_text_edit_keeps_version(self):
+        question = Question.objects.get(pk=self.question.pk)
+        question.text = 'Новый текст'
+        question.save()
+        self.assertEqual(Question.objects.get(pk=self.question.pk).version, self.question.version)
+
+    def test_stale_object_does_not_reuse_version(self):
+        first = Question.objects.get(pk=self.question.pk)
+        second = Question.objects.get(pk=self.question.pk)
+        first.answer_data = {'options': [{'id': 2, 'is_correct': True}]}
+        first.save()
+        second.answer_data = {'options': [{'id': 1, 'is_correct': True}, {'id': 2, 'is_correct': True}]}
+        second.save()
+        self.assertNotEqual(first.version, second.version)
+        self.assertEqual(Question.objects.get(pk=self.question.pk).version, second.version)
+
+
+class AttemptScoreTests(TestCase):
+    """ Счёт попытки сдвигается на каждом ответе и при завершении не пересчитывается """
+
+    def setUp(self):
+        _, self.test, self.questions = create_exam()
+        self.student = CustomUser.objects.create_user(email='student@example.com', password='x', role='student')
+        self.client.force_login(self.student)
+        self.attempt_id = post_json(self.client, f'/api/tests/{self.test.public_uuid}/start/')[1]['attempt_id']
+
+    def submit(self, question, answer):
+        return post_json(self.client, f'/api/tests/attempts/{self.attempt_id}/submit_answer/',
+                         {'question_id': question.id, 'selected_answer': answer})[1]
+
+    def submit_many(self, answers):
+        return post_json(self.client, f'/api/tests/attempts/{self.attempt_id}/submit_answers/', {'answers': [
+            {'question_id': question.id, 'selected_answer': answer} for question, answer in answers]})[1]
+
+    def assertScoreMatchesAnswers(self):
+        attempt = TestAttempt.objects.get(pk=self.attempt_id)
+        answers = UserAnswer.objects.filter(attempt_id=self.attempt_id)
+        self.assertEqual(attempt.total_score, answers.aggregate(s=Sum('points_awarded'))['s'] or 0)
+        self.assertEqual(attempt.answered_count, answers.count())
+        return attempt
+
+    def test_reanswer_replaces_points(self):
+        single = self.questions[0]
+        self.assertEqual(self.submit(single, 1)['total_score'], 2)
+        result = self.submit(single, 2)
+        self.assertEqual((result['total_score'], result['answered_count']), (0, 1))
+        result = self.submit(single, 1)
+        self.assertEqual((result['total_score'], result['answered_count']), (2, 1))
+        self.assertScoreMatchesAnswers()
+
+    def test_duplicate_question_in_batch_keeps_last_answer(self):
+        single, multi, _ = self.questions
+        result = self.submit_many([(single, 2), (multi, [1, 2]), (single, 1)])
+        self.assertEqual([item['status'] for item in result['results']], ['accepted'] * 3)
+        self.assertEqual((result['total_score'], result['answered_count']), (5, 2))
+        self.assertEqual(UserAnswer.objects.filter(attempt_id=self.attempt_id, question=single).count(), 1)
+        self.assertScoreMatchesAnswers()
+
+    def test_batch_reanswer_after_single_answers(self):
+        single, multi, text = self.questions
+        self.submit(single, 1)
+        self.submit(text, 'ответ')
+        result = self.submit_many([(text, 'нет'), (multi, [2, 1])])
+        self.assertEqual((result['total_score'], result['answered_count']), (5, 3))
+        self.assertScoreMatchesAnswers()
+
+    def test_finish_returns_sum_of_answers(self):
+        single, multi, text = self.questions
+        self.submit_many([(single, 1), (multi, [1]), (text, ' Ответ ')])
+        self.submit(multi, [1, 2])
+        self.submit(single, 2)
+        expected = UserAnswer.objects.filter(attempt_id=self.attempt_id).aggregate(s=Sum('points_awarded'))['s']
+
+        response, result = post_json(self.client, f'/api/tests/attempts/{self.attempt_id}/finish/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(result['total_score'], expected)
+        self.assertEqual(self.assertScoreMatchesAnswers().status, 'finished')
+
+        response, result = post_json(self.client, f'/api/tests/attempts/{self.attempt_id}/finish/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.submit(single, 1), {'error': 'Тест завершен'})
+
+
+class AttemptDeadlineTests(TestCase):
+    def setUp(self):
+        _, self.test, self.questions = create_exam(time_limit=60)
+        self.student = CustomUser.objects.create_user(email='student@example.com', password='x', role='student')
+        self.client.force_login(self.student)
+        self.attempt_id = post_json(self.client, f'/api/tests/{self.test.public_uuid}/start/')[1]['attempt_id']
+
+    def move_start(self, seconds_ago):
+        """ Сдвинуть начало попытки в прошлое (крайний срок - вместе с ним) """
+        started_at = timezone.now() - timedelta(seconds=seconds_ago)
+        TestAttempt.objects.filter(pk=self.attempt_id).update(
+            started_at=started_at, deadline_at=started_at + timedelta(seconds=self.test.time_limit))
+        return TestAttempt.objects.get(pk=self.attempt_id)
+
+    def test_deadline_set_on_start(self):
+        attempt = TestAttempt.objects.get(pk=self.attempt_id)
+        self.assertAlmostEqual(attempt.deadline_at, attempt.started_at + timedelta(seconds=60), delta=timedelta(seconds=1))
+
+    def test_answers_accepted_within_grace(self):
+        self.move_start(60 + settings.TESTS_DEADLINE_GRACE - 5)
+        total_score, answered_count = save_answers(self.attempt_id, {self.questions[0].id: (1, True, 2)})
+        self.assertEqual((total_score, answered_count), (2, 1))
+
+    def test_answer_after_deadline_raises_expired(self):
+        self.move_start(60 + settings.TESTS_DEADLINE_GRACE + 5)
+        with self.assertRaises(AttemptExpired):
+            save_answers(self.attempt_id, {self.questions[0].id: (1, True, 2)})
+        self.assertFalse(UserAnswer.objects.filter(attempt_id=self.attempt_id).exists())
+
+        response, result = post_json(self.client, f'/api/tests/attempts/{self.attempt_id}/submit_answer/',
+                                     {'question_id': self.questions[0].id, 'selected_answer': 1})
+        self.assertEqual((response.status_code, result), (400, {'error': 'Время на тест истекло'}))
+
+    def test_sweep_closes_expired_attempts_at_deadline(self):
+        save_answers(self.attempt_id, {self.questions[0].id: (1, True, 2)})
+        attempt = self.move_start(60 + settings.TESTS_DEADLINE_GRACE + 5)
+
+        other = CustomUser.objects.create_user(email='other@example.com', password='x', role='student')
+        running = TestAttempt.objects.create(user=other, test=self.test,
+                                             deadline_at=timezone.now() + timedelta(seconds=60))
+        untimed = TestAttempt.objects.create(user=other, test=self.test,
+                                             started_at=timezone.now() - timedelta(days=1))
+
+        self.assertEqual(sweeper.sweep(), 1)
+        closed = TestAttempt.objects.get(pk=self.attempt_id)
+        self.assertEqual(closed.status, 'finished')
+        self.assertEqual(closed.finished_at, attempt.deadline_at)
+        self.assertEqual(closed.total_score, 2)
+        for pk in (running.pk, untimed.pk):
+            self.assertEqual(TestAttempt.objects.get(pk=pk).status, 'in_progress')
+
+        self.assertEqual(sweeper.sweep(), 0)
+
+    def test_sweep_waits_for_grace(self):
+        self.move_start(60 + settings.TESTS_DEADLINE_GRACE - 5)
+        self.assertEqual(sweeper.sweep(), 0)
+        self.assertEqual(TestAttempt.objects.get(pk=self.attempt_id).status, 'in_progress')
+
+    def test_sweep_in_chunks(self):
+        self.move_start(3600)
+        for n in range(4):
+            user = CustomUser.objects.create_user(email=f'late{n}@example.com', password='x', role='student')
+            TestAttempt.objects.create(user=user, test=self.test, deadline_at=timezone.now() - timedelta(hours=1))
+        progress = []
+        self.assertEqual(sweeper.sweep(chunk_size=2, progress=progress.append), 5)
+        self.assertEqual(progress, [2, 4, 5])
+
+
+class PoolDrawTests(TestCase):
+    def setUp(self):
+        self.author, self.test, self.fixed = create_exam()
+        self.pool = QuestionPool.objects.create(test=self.test, title='Банк', draw_count=2, shuffle=True)
+        self.bank = [
+            Question.objects.create(test=self.test, pool=self.pool, text=f'bank {n}', question_type='input',
+                                    points=1, order_num=10 + n, answer_data={'correct_answers': [str(n)]})
+            for n in range(6)
+        ]
+        self.test.refresh_from_db()
+
+    def test_select_questions_is_deterministic(self):
+        questions = [(n, 7 if n > 2 else None, n) for n in range(1, 11)]
+        pool_map = {7: (3, True)}
+        for seed in (0, 1, 12345, 2 ** pools.SEED_BITS - 1):
+            first = pools.select_questions(questions, pool_map, seed)
+            self.assertEqual(pools.select_questions(questions, pool_map, seed), first)
+            question_ids, max_score = first
+            self.assertEqual(question_ids[:2], [1, 2])
+            self.assertEqual(len(question_ids), 5)
+            self.assertEqual(max_score, sum(question_ids))
+
+    def test_draw_questions_is_deterministic(self):
+        question_ids, max_score = pools.draw_questions(self.test, 42)
+        self.assertEqual(pools.draw_questions(self.test, 42), (question_ids, max_score))
+        self.assertEqual(question_ids[:3], [q.id for q in self.fixed])
+        drawn = question_ids[3:]
+        self.assertEqual(len(drawn), 2)
+        self.assertTrue(set(drawn) <= {q.id for q in self.bank})
+        self.assertEqual(max_score, 2 + 3 + 5 + 2)
+
+    def test_draw_all_when_draw_count_is_zero(self):
+        QuestionPool.objects.filter(pk=self.pool.pk).update(draw_count=0, shuffle=False)
+        question_ids, _ = pools.draw_questions(self.test, 42)
+        self.assertEqual(question_ids, [q.id for q in self.fixed + self.bank])
+
+    def test_no_pools(self):
+        _, plain, _ = create_exam(email='plain@example.com')
+        self.assertEqual(pools.draw_questions(plain, 42), (None, None))
+        self.assertEqual(pools.attempt_question_count(plain), 3)
+
+    def test_attempt_only_accepts_drawn_questions(self):
+        student = CustomUser.objects.create_user(email='student@example.com', password='x', role='student')
+        self.client.force_login(student)
+        attempt_id = post_json(self.client, f'/api/tests/{self.test.public_uuid}/start/')[1]['attempt_id']
+        attempt = TestAttempt.objects.get(pk=attempt_id)
+        self.assertEqual(pools.draw_questions(self.test, attempt.seed)[0], attempt.question_ids)
+
+        drawn = [q for q in self.bank if q.id in attempt.question_ids]
+        undrawn = [q for q in self.bank if q.id not in attempt.question_ids]
+        self.assertEqual(len(drawn), 2)
+        self.assertTrue(attempt.includes_question(drawn[0]))
+        self.assertTrue(attempt.includes_question(self.fixed[0]))
+        self.assertFalse(attempt.includes_question(undrawn[0]))
+        other_questions = create_exam(email='other@example.com')[2]
+        self.assertFalse(attempt.includes_question(other_questions[0]))
+
+        response, result = post_json(self.client, f'/api/tests/attempts/{attempt_id}/submit_answer/',
+                                     {'question_id': undrawn[0].id, 'selected_answer': '0'})
+        self.assertEqual((response.status_code, result), (400, {'error': 'Чужой вопрос'}))
+        response, result = post_json(self.client, f'/api/tests/attempts/{attempt_id}/submit_answers/',
+                                     {'answers': [{'question_id': undrawn[0].id, 'selected_answer': '0'}]})
+        self.assertEqual(result['results'], [{'question_id': undrawn[0].id, 'status': 'error', 'error': 'Чужой вопрос'}])
+        self.assertFalse(UserAnswer.objects.filter(attempt_id=attempt_id).exists())
+
+    def test_cover_counts_questions_per_attempt(self):
+        student = CustomUser.objects.create_user(email='student@example.com', password='x', role='student')
+        self.client.force_login(student)
+        response = self.client.get(f'/api/tests/{self.test.public_uuid}/')
+        self.assertEqual(response.json()['questions_count'], 3 + 2)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.author, self.test, self.questions = create_exam()
+        self.editor_url = f'/api/tests/{self.test.id}/questions/'
+        self.cover_url = f'/api/tests/{self.test.public_uuid}/'
+
+    def test_etag_not_modified(self):
+        self.client.force_login(self.author)
+        for url in (self.editor_url, self.cover_url):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag = response.headers['ETag']
+
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+            self.assertEqual(response.headers['ETag'], etag)
+
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_last_modified_not_modified(self):
+        self.client.force_login(self.author)
+        response = self.client.get(self.cover_url)
+        last_modified = response.headers['Last-Modified']
+
+        response = self.client.get(self.cover_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['Last-Modified'], last_modified)
+
+        Test.objects.filter(pk=self.test.pk).update(updated_at=self.test.updated_at + timedelta(minutes=1))
+        response = self.client.get(self.cover_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['Last-Modified'], last_modified)
+
+    def test_etag_changes_after_question_edit(self):
+        self.client.force_login(self.author)
+        etag = self.client.get(self.editor_url).headers['ETag']
+
+        response = self.client.patch(f'/api/tests/questions/{self.questions[0].id}/', json.dumps({'text': 'новый'}),
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(self.editor_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(response.json()[0]['text'], 'новый')
+
+    def test_student_questions_etag(self):
+        student = CustomUser.objects.create_user(email='student@example.com', password='x', role='student')
+        self.client.force_login(student)
+        post_json(self.client, f'/api/tests/{self.test.public_uuid}/start/')
+        url = f'/api/tests/{self.test.public_uuid}/questions/'
+        etag = self.client.get(url).headers['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Question.objects.create(test=self.test, text='new', question_type='input', points=1, order_num=4,
+                                answer_data={'correct_answers': ['x']})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 4)
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.author = CustomUser.objects.create_user(email='author@example.com', password='x', role='employer')
+        created_at = timezone.now()
+        tests = [Test.objects.create(title=f'Тест {n}', author=self.author) for n in range(7)]
+        # Часть тестов с одинаковым created_at: порядок внутри них держится на id
+        for n, test in enumerate(tests):
+            Test.objects.filter(pk=test.pk).update(created_at=created_at - timedelta(minutes=n // 2))
+        self.expected = list(Test.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.client.force_login(self.author)
+
+    def fetch_all(self, url, key='id', limit=3):
+        """ Пройти все страницы по X-Next-Cursor: (id по порядку, число страниц) """
+        ids, cursor, pages = [], None, 0
+        while True:
+            response = self.client.get(url, {'limit': limit, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            ids += [row[key] for row in response.json()]
+            pages += 1
+            cursor = response.headers.get('X-Next-Cursor')
+            if not cursor:
+                return ids, pages
+
+    def test_round_trip(self):
+        ids, pages = self.fetch_all('/api/tests/')
+        self.assertEqual(ids, self.expected)
+        self.assertEqual(pages, 3)
+
+    def test_new_rows_do_not_shift_pages(self):
+        response = self.client.get('/api/tests/', {'limit': 3})
+        first_page = [row['id'] for row in response.json()]
+        Test.objects.create(title='Новый', author=self.author)
+        response = self.client.get('/api/tests/', {'limit': 3, 'cursor': response.headers['X-Next-Cursor']})
+        self.assertEqual(first_page + [row['id'] for row in response.json()], self.expected[:6])
+
+    def test_attempt_history_round_trip(self):
+        test = Test.objects.create(title='Экзамен', author=self.author)
+        started_at = timezone.now()
+        for n in range(5):
+            attempt = TestAttempt.objects.create(user=self.author, test=test)
+            TestAttempt.objects.filter(pk=attempt.pk).update(started_at=started_at - timedelta(minutes=n // 2))
+        expected = list(TestAttempt.objects.order_by('-started_at', '-id').values_list('id', flat=True))
+        ids, pages = self.fetch_all('/api/tests/my-attempts/', key='attempt_id', limit=2)
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 3)
+
+    def test_cursor_encoding(self):
+        value = timezone.now()
+        self.assertEqual(decode_cursor(encode_cursor(value, 42)), (value, 42))
+
+    def test_bad_cursor(self):
+        for cursor in ('???', 'bm90LWEtY3Vyc29y', encode_cursor(timezone.now(), 1)[:-3]):
+            response = self.client.get('/api/tests/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'error': 'Неверный курсор'})
+        response = self.client.get('/api/tests/my-attempts/', {'cursor': 'bm90LWEtY3Vyc29y'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_bad_limit(self):
+        response = self.client.get('/api/tests/', {'limit': 'много'})
+        self.assertEqual((response.status_code, response.json()), (400, {'error': 'Неверный limit'}))
+
+
+@override_settings(THROTTLE_ENABLED=True, THROTTLE_BACKEND='local', THROTTLE_POLICIES={
+    'login': [{'key': 'email', 'rate': '10/m', 'burst': 2}],
+    'submit_answers': [{'key': 'user', 'rate': '30/m', 'burst': 3}],
+})
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        throttling._local.buckets.clear()
+
+    def test_submit_answers_throttled(self):
+        _, test, questions = create_exam()
+        student = CustomUser.objects.create_user(email='student@example.com', password='x', role='student')
+        self.client.force_login(student)
+        attempt_id = post_json(self.client, f'/api/tests/{test.public_uuid}/start/')[1]['attempt_id']
+        url = f'/api/tests/attempts/{attempt_id}/submit_answers/'
+        data = {'answers': [{'question_id': questions[0].id, 'selected_answer': 1}]}
+
+        for _ in range(3):
+            self.assertEqual(post_json(self.client, url, data)[0].status_code, 200)
+        with self.assertNumQueries(2):  # только сессия и пользователь - view не вызывается
+            response, result = post_json(self.client, url, data)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(result, {'error': 'Слишком много запросов, попробуйте позже'})
+        self.assertEqual(response.headers['Retry-After'], '2')  # 30/m - жетон раз в 2 секунды
+
+    def test_login_throttled_per_email(self):
+        CustomUser.objects.create_user(email='student@example.com', password='x', role='student')
+        for _ in range(2):
+            response, _ = post_json(self.client, '/api/login/', {'email': 'student@example.com', 'password': 'bad'})
+            self.assertEqual(response.status_code, 401)
+        response, _ = post_json(self.client, '/api/login/', {'email': ' Student@Example.com', 'password': 'x'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '6')
+
+        # У другого email своё ведро
+        response, _ = post_json(self.client, '/api/login/', {'email': 'other@example.com', 'password': 'x'})
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(THROTTLE_ENABLED=False)
+    def test_disabled(self):
+        for _ in range(4):
+            response, _ = post_json(self.client, '/api/login/', {'email': 'student@example.com', 'password': 'x'})
+            self.assertEqual(response.status_code, 401)
+
+
+@override_settings(REPLICA_DATABASES=['replica_0'])
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = db_router.ReplicaRouter()
+        self.token = db_router.begin_request()
+        self.addCleanup(lambda: db_router.end_request(self.token))
+
+    def test_primary_by_default(self):
+        self.assertEqual(self.router.db_for_read(Test), 'default')
+        db_router.end_request(self.token)
+        db_router.use_replica()  # вне запроса - ничего не меняет
+        self.assertEqual(self.router.db_for_read(Test), 'default')
+        self.token = db_router.begin_request()
+
+    def test_replica_reads_primary_writes(self):
+        db_router.use_replica()
+        self.assertEqual(self.router.db_for_read(Test), 'replica_0')
+        self.assertEqual(self.router.db_for_read(UserAnswer), 'replica_0')
+        for model in (Test, UserAnswer, Session, CustomUser):
+            self.assertEqual(self.router.db_for_write(model), 'default')
+
+    def test_sessions_and_users_from_primary(self):
+        db_router.use_replica()
+        self.assertEqual(self.router.db_for_read(Session), 'default')
+        self.assertEqual(self.router.db_for_read(CustomUser), 'default')
+
+    def test_use_primary(self):
+        db_router.use_replica()
+        with db_router.use_primary():
+            self.assertEqual(self.router.db_for_read(Test), 'default')
+        self.assertEqual(self.router.db_for_read(Test), 'replica_0')
+
+    def test_primary_inside_transaction(self):
+        db_router.use_replica()
+        with mock.patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(self.router.db_for_read(Test), 'default')
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_no_replicas(self):
+        db_router.use_replica()
+        self.assertEqual(self.router.db_for_read(Test), 'default')
+
+
+@override_settings(REPLICA_DATABASES=['replica_0'])
+class ReplicaRoutingMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.read_from = []
+        self.middleware = ReplicaRoutingMiddleware(self.view)
+
+    @db_router.replica_read
+    def replica_view(self, request):
+        return HttpResponse()
+
+    def primary_view(self, request):
+        return HttpResponse()
+
+    def view(self, request):
+        """ get_response: как обработчик Django - process_view, затем запомнить, откуда читал бы view """
+        view_func = self.replica_view if request.path == '/replica/' else self.primary_view
+        self.middleware.process_view(request, view_func, (), {})
+        self.read_from.append(db_router.ReplicaRouter().db_for_read(Test))
+        return view_func(request)
+
+    def test_safe_reads_go_to_replica(self):
+        response = self.middleware(self.factory.get('/replica/'))
+        self.assertEqual(self.read_from, ['replica_0'])
+        self.assertNotIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+        self.middleware(self.factory.get('/primary/'))
+        self.assertEqual(self.read_from, ['replica_0', 'default'])
+        # После запроса маршрутизация сброшена
+        self.assertEqual(db_router.ReplicaRouter().db_for_read(Test), 'default')
+
+    def test_write_sets_sticky_cookie(self):
+        response = self.middleware(self.factory.post('/replica/'))
+        self.assertEqual(self.read_from, ['default'])
+        cookie = response.cookies[settings.REPLICA_STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_STICKY_SECONDS)
+        self.assertGreater(float(cookie.value), time.time())
+
+        self.factory.cookies[settings.REPLICA_STICKY_COOKIE] = cookie.value
+        self.middleware(self.factory.get('/replica/'))
+        self.assertEqual(self.read_from, ['default', 'default'])
+
+    def test_expired_or_broken_cookie_ignored(self):
+        for value in (str(int(time.time()) - 1), 'garbage'):
+            self.factory.cookies[settings.REPLICA_STICKY_COOKIE] = value
+            self.middleware(self.factory.get('/replica/'))
+        self.assertEqual(self.read_from, ['replica_0', 'replica_0'])
@@ -1,26 +1,48 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views
+
+
+def hot_student_patterns(hot_views):
+    """ Горячий путь студента: синхронные views (WSGI) или async_views (ASGI) """
+    return [
+        # Вопросы для прохождения
+        path('<uuid:test_uuid>/questions/', hot_views.question_list_student_view),
+        # Старт
+        path('<uuid:test_uuid>/start/', hot_views.start_test_view),
+        path('attempts/<int:attempt_id>/submit_answer/', hot_views.submit_answer_view),
+        path('attempts/<int:attempt_id>/finish/', hot_views.finish_test_view),
+    ]
+
 
 urlpatterns = [
     # --- 1. БЛОК РАБОТОДАТЕЛЯ ---
     path('', views.test_list_create_view),  # Список и создание
     path('<int:test_id>/', views.test_detail_editor_view),  # Редактирование, Удаление
     path('<int:test_id>/questions/', views.question_list_editor_view),  # Управление вопросами
+    path('<int:test_id>/questions/reorder/', views.question_reorder_view),  # Порядок вопросов
+    path('<int:test_id>/clone/', views.test_clone_view),  # Копия теста
+    path('<int:test_id>/pools/', views.pool_list_view),  # Пулы вопросов
+    path('pools/<int:pool_id>/', views.pool_detail_view),
 
     # Эндпоинт, чтобы получить UUID-ссылку (зная ID)
     path('<int:test_id>/share/', views.share_test_view),
+    # Пересчёт баллов после исправления ключей
+    path('<int:test_id>/regrade/', views.regrade_view),
+    # Статистика результатов
+    path('<int:test_id>/analytics/', views.test_analytics_view),
+    path('<int:test_id>/results/export/', views.results_export_view),  # Выгрузка CSV/NDJSON
+    # Тест целиком JSON-документом
+    path('import/', views.test_import_view),
+    path('<int:test_id>/document/', views.test_document_view),
 
     # --- 2. БЛОК СТУДЕНТА ---
     # Обложка теста (публичная)
     path('<uuid:test_uuid>/', views.test_public_detail_view),
-    # Вопросы для прохождения
-    path('<uuid:test_uuid>/questions/', views.question_list_student_view),
-    # Старт
-    path('<uuid:test_uuid>/start/', views.start_test_view),
+    *hot_student_patterns(async_views if settings.TESTS_ASYNC_VIEWS else views),
 
     # --- 3. Ответы и История ---
     path('my-attempts/', views.user_attempts_view),
-    path('attempts/<int:attempt_id>/submit_answer/', views.submit_answer_view),
-    path('attempts/<int:attempt_id>/finish/', views.finish_test_view),
+    path('attempts/<int:attempt_id>/submit_answers/', views.submit_answers_view),  # Пакетная отправка
     path('questions/<int:question_id>/', views.question_detail_view),  # Редактирование вопроса
-]
\ No newline at end of file
+]
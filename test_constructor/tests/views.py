@@ -1,12 +1,25 @@
 import json
 import copy
+import time
 import uuid  # Нужно для share
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
 from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import get_object_or_404
-from django.db.models import Max, Sum
+from django.db import DatabaseError, transaction
+from django.db.models import Count, F, IntegerField, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from .models import Test, Question, TestAttempt, UserAnswer
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from .models import Test, Question, QuestionPool, TestAttempt, UserAnswer
+from .grading import get_answer_key, invalidate_answer_key
+from .cache import get_payload, student_questions_key
+from .pagination import CursorError, encode_cursor, keyset_page, keyset_queryset
+from . import analytics, documents, export, pools, regrade
+from test_constructor import metrics
+from test_constructor.db_router import replica_read
+from test_constructor.throttling import throttle
 
 
 # ==========================================
@@ -31,37 +44,189 @@ def clean_answers_for_student(q_type, answers_json):
 
 def check_user_answer(question, user_answer_json):
     """ Проверяет ответ и начисляет баллы """
-    q_type = question.question_type
-    db_data = question.answer_data
-
-    if q_type == 'single':
-        for opt in db_data.get('options', []):
-            if opt['id'] == user_answer_json and opt.get('is_correct'):
-                return True, question.points
-    elif q_type == 'multi':
-        if not isinstance(user_answer_json, list): return False, 0
-        user_ids = set(user_answer_json)
-        correct_ids = {opt['id'] for opt in db_data.get('options', []) if opt.get('is_correct')}
-        if user_ids == correct_ids: return True, question.points
-    elif q_type == 'input':
-        user_text = str(user_answer_json).strip()
-        correct_list = db_data.get('correct_answers', [])
-        is_strict = db_data.get('case_sensitive', False)
-        if is_strict:
-            if user_text in correct_list: return True, question.points
-        else:
-            if user_text.lower() in [c.lower() for c in correct_list]: return True, question.points
-    elif q_type == 'match':
-        if user_answer_json == db_data.get('correct_matches', {}):
-            return True, question.points
-    elif q_type == 'sequence':
-        correct_order_ids = [i['id'] for i in sorted(db_data.get('items', []), key=lambda x: x['correct_order'])]
-        if user_answer_json == correct_order_ids:
-            return True, question.points
-
+    started = time.perf_counter()
+    is_correct = get_answer_key(question).matches(user_answer_json)
+    metrics.GRADING_SECONDS.observe(time.perf_counter() - started, question_type=question.question_type)
+    if is_correct:
+        return True, question.points
     return False, 0
 
 
+def student_question_data(q):
+    return {
+        'id': q.id,
+        'text': q.text,
+        'type': q.question_type,
+        'points': q.points,
+        'order_num': q.order_num,
+        'answers': clean_answers_for_student(q.question_type, q.answer_data)  # Чистим!
+    }
+
+
+def build_student_questions_payload(test_obj):
+    """ JSON (в байтах) со всеми вопросами теста без правильных ответов """
+    questions = test_obj.questions.all().order_by('order_num')
+    return json.dumps([student_question_data(q) for q in questions], cls=DjangoJSONEncoder).encode()
+
+
+def build_attempt_questions_payload(question_ids):
+    """ JSON вопросов попытки в порядке question_ids (вопросы, удалённые после старта, пропускаются) """
+    questions = Question.objects.in_bulk(question_ids)
+    data = [student_question_data(questions[q_id]) for q_id in question_ids if q_id in questions]
+    return json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+
+def question_pool_id(test_id, body):
+    """ pool_id из тела запроса: пул должен принадлежать тому же тесту (None - без пула) """
+    pool_id = body.get('pool_id')
+    if pool_id is not None and not QuestionPool.objects.filter(id=pool_id, test_id=test_id).exists():
+        raise ValueError('Пул не найден в этом тесте')
+    return pool_id
+
+
+def apply_pool_fields(pool, body):
+    """ Перенести поля пула из тела запроса. Возвращает текст ошибки или None """
+    if 'title' in body:
+        if not isinstance(body['title'], str) or len(body['title']) > QuestionPool._meta.get_field('title').max_length:
+            return 'Некорректное название'
+        pool.title = body['title']
+    if 'draw_count' in body:
+        if type(body['draw_count']) is not int or body['draw_count'] < 0:
+            return 'draw_count должен быть целым числом >= 0'
+        pool.draw_count = body['draw_count']
+    if 'shuffle' in body:
+        if not isinstance(body['shuffle'], bool):
+            return 'shuffle должен быть true или false'
+        pool.shuffle = body['shuffle']
+    return None
+
+
+def pool_data(pool, question_count):
+    return {
+        'id': pool.id,
+        'title': pool.title,
+        'draw_count': pool.draw_count,
+        'shuffle': pool.shuffle,
+        'question_count': question_count,
+    }
+
+
+def student_questions_kind(attempt):
+    """ Вид представления для ETag: общий для теста или свой у попытки с вопросами из пулов """
+    return 'student-questions' if attempt.question_ids is None else f'attempt-{attempt.id}-questions'
+
+
+class AttemptClosed(Exception):
+    """ Попытка уже завершена - ответы не принимаются """
+
+
+class AttemptExpired(AttemptClosed):
+    """ Время на попытку вышло """
+
+
+def save_answers(attempt_id, graded):
+    """
+    Записать проверенные ответы {question_id: (selected_answer, is_correct, points)}
+    и сдвинуть текущий счёт попытки на разницу между новыми и старыми баллами.
+    Возвращает (total_score, answered_count) после записи.
+    """
+    with transaction.atomic():
+        # Блокировка строки попытки упорядочивает параллельные отправки одного студента
+        attempt = TestAttempt.objects.select_for_update().only(
+            'status', 'total_score', 'answered_count', 'deadline_at').get(pk=attempt_id)
+        if attempt.status != 'in_progress':
+            raise AttemptClosed()
+        if attempt.is_expired():
+            raise AttemptExpired()
+
+        existing = {
+            a.question_id: a for a in
+            UserAnswer.objects.filter(attempt_id=attempt_id, question_id__in=list(graded)).only(
+                'id', 'question_id', 'points_awarded')
+        }
+        score_delta = 0
+        to_create, to_update = [], []
+        for q_id, (selected_answer, is_correct, points) in graded.items():
+            answer = existing.get(q_id)
+            if answer is None:
+                answer = UserAnswer(attempt_id=attempt_id, question_id=q_id)
+                to_create.append(answer)
+            else:
+                score_delta -= answer.points_awarded
+                to_update.append(answer)
+            score_delta += points
+            answer.selected_answer = selected_answer
+            answer.is_correct = is_correct
+            answer.points_awarded = points
+
+        if to_create:
+            UserAnswer.objects.bulk_create(to_create)
+        if to_update:
+            UserAnswer.objects.bulk_update(to_update, ['selected_answer', 'is_correct', 'points_awarded'])
+        TestAttempt.objects.filter(pk=attempt_id).update(
+            total_score=F('total_score') + score_delta,
+            answered_count=F('answered_count') + len(to_create),
+        )
+    metrics.ANSWERS_SUBMITTED.inc(len(graded))
+    return attempt.total_score + score_delta, attempt.answered_count + len(to_create)
+
+
+def finish_attempt(attempt_id, user):
+    """
+    Закрыть попытку пользователя. Возвращает (attempt, passed) или None, если попытка уже завершена.
+    Счёт уже посчитан при отправке ответов - остаётся одним UPDATE закрыть попытку.
+    """
+    with transaction.atomic():
+        attempt = get_object_or_404(
+            TestAttempt.objects.select_for_update(of=('self',)).select_related('test'),
+            id=attempt_id, user=user
+        )
+        finished = TestAttempt.objects.filter(pk=attempt.pk, status='in_progress').update(
+            status='finished', finished_at=timezone.now()
+        )
+        if not finished:
+            return None
+        test = attempt.test
+        threshold = test.pass_threshold(attempt.max_score)
+        passed = threshold is not None and attempt.total_score >= threshold
+        analytics.record_finished_attempt(attempt, test, passed)
+    metrics.ATTEMPTS_FINISHED.inc(passed=str(passed).lower())
+    return attempt, passed
+
+
+def finish_result(attempt, passed):
+    test = attempt.test
+    return {
+        'message': 'Тест завершен',
+        'total_score': attempt.total_score,
+        'passed': passed,
+        'feedback': test.success_message if passed else test.failure_message
+    }
+
+
+def test_etag(test_obj, kind):
+    """ Строгий ETag представления теста: меняется вместе с content_version """
+    return f'"{kind}-{test_obj.id}-{test_obj.content_version}"'
+
+
+def not_modified_response(request, test_obj, kind):
+    """ 304, если у клиента уже есть актуальная версия (If-None-Match / If-Modified-Since) """
+    response = get_conditional_response(
+        request,
+        etag=test_etag(test_obj, kind),
+        last_modified=int(test_obj.updated_at.timestamp()),
+    )
+    if response is not None:
+        set_cache_validators(response, test_obj, kind)
+    return response
+
+
+def set_cache_validators(response, test_obj, kind):
+    response.headers['ETag'] = test_etag(test_obj, kind)
+    response.headers['Last-Modified'] = http_date(test_obj.updated_at.timestamp())
+    return response
+
+
 # ==========================================
 # 1. БЛОК РАБОТОДАТЕЛЯ
 # ==========================================
@@ -77,19 +242,47 @@ def test_list_create_view(request):
         if user.role == 'student':
             return JsonResponse([], safe=False)
 
-        tests = Test.objects.filter(author=user)
+        tests = Test.objects.filter(author=user).annotate(
+            # Подзапросы вместо JOIN + COUNT: не размножают строки и не требуют DISTINCT
+            attempts_count=Coalesce(Subquery(
+                TestAttempt.objects.filter(test=OuterRef('pk')).order_by()
+                .values('test').annotate(c=Count('id')).values('c'),
+                output_field=IntegerField()
+            ), Value(0)),
+            last_attempt_at=Subquery(
+                TestAttempt.objects.filter(test=OuterRef('pk')).order_by()
+                .values('test').annotate(m=Max('started_at')).values('m')
+            ),
+        )
+
+        status = request.GET.get('status')
+        if status:
+            if status not in dict(Test.STATUS_CHOICES):
+                return JsonResponse({'error': 'Неизвестный статус'}, status=400)
+            tests = tests.filter(status=status)
+
+        try:
+            page, next_cursor = keyset_page(tests, request, 'created_at')
+        except CursorError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
         data = []
-        for t in tests:
+        for t in page:
             data.append({
                 'id': t.id,
                 'title': t.title,
                 'description': t.description,
                 'status': t.status,
-                'questions_count': t.questions.count(),
+                'questions_count': t.question_count,
+                'attempts_count': t.attempts_count,
+                'last_attempt_at': t.last_attempt_at.strftime('%Y-%m-%d %H:%M') if t.last_attempt_at else None,
                 'created_at': t.created_at.strftime('%Y-%m-%d %H:%M'),
                 'uuid': t.public_uuid,
             })
-        return JsonResponse(data, safe=False)
+        response = JsonResponse(data, safe=False)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
 
     if request.method == 'POST':
         if request.user.role not in ['employer', 'admin']:
@@ -135,11 +328,14 @@ def test_detail_editor_view(request, test_id):
     if request.method == 'PATCH':
         try:
             body = json.loads(request.body)
-            if 'title' in body: test_obj.title = body['title']
-            if 'description' in body: test_obj.description = body['description']
-            if 'time_limit' in body: test_obj.time_limit = body['time_limit']
-            if 'passing_score' in body: test_obj.passing_score = body['passing_score']
-            test_obj.save()
+            fields = [f for f in ('title', 'description', 'time_limit', 'passing_score') if f in body]
+            for field in fields:
+                setattr(test_obj, field, body[field])
+            if fields:
+                # Только изменённые поля: счётчики вопросов сдвигаются параллельно через F()
+                with transaction.atomic():
+                    test_obj.save(update_fields=fields)
+                    Test.bump_content_version(test_obj.pk)
             return JsonResponse({'message': 'Тест обновлен'})
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=400)
@@ -163,10 +359,14 @@ def question_list_editor_view(request, test_id):
         return JsonResponse({'error': 'Нет прав'}, status=403)
 
     if request.method == 'GET':
+        not_modified = not_modified_response(request, test_obj, 'editor-questions')
+        if not_modified is not None:
+            return not_modified
+
         questions = test_obj.questions.all().order_by('order_num')
-        data = [{'id': q.id, 'text': q.text, 'type': q.question_type, 'points': q.points, 'answers': q.answer_data} for
-                q in questions]
-        return JsonResponse(data, safe=False)
+        data = [{'id': q.id, 'text': q.text, 'type': q.question_type, 'points': q.points, 'pool_id': q.pool_id,
+                 'answers': q.answer_data} for q in questions]
+        return set_cache_validators(JsonResponse(data, safe=False), test_obj, 'editor-questions')
 
     if request.method == 'POST':
         try:
@@ -180,7 +380,8 @@ def question_list_editor_view(request, test_id):
                 question_type=body.get('type', 'single'),
                 points=body.get('points', 1),
                 answer_data=body.get('answer_data', {}),
-                order_num=new_order
+                order_num=new_order,
+                pool_id=question_pool_id(test_obj.id, body)
             )
             return JsonResponse({'message': 'Вопрос добавлен', 'id': new_q.id}, status=201)
         except Exception as e:
@@ -189,6 +390,139 @@ def question_list_editor_view(request, test_id):
     return JsonResponse({'error': 'Метод не поддерживается'}, status=405)
 
 
+@csrf_exempt
+def question_reorder_view(request, test_id):
+    """ Новый порядок вопросов теста: полный список id в нужном порядке """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Не авторизован'}, status=401)
+
+    test_obj = get_object_or_404(Test, id=test_id)
+
+    if test_obj.author != request.user and request.user.role != 'admin':
+        return JsonResponse({'error': 'Нет прав'}, status=403)
+
+    if request.method in ('POST', 'PUT'):
+        try:
+            question_ids = json.loads(request.body).get('question_ids')
+        except (ValueError, AttributeError):
+            return JsonResponse({'error': 'Неверный JSON'}, status=400)
+        if not isinstance(question_ids, list) or not all(type(q_id) is int for q_id in question_ids):
+            return JsonResponse({'error': 'question_ids должен быть списком id вопросов'}, status=400)
+
+        with transaction.atomic():
+            # Блокировка теста: список вопросов не меняется, пока применяем порядок
+            Test.objects.select_for_update().only('id').get(pk=test_obj.pk)
+            current = set(Question.objects.filter(test=test_obj).values_list('id', flat=True))
+            if len(question_ids) != len(current) or set(question_ids) != current:
+                return JsonResponse({'error': 'Нужно перечислить все вопросы теста ровно по одному разу'},
+                                    status=400)
+            Question.objects.bulk_update(
+                [Question(id=q_id, order_num=index + 1) for index, q_id in enumerate(question_ids)],
+                ['order_num'], batch_size=500,
+            )
+            Test.bump_content_version(test_obj.pk)
+        return JsonResponse({'message': 'Порядок сохранен'})
+
+    return JsonResponse({'error': 'Только POST или PUT'}, status=405)
+
+
+@csrf_exempt
+def test_clone_view(request, test_id):
+    """ Копия теста со всеми вопросами """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Не авторизован'}, status=401)
+
+    test_obj = get_object_or_404(Test, id=test_id)
+
+    if test_obj.author != request.user and request.user.role != 'admin':
+        return JsonResponse({'error': 'Нет прав'}, status=403)
+
+    if request.method == 'POST':
+        try:
+            body = json.loads(request.body) if request.body else {}
+            title = body.get('title') or f'{test_obj.title} (копия)'
+        except (ValueError, AttributeError):
+            return JsonResponse({'error': 'Неверный JSON'}, status=400)
+        if not isinstance(title, str) or len(title) > Test._meta.get_field('title').max_length:
+            return JsonResponse({'error': 'Некорректное название'}, status=400)
+
+        clone = documents.clone_test(test_obj, request.user, title)
+        return JsonResponse({
+            'message': 'Тест скопирован',
+            'id': clone.id,
+            'public_uuid': clone.public_uuid,
+            'question_count': clone.question_count,
+        }, status=201)
+
+    return JsonResponse({'error': 'Только POST'}, status=405)
+
+
+@csrf_exempt
+def pool_list_view(request, test_id):
+    """ GET: пулы вопросов теста. POST: создать пул """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Не авторизован'}, status=401)
+
+    test_obj = get_object_or_404(Test, id=test_id)
+
+    if test_obj.author != request.user and request.user.role != 'admin':
+        return JsonResponse({'error': 'Нет прав'}, status=403)
+
+    if request.method == 'GET':
+        pools = QuestionPool.objects.filter(test=test_obj).annotate(n=Count('questions')).order_by('id')
+        return JsonResponse([pool_data(pool, pool.n) for pool in pools], safe=False)
+
+    if request.method == 'POST':
+        try:
+            body = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'error': 'Неверный JSON'}, status=400)
+        if not isinstance(body, dict):
+            return JsonResponse({'error': 'Неверный JSON'}, status=400)
+        pool = QuestionPool(test=test_obj)
+        error = apply_pool_fields(pool, body)
+        if error:
+            return JsonResponse({'error': error}, status=400)
+        pool.save()
+        Test.bump_content_version(test_obj.id)
+        return JsonResponse({'message': 'Пул создан', **pool_data(pool, 0)}, status=201)
+
+    return JsonResponse({'error': 'Метод не поддерживается'}, status=405)
+
+
+@csrf_exempt
+def pool_detail_view(request, pool_id):
+    """ Редактирование/Удаление пула (вопросы удалённого пула входят в каждую попытку) """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Не авторизован'}, status=401)
+
+    pool = get_object_or_404(QuestionPool.objects.select_related('test'), id=pool_id)
+    if pool.test.author != request.user and request.user.role != 'admin':
+        return JsonResponse({'error': 'Нет прав'}, status=403)
+
+    if request.method == 'PATCH':
+        try:
+            body = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'error': 'Неверный JSON'}, status=400)
+        if not isinstance(body, dict):
+            return JsonResponse({'error': 'Неверный JSON'}, status=400)
+        error = apply_pool_fields(pool, body)
+        if error:
+            return JsonResponse({'error': error}, status=400)
+        pool.save()
+        Test.bump_content_version(pool.test_id)
+        return JsonResponse({'message': 'Пул обновлен'})
+
+    if request.method == 'DELETE':
+        with transaction.atomic():
+            pool.delete()
+            Test.bump_content_version(pool.test_id)
+        return JsonResponse({'message': 'Пул удален'})
+
+    return JsonResponse({'error': 'Метод не поддерживается'}, status=405)
+
+
 @csrf_exempt
 def question_detail_view(request, question_id):
     """ Редактирование/Удаление конкретного вопроса """
@@ -200,6 +534,7 @@ def question_detail_view(request, question_id):
         return JsonResponse({'error': 'Нет прав'}, status=403)
 
     if request.method == 'DELETE':
+        invalidate_answer_key(question.id)
         question.delete()
         return JsonResponse({'message': 'Вопрос удален'})
 
@@ -208,8 +543,13 @@ def question_detail_view(request, question_id):
             body = json.loads(request.body)
             if 'text' in body: question.text = body['text']
             if 'points' in body: question.points = body['points']
+            if 'order_num' in body:
+                if not isinstance(body['order_num'], int) or body['order_num'] < 0:
+                    return JsonResponse({'error': 'order_num должен быть целым числом >= 0'}, status=400)
+                question.order_num = body['order_num']
+            if 'pool_id' in body: question.pool_id = question_pool_id(question.test_id, body)
             if 'answer_data' in body: question.answer_data = body['answer_data']
-            question.save()
+            question.save()  # save() сам поднимает version, если изменился ключ ответа
             return JsonResponse({'message': 'Вопрос обновлен'})
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=400)
@@ -227,21 +567,147 @@ def share_test_view(request, test_id):
     return JsonResponse({'test_public_uuid': f"{test_obj.public_uuid}"})
 
 
+@csrf_exempt
+def regrade_view(request, test_id):
+    """ GET: состояние последнего регрейда. POST: пересчитать баллы ответов по текущим ключам """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Не авторизован'}, status=401)
+
+    test_obj = get_object_or_404(Test, id=test_id)
+
+    if test_obj.author != request.user and request.user.role != 'admin':
+        return JsonResponse({'error': 'Нет прав'}, status=403)
+
+    if request.method == 'GET':
+        job = test_obj.regrade_jobs.order_by('-id').first()
+        if job is None:
+            return JsonResponse({'error': 'Регрейд не запускался'}, status=404)
+        return JsonResponse(regrade.job_data(job))
+
+    if request.method == 'POST':
+        try:
+            body = json.loads(request.body or '{}')
+            question_ids = body.get('question_ids') or []
+            if not isinstance(question_ids, list) or not all(isinstance(q_id, int) for q_id in question_ids):
+                return JsonResponse({'error': 'question_ids должен быть списком ID'}, status=400)
+
+            # Брошенную задачу (процесс, выполнявший её, умер) start_job продолжает с сохранённой позиции
+            job, started = regrade.start_job(test_obj, question_ids)
+            if not started:
+                return JsonResponse({'error': 'Регрейд уже выполняется', **regrade.job_data(job)}, status=409)
+            return JsonResponse(regrade.job_data(job), status=202)
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({'error': 'Метод не поддерживается'}, status=405)
+
+
+@csrf_exempt
+@replica_read
+def test_analytics_view(request, test_id):
+    """ Сводная статистика результатов теста """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Не авторизован'}, status=401)
+
+    test_obj = get_object_or_404(Test, id=test_id)
+
+    if test_obj.author != request.user and request.user.role != 'admin':
+        return JsonResponse({'error': 'Нет прав'}, status=403)
+
+    if request.method == 'GET':
+        return JsonResponse(analytics.get_analytics(test_obj))
+
+    return JsonResponse({'error': 'Метод не поддерживается'}, status=405)
+
+
+@csrf_exempt
+def results_export_view(request, test_id):
+    """ Потоковая выгрузка результатов (?format=csv|ndjson) """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Не авторизован'}, status=401)
+
+    test_obj = get_object_or_404(Test, id=test_id)
+
+    if test_obj.author != request.user and request.user.role != 'admin':
+        return JsonResponse({'error': 'Нет прав'}, status=403)
+
+    if request.method == 'GET':
+        fmt = request.GET.get('format', 'csv')
+        if fmt not in export.FORMATS:
+            return JsonResponse({'error': 'Формат должен быть csv или ndjson'}, status=400)
+
+        response = StreamingHttpResponse(export.stream_results(test_obj, fmt), content_type=export.CONTENT_TYPES[fmt])
+        response.headers['Content-Disposition'] = f'attachment; filename="test_{test_obj.id}_results.{fmt}"'
+        return response
+
+    return JsonResponse({'error': 'Метод не поддерживается'}, status=405)
+
+
+@csrf_exempt
+def test_import_view(request):
+    """ Создать тест из JSON-документа (тело запроса читается потоком) """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Не авторизован'}, status=401)
+    if request.user.role not in ['employer', 'admin']:
+        return JsonResponse({'error': 'Нет прав'}, status=403)
+
+    if request.method == 'POST':
+        try:
+            test_obj = documents.import_document(request, request.user)
+        except (DatabaseError, ValueError) as e:
+            # DocumentError - тоже ValueError; ошибки БД (целостность, переполнение поля) - без 500
+            return JsonResponse({'error': str(e)}, status=400)
+        return JsonResponse({
+            'message': 'Тест импортирован',
+            'id': test_obj.id,
+            'question_count': test_obj.question_count,
+            'max_score': test_obj.max_score,
+        }, status=201)
+
+    return JsonResponse({'error': 'Только POST'}, status=405)
+
+
+def test_document_view(request, test_id):
+    """ Выгрузить тест JSON-документом (тот же формат, что принимает импорт) """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Не авторизован'}, status=401)
+
+    test_obj = get_object_or_404(Test, id=test_id)
+
+    if test_obj.author != request.user and request.user.role != 'admin':
+        return JsonResponse({'error': 'Нет прав'}, status=403)
+
+    if request.method == 'GET':
+        response = StreamingHttpResponse(documents.iter_document(test_obj), content_type='application/json')
+        response.headers['Content-Disposition'] = f'attachment; filename="test_{test_obj.id}.json"'
+        return response
+
+    return JsonResponse({'error': 'Только GET'}, status=405)
+
+
 # ==========================================
 # 2. БЛОК СТУДЕНТА
 # ==========================================
 
 @csrf_exempt
+@replica_read
 def test_public_detail_view(request, test_uuid):
     """ Обложка теста по ссылке """
     if not request.user.is_authenticated: return JsonResponse({'error': 'Auth required'}, status=401)
     test_obj = get_object_or_404(Test, public_uuid=test_uuid)
-    return JsonResponse({
+
+    not_modified = not_modified_response(request, test_obj, 'cover')
+    if not_modified is not None:
+        return not_modified
+
+    response = JsonResponse({
         'title': test_obj.title,
         'description': test_obj.description,
         'time_limit': test_obj.time_limit,
-        'questions_count': test_obj.questions.count()
+        # В тесте с пулами - сколько вопросов будет в попытке, а не весь банк
+        'questions_count': pools.attempt_question_count(test_obj)
     })
+    return set_cache_validators(response, test_obj, 'cover')
 
 
 @csrf_exempt
@@ -254,13 +720,18 @@ def start_test_view(request, test_uuid):
         attempt = TestAttempt.objects.create(
             user=request.user,
             test=test_obj,
-            status='in_progress'
+            status='in_progress',
+            deadline_at=TestAttempt.deadline_for(test_obj, timezone.now()),
+            **pools.attempt_fields(test_obj)
         )
-        return JsonResponse({'message': 'Тест начат', 'attempt_id': attempt.id}, status=201)
+        metrics.ATTEMPTS_STARTED.inc()
+        return JsonResponse({'message': 'Тест начат', 'attempt_id': attempt.id, 'deadline_at': attempt.deadline_at},
+                            status=201)
     return JsonResponse({'error': 'Только POST'}, status=405)
 
 
 @csrf_exempt
+@replica_read
 def question_list_student_view(request, test_uuid):
     """ Получить вопросы по ссылке (Без ответов!) """
     if not request.user.is_authenticated: return JsonResponse({'error': 'Auth required'}, status=401)
@@ -268,22 +739,24 @@ def question_list_student_view(request, test_uuid):
     test_obj = get_object_or_404(Test, public_uuid=test_uuid)
 
     if request.method == 'GET':
-        has_active = TestAttempt.objects.filter(user=request.user, test=test_obj, status='in_progress').exists()
-        if not has_active:
+        attempt = TestAttempt.objects.filter(user=request.user, test=test_obj, status='in_progress').only(
+            'id', 'question_ids').order_by('-started_at').first()
+        if attempt is None:
             return JsonResponse({'error': 'Нет активной попытки'}, status=403)
 
-        questions = test_obj.questions.all().order_by('order_num')
-        data = []
-        for q in questions:
-            data.append({
-                'id': q.id,
-                'text': q.text,
-                'type': q.question_type,
-                'points': q.points,
-                'order_num': q.order_num,
-                'answers': clean_answers_for_student(q.question_type, q.answer_data)  # Чистим!
-            })
-        return JsonResponse(data, safe=False)
+        kind = student_questions_kind(attempt)
+        not_modified = not_modified_response(request, test_obj, kind)
+        if not_modified is not None:
+            return not_modified
+
+        if attempt.question_ids is None:
+            # Ответ одинаков для всех студентов, поэтому берём готовые байты из кэша
+            payload = get_payload(student_questions_key(test_obj), lambda: build_student_questions_payload(test_obj))
+        else:
+            # Вопросы из пулов у каждой попытки свои - читаем только вытянутые, по первичному ключу
+            payload = build_attempt_questions_payload(attempt.question_ids)
+        response = HttpResponse(payload, content_type='application/json')
+        return set_cache_validators(response, test_obj, kind)
     return JsonResponse({'error': 'Только GET'}, status=405)
 
 
@@ -292,6 +765,7 @@ def question_list_student_view(request, test_uuid):
 # ==========================================
 
 @csrf_exempt
+@throttle('submit_answer')
 def submit_answer_view(request, attempt_id):
     """ Сохранить ответ """
     if not request.user.is_authenticated: return JsonResponse({'error': 'Auth required'}, status=401)
@@ -304,18 +778,80 @@ def submit_answer_view(request, attempt_id):
             attempt = get_object_or_404(TestAttempt, id=attempt_id, user=request.user)
             if attempt.status != 'in_progress':
                 return JsonResponse({'error': 'Тест завершен'}, status=400)
+            if attempt.is_expired():
+                return JsonResponse({'error': 'Время на тест истекло'}, status=400)
 
             question = get_object_or_404(Question, id=question_id)
-            if question.test_id != attempt.test_id:
+            if not attempt.includes_question(question):
                 return JsonResponse({'error': 'Чужой вопрос'}, status=400)
 
             is_correct, points = check_user_answer(question, selected_answer)
 
-            UserAnswer.objects.update_or_create(
-                attempt=attempt, question=question,
-                defaults={'selected_answer': selected_answer, 'is_correct': is_correct, 'points_awarded': points}
-            )
-            return JsonResponse({'message': 'Принято'})
+            total_score, answered_count = save_answers(attempt.id, {
+                question.id: (selected_answer, is_correct, points)
+            })
+            return JsonResponse({'message': 'Принято', 'total_score': total_score, 'answered_count': answered_count})
+        except AttemptExpired:
+            return JsonResponse({'error': 'Время на тест истекло'}, status=400)
+        except AttemptClosed:
+            return JsonResponse({'error': 'Тест завершен'}, status=400)
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'error': 'Только POST'}, status=405)
+
+
+@csrf_exempt
+@throttle('submit_answers')
+def submit_answers_view(request, attempt_id):
+    """ Сохранить сразу несколько ответов (одна транзакция) """
+    if not request.user.is_authenticated: return JsonResponse({'error': 'Auth required'}, status=401)
+    if request.method == 'POST':
+        try:
+            body = json.loads(request.body)
+            answers = body.get('answers')
+            if not isinstance(answers, list):
+                return JsonResponse({'error': 'Ожидается список answers'}, status=400)
+
+            attempt = get_object_or_404(TestAttempt, id=attempt_id, user=request.user)
+            if attempt.status != 'in_progress':
+                return JsonResponse({'error': 'Тест завершен'}, status=400)
+            if attempt.is_expired():
+                return JsonResponse({'error': 'Время на тест истекло'}, status=400)
+
+            # Если вопрос прислали несколько раз - сохраняем последний ответ
+            selected = {}
+            for item in answers:
+                # Нецелый id (в т.ч. нехешируемый список) не должен ронять всю пачку - его отметит цикл ниже
+                if isinstance(item, dict) and isinstance(item.get('question_id'), int):
+                    selected[item['question_id']] = item.get('selected_answer')
+
+            questions = Question.objects.filter(id__in=list(selected)).in_bulk()
+
+            results = []
+            graded = {}
+            for item in answers:
+                q_id = item.get('question_id') if isinstance(item, dict) else None
+                question = questions.get(q_id) if isinstance(q_id, int) else None
+                if question is None:
+                    results.append({'question_id': q_id, 'status': 'error', 'error': 'Вопрос не найден'})
+                elif not attempt.includes_question(question):
+                    results.append({'question_id': q_id, 'status': 'error', 'error': 'Чужой вопрос'})
+                else:
+                    if q_id not in graded:
+                        graded[q_id] = (selected[q_id],) + check_user_answer(question, selected[q_id])
+                    results.append({'question_id': q_id, 'status': 'accepted'})
+
+            total_score, answered_count = save_answers(attempt.id, graded)
+            return JsonResponse({
+                'message': 'Принято',
+                'results': results,
+                'total_score': total_score,
+                'answered_count': answered_count,
+            })
+        except AttemptExpired:
+            return JsonResponse({'error': 'Время на тест истекло'}, status=400)
+        except AttemptClosed:
+            return JsonResponse({'error': 'Тест завершен'}, status=400)
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=400)
     return JsonResponse({'error': 'Только POST'}, status=405)
@@ -326,50 +862,56 @@ def finish_test_view(request, attempt_id):
     """ Завершить тест """
     if not request.user.is_authenticated: return JsonResponse({'error': 'Auth required'}, status=401)
     if request.method == 'POST':
-        attempt = get_object_or_404(TestAttempt, id=attempt_id, user=request.user)
-        if attempt.status == 'finished':
+        finished = finish_attempt(attempt_id, request.user)
+        if finished is None:
             return JsonResponse({'error': 'Уже завершен'}, status=400)
+        return JsonResponse(finish_result(*finished))
+    return JsonResponse({'error': 'Только POST'}, status=405)
 
-        total_score = attempt.answers.aggregate(Sum('points_awarded'))['points_awarded__sum'] or 0
-        attempt.total_score = total_score
-        attempt.finished_at = timezone.now()
-        attempt.status = 'finished'
-        attempt.save()
 
-        test = attempt.test
-        passed = False
-        if test.evaluation_method == 'points':
-            passed = total_score >= test.passing_score
-        elif test.evaluation_method == 'percent':
-            max_score = test.questions.aggregate(Sum('points'))['points__sum'] or 0
-            if max_score > 0:
-                passed = (total_score / max_score * 100) >= test.passing_score
-
-        return JsonResponse({
-            'message': 'Тест завершен',
-            'total_score': total_score,
-            'passed': passed,
-            'feedback': test.success_message if passed else test.failure_message
-        })
-    return JsonResponse({'error': 'Только POST'}, status=405)
+def attempt_history_row(attempt):
+    """ Одна запись истории прохождений """
+    date = attempt.finished_at or attempt.started_at
+    return {
+        'attempt_id': attempt.id,
+        'test_title': attempt.test.title,
+        'status': attempt.status,
+        'score': attempt.total_score,
+        'max_score': attempt.test.max_score if attempt.max_score is None else attempt.max_score,
+        'passing_score': attempt.test.passing_score,
+        'date': date.strftime('%d.%m.%Y'),
+    }
 
 
 @csrf_exempt
+@replica_read
 def user_attempts_view(request):
-    """ История прохождений """
+    """ История прохождений (постранично или потоком NDJSON) """
     if not request.user.is_authenticated: return JsonResponse({'error': 'Auth required'}, status=401)
     if request.method == 'GET':
-        attempts = TestAttempt.objects.filter(user=request.user).select_related('test').order_by('-started_at')
-        data = []
-        for attempt in attempts:
-            data.append({
-                'attempt_id': attempt.id,
-                'test_title': attempt.test.title,
-                'status': attempt.status,
-                'score': attempt.total_score,
-                'max_score': attempt.test.passing_score,
-                'date': attempt.finished_at.strftime(
-                    '%d.%m.%Y') if attempt.finished_at else attempt.started_at.strftime('%d.%m.%Y')
-            })
-        return JsonResponse(data, safe=False)
-    return JsonResponse({'error': 'Только GET'}, status=405)
\ No newline at end of file
+        attempts = TestAttempt.objects.filter(user=request.user).select_related('test').only(
+            'id', 'status', 'total_score', 'max_score', 'started_at', 'finished_at',
+            'test__title', 'test__max_score', 'test__passing_score',
+        )
+
+        try:
+            if request.GET.get('format') == 'ndjson':
+                # Вся история одним потоком: память не зависит от количества попыток
+                rows = keyset_queryset(attempts, 'started_at', request.GET.get('cursor')).iterator(chunk_size=500)
+                stream = (
+                    # cursor в каждой строке позволяет продолжить оборвавшуюся выгрузку
+                    json.dumps({**attempt_history_row(a), 'cursor': encode_cursor(a.started_at, a.id)},
+                               ensure_ascii=False) + '\n'
+                    for a in rows
+                )
+                return StreamingHttpResponse(stream, content_type='application/x-ndjson')
+
+            page, next_cursor = keyset_page(attempts, request, 'started_at')
+        except CursorError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        response = JsonResponse([attempt_history_row(a) for a in page], safe=False)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+    return JsonResponse({'error': 'Только GET'}, status=405)
@@ -0,0 +1,56 @@
+"""
+Кэш авторизованного пользователя.
+
+Стандартный AuthenticationMiddleware на каждом запросе читает CustomUser
+из БД. Здесь пользователь берётся из кэша по ключу users:auth:<id> вместе
+с хэшем авторизации (get_session_auth_hash), который сверяется с хэшем в
+сессии - так же, как это делает django.contrib.auth.get_user. Смена пароля
+меняет хэш, а любое сохранение или удаление пользователя сбрасывает ключ
+(см. CustomUser.save / delete).
+
+Без общего кэша (USERS_AUTH_CACHE пустой) пользователь, как обычно, читается из БД.
+"""
+from django.conf import settings
+from django.contrib import auth
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare
+
+
+def auth_cache_key(user_id):
+    return f'users:auth:{user_id}'
+
+
+def _cache():
+    return caches[settings.USERS_AUTH_CACHE]
+
+
+def invalidate_cached_user(user_id):
+    if settings.USERS_AUTH_CACHE:
+        _cache().delete(auth_cache_key(user_id))
+
+
+def invalidate_cached_users(user_ids):
+    if user_ids and settings.USERS_AUTH_CACHE:
+        _cache().delete_many([auth_cache_key(user_id) for user_id in user_ids])
+
+
+def get_cached_user(request):
+    """ Аналог django.contrib.auth.get_user, который ходит в БД только при промахе кэша """
+    session = request.session
+    user_id = session.get(auth.SESSION_KEY)
+    session_hash = session.get(auth.HASH_SESSION_KEY)
+    if user_id is None or not session_hash or not settings.USERS_AUTH_CACHE:
+        return auth.get_user(request)
+
+    key = auth_cache_key(user_id)
+    cached = _cache().get(key)
+    if cached is not None:
+        user_hash, user = cached
+        if constant_time_compare(session_hash, user_hash):
+            return user
+
+    # Промах или хэш не совпал: полная проверка (при несовпадении она же сбросит сессию)
+    user = auth.get_user(request)
+    if user.is_authenticated:
+        _cache().set(key, (user.get_session_auth_hash(), user), settings.USERS_AUTH_CACHE_TIMEOUT)
+    return user
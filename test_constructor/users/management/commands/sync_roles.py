@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from users.auth_cache import invalidate_cached_users
+from users.models import CustomUser
+from users.roles import sync_role_groups
+
+
+class Command(BaseCommand):
+    help = ('Массово меняет роль пользователей и синхронизирует is_staff и группу Managers. '
+            'Без --role только приводит права в соответствие с текущими ролями.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('emails', nargs='*', help='Email пользователей (по умолчанию - все)')
+        parser.add_argument('--role', choices=[code for code, _ in CustomUser.ROLES],
+                            help='Назначить эту роль перечисленным пользователям')
+
+    def handle(self, *args, **options):
+        users = CustomUser.objects.all()
+        if options['emails']:
+            users = users.filter(email__in=options['emails'])
+            missing = set(options['emails']) - set(users.values_list('email', flat=True))
+            if missing:
+                raise CommandError(f"Пользователи не найдены: {', '.join(sorted(missing))}")
+        elif options['role']:
+            raise CommandError('Для --role нужно перечислить email пользователей')
+
+        with transaction.atomic():
+            if options['role']:
+                changed = users.exclude(role=options['role'])
+                changed_ids = list(changed.values_list('id', flat=True))
+                changed.update(role=options['role'])
+                transaction.on_commit(lambda: invalidate_cached_users(changed_ids))
+                self.stdout.write(f'Роль изменена у {len(changed_ids)} пользователей')
+            added, removed = sync_role_groups(users)
+
+        self.stdout.write(self.style.SUCCESS(f'Managers: добавлено {added}, удалено {removed}'))
@@ -0,0 +1,12 @@
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.utils.functional import SimpleLazyObject
+
+from .auth_cache import get_cached_user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """ AuthenticationMiddleware, который берёт request.user из кэша (см. users/auth_cache.py) """
+
+    def process_request(self, request):
+        super().process_request(request)  # проверки конфигурации и ленивый user
+        request.user = SimpleLazyObject(lambda: get_cached_user(request))
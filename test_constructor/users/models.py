@@ -1,5 +1,11 @@
-from django.db import models
-from django.contrib.auth.models import AbstractUser, BaseUserManager, Group
+from django.db import models, transaction
+from django.contrib.auth.models import AbstractUser, BaseUserManager
+
+from .auth_cache import invalidate_cached_user
+from .roles import managers_group_id
+
+# Роль ещё не читалась из БД (новый объект или загружен без поля role)
+UNKNOWN_ROLE = object()
 
 
 
@@ -42,6 +48,13 @@ class CustomUser(AbstractUser):
 
     objects = CustomUserManager()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Роль из БД: группы синхронизируются, только если она изменилась
+        instance._loaded_role = dict(zip(field_names, values)).get('role', UNKNOWN_ROLE)
+        return instance
+
     def save(self, *args, **kwargs):
 
         # 1. Логика пропуска (is_staff)
@@ -50,19 +63,32 @@ class CustomUser(AbstractUser):
         elif not self.is_superuser:
             self.is_staff = False
 
+        adding = self._state.adding
+        loaded_role = getattr(self, '_loaded_role', UNKNOWN_ROLE)
+        update_fields = kwargs.get('update_fields')
+        role_saved = update_fields is None or 'role' in update_fields
+
         super().save(*args, **kwargs)
 
+        # Закэшированная копия пользователя (request.user) устарела
+        user_id = self.pk
+        transaction.on_commit(lambda: invalidate_cached_user(user_id))
+
+        if not role_saved or self.role == loaded_role:
+            return  # например, обновление last_login при входе
+        self._loaded_role = self.role
+
         # 2. Логика прав (Группа)
+        group_id = managers_group_id()
+        if group_id is None:
+            return
         if self.role == 'admin':
-            try:
-                group = Group.objects.get(name='Managers')
-                self.groups.add(group)
-            except Group.DoesNotExist:
-                pass
-
-        elif not self.is_superuser:
-            try:
-                group = Group.objects.get(name='Managers')
-                self.groups.remove(group)
-            except Group.DoesNotExist:
-                pass
\ No newline at end of file
+            self.groups.add(group_id)
+        elif not self.is_superuser and not adding:
+            self.groups.remove(group_id)
+
+    def delete(self, *args, **kwargs):
+        user_id = self.pk
+        result = super().delete(*args, **kwargs)
+        transaction.on_commit(lambda: invalidate_cached_user(user_id))
+        return result
@@ -0,0 +1,67 @@
+"""
+Роли пользователей и группа Managers.
+
+Администраторы (role='admin') получают is_staff и членство в группе
+Managers, остальные (кроме суперпользователей) - теряют. Для одного
+пользователя это делает CustomUser.save при смене роли, для многих сразу -
+sync_role_groups (команда sync_roles) несколькими set-based запросами.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .auth_cache import invalidate_cached_users
+
+MANAGERS_GROUP = 'Managers'
+
+_managers_group_id = None
+
+
+def managers_group_id():
+    """ id группы Managers; ищется один раз на процесс (None, если группы нет) """
+    global _managers_group_id
+    if _managers_group_id is None:
+        _managers_group_id = Group.objects.filter(name=MANAGERS_GROUP).values_list('id', flat=True).first()
+    return _managers_group_id
+
+
+def _reset_managers_group_id(sender, instance, **kwargs):
+    global _managers_group_id
+    if instance.name == MANAGERS_GROUP or instance.pk == _managers_group_id:
+        _managers_group_id = None
+
+
+post_save.connect(_reset_managers_group_id, sender=Group, dispatch_uid='users_managers_group_saved')
+post_delete.connect(_reset_managers_group_id, sender=Group, dispatch_uid='users_managers_group_deleted')
+
+
+def sync_role_groups(users=None):
+    """
+    Привести is_staff и членство в Managers в соответствие с ролями.
+    users - QuerySet пользователей (по умолчанию все). Возвращает (добавлено в группу, удалено из группы).
+    """
+    User = get_user_model()
+    Membership = User.groups.through
+    if users is None:
+        users = User.objects.all()
+    admins = users.filter(role='admin')
+    regular = users.exclude(role='admin').filter(is_superuser=False)
+    group_id = managers_group_id()
+
+    with transaction.atomic():
+        changed_ids = set(admins.filter(is_staff=False).values_list('id', flat=True))
+        changed_ids |= set(regular.filter(is_staff=True).values_list('id', flat=True))
+        admins.filter(is_staff=False).update(is_staff=True)
+        regular.filter(is_staff=True).update(is_staff=False)
+
+        added = removed = 0
+        if group_id is not None:
+            missing = admins.exclude(groups=group_id).values_list('id', flat=True)
+            to_add = [Membership(customuser_id=user_id, group_id=group_id) for user_id in missing]
+            Membership.objects.bulk_create(to_add, ignore_conflicts=True, batch_size=1000)
+            added = len(to_add)
+            removed, _ = Membership.objects.filter(group_id=group_id, customuser__in=regular).delete()
+
+    transaction.on_commit(lambda: invalidate_cached_users(changed_ids))
+    return added, removed
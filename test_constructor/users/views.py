@@ -4,9 +4,12 @@ from django.contrib.auth import authenticate, login, logout, update_session_auth
 from django.views.decorators.csrf import csrf_exempt
 
 from .models import CustomUser
+from test_constructor import metrics
+from test_constructor.throttling import throttle
 
 
 @csrf_exempt
+@throttle('register')
 def register_api(request):
     if request.method == 'POST':
         try:
@@ -38,6 +41,7 @@ def register_api(request):
 
 
 @csrf_exempt
+@throttle('login')
 def login_api(request):
     if request.method == 'POST':
         data = json.loads(request.body)
@@ -48,6 +52,7 @@ def login_api(request):
 
         if user is not None:
             login(request, user)
+            metrics.LOGINS.inc(result='success')
             return JsonResponse({
                 'message': 'Вы вошли!',
                 'user': {
@@ -57,6 +62,7 @@ def login_api(request):
                 }
             })
         else:
+            metrics.LOGINS.inc(result='failure')
             return JsonResponse({'error': 'Неверный email или пароль'}, status=401)
 
     return JsonResponse({'error': 'Метод не поддерживается'}, status=405)